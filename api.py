@@ -0,0 +1,296 @@
+"""给前台收银机 / 预约系统用的 JSON 接口 (和页面共用 db / journal / search_index)
+
+    NAIL_AUTH_SECRET=... python api.py [--host 127.0.0.1] [--port 8502]
+
+    POST /api/login                     {"username", "password"} -> {"token", "shop_name"}
+    GET  /api/members?q=<姓名/手机/尾号>  -> {"members": [...]}   (按匹配度排序, 最多 20 个)
+    GET  /api/members/<id>              -> 会员 + 余额 + 折扣
+    GET  /api/members/<id>/transactions?limit=20&before_id=
+    POST /api/members/<id>/checkout     {"items": [[大类, 项目], ...], "note", "price"}
+    POST /api/members/<id>/recharge     {"amount", "discount"}
+
+除了 login 都要带 Authorization: Bearer <令牌>; 令牌就是 auth.make_token 签发的
+那种 (和免密登录 Cookie 一样), 本地验签不查库, 只能访问令牌所属店铺的会员。
+结账的规则和结账页一样: 项目必须在价目表里上架, price (原价) 不填就按标价合计,
+乘会员折扣后扣款, 余额不够返回 409。开了本地日志 (journal.py) 时写操作立即返回。
+
+一个进程用 ThreadingHTTPServer, 每个连接一个线程 (支持 keep-alive);
+搜索走会员内存索引 (按库里的变更号发现页面那边新建 / 修改的会员), 余额和流水每次直接查库:
+查询缓存只在本进程内失效, 页面上的结账 / 充值不会通知这里。
+"""
+import argparse
+import json
+import logging
+import math
+import re
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import auth
+import catalog
+import db
+import journal
+import ratelimit
+import search_index
+
+log = logging.getLogger("nail_salon.api")
+
+MAX_BODY = 64 * 1024
+MAX_PAGE = 200
+# 登录要算 pbkdf2, 按客户端限流, 顺便挡住撞密码
+login_limiter = ratelimit.TokenBucket(rate=0.2, burst=5)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- 1. 参数整理 ---
+def _number(body, key, default=None, low=0.0, high=None):
+    value = body.get(key, default)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{key} 必须是数字")
+    if not math.isfinite(value) or value < low or (high is not None and value > high):
+        raise ApiError(400, f"{key} 超出范围")
+    return value
+
+
+def _int(query, key, default):
+    try:
+        return int(query.get(key, [default])[0])
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{key} 必须是整数")
+
+
+def _records(df, columns):
+    """DataFrame -> JSON 能直接序列化的 [dict]"""
+    df = df[columns].astype(object)
+    return df.where(df.notna(), None).to_dict("records")
+
+
+def _json_default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (datetime, date, pd.Timestamp)):
+        return o.isoformat()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"{type(o).__name__} 不能转成 JSON")
+
+
+def _member(owner, member_id):
+    """本店的会员 (余额已叠加未同步的部分), 不是本店的当作不存在"""
+    df = db.members_by_ids(owner, [member_id], ttl=0)
+    if df.empty:
+        raise ApiError(404, "会员不存在")
+    row = df.iloc[0]
+    return {"id": int(row["id"]), "name": row["name"], "phone": row["phone"],
+            "balance": float(row["balance"]), "current_discount": float(row["current_discount"])}
+
+
+def _order(owner, body):
+    """请求里的项目 -> (detail 字符串, [(大类, 项目, 标价)], 原价); 和结账页拼法一样"""
+    menu = catalog.get(owner)
+    picked = {}
+    for entry in body.get("items") or []:
+        if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+            raise ApiError(400, "items 的每一项是 [大类, 项目]")
+        cat, item = (str(x).strip() for x in entry)
+        if item not in menu.items.get(cat, {}):
+            raise ApiError(400, f"价目表里没有: {cat}/{item}")
+        picked.setdefault(cat, []).append(item)
+    parts = [f"{cat}({','.join(subs)})" for cat, subs in picked.items()]
+    line_items_selected = [(cat, sub, menu.items[cat][sub]) for cat, subs in picked.items() for sub in subs]
+    note = str(body.get("note") or "").strip()
+    if note:
+        parts.append(f"备注[{note}]")
+    if not parts:
+        raise ApiError(400, "请至少选择一项")
+    list_total = sum(p for _, _, p in line_items_selected if p is not None)
+    return " + ".join(parts), line_items_selected, _number(body, "price", list_total)
+
+
+# --- 2. 各接口: (owner, 会员 id, 查询参数, 请求体) -> (状态码, 返回内容) ---
+def search_members(owner, _mid, query, _body):
+    term = query.get("q", [""])[0].strip()
+    df = db.members_by_ids(owner, search_index.search(owner, term), ttl=0)
+    return 200, {"members": _records(df, ["id", "name", "phone", "balance", "current_discount"])}
+
+
+def get_member(owner, mid, _query, _body):
+    return 200, _member(owner, mid)
+
+
+def member_transactions(owner, mid, query, _body):
+    _member(owner, mid)
+    limit = min(max(_int(query, "limit", 20), 1), MAX_PAGE)
+    before_id = _int(query, "before_id", None) if "before_id" in query else None
+    df, has_more = db.ledger_page(owner, [mid], before_id=before_id, page_size=limit, ttl=0)
+    return 200, {"transactions": _records(df, ["id", "date", "type", "amount", "detail"]), "has_more": has_more}
+
+
+def checkout(owner, mid, _query, body):
+    member = _member(owner, mid)
+    detail, items, price = _order(owner, body)
+    amount = round(price * member["current_discount"], 2)
+    if member["balance"] < amount:
+        raise ApiError(409, "余额不足")
+    try:
+        result = journal.checkout(owner, mid, amount, detail, None, items)
+    except db.InsufficientBalance:
+        raise ApiError(409, "余额不足 (可能刚在其他设备上消费过)")
+    return 200, _write_result(result, amount=amount, detail=detail)
+
+
+def recharge(owner, mid, _query, body):
+    member = _member(owner, mid)
+    amount = _number(body, "amount")
+    if amount <= 0:
+        raise ApiError(400, "amount 必须大于 0")
+    discount = _number(body, "discount", member["current_discount"], high=1.0)
+    if discount <= 0:
+        raise ApiError(400, "discount 必须大于 0")
+    result = journal.recharge(owner, mid, amount, discount)
+    return 200, _write_result(result, amount=amount, discount=discount)
+
+
+def _write_result(result, **extra):
+    """直接写库时返回新余额; 开了本地日志时返回日志里的幂等键, 余额等补写后再查"""
+    if isinstance(result, str):
+        return {"queued": result, **extra}
+    return {"balance": result, **extra}
+
+
+ROUTES = [
+    ("GET", re.compile(r"^/api/members$"), search_members),
+    ("GET", re.compile(r"^/api/members/(\d+)$"), get_member),
+    ("GET", re.compile(r"^/api/members/(\d+)/transactions$"), member_transactions),
+    ("POST", re.compile(r"^/api/members/(\d+)/checkout$"), checkout),
+    ("POST", re.compile(r"^/api/members/(\d+)/recharge$"), recharge),
+]
+
+
+def login(client, body):
+    ok, wait = login_limiter.allow(client)
+    if not ok:
+        raise ApiError(429, f"尝试太频繁, 请 {wait:.0f} 秒后再试")
+    username = str(body.get("username") or "")
+    shop_name = auth.authenticate(username, str(body.get("password") or ""))
+    if shop_name is None:
+        raise ApiError(401, "账号或密码错误")
+    token = auth.make_token(username, shop_name)
+    if token is None:
+        raise ApiError(503, "服务器没有配置 NAIL_AUTH_SECRET, 不能发放令牌")
+    return 200, {"token": token, "shop_name": shop_name}
+
+
+# --- 3. HTTP ---
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"      # keep-alive, 收银机一条连接连续发请求
+    server_version = "nail-salon-api"
+    disable_nagle_algorithm = True     # 响应头和响应体分两次写, 不关 Nagle 每个请求要多等 40 ms 的延迟确认
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        try:
+            status, payload = self._dispatch(method)
+        except ApiError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception:
+            log.exception("%s %s 出错", method, self.path)
+            status, payload = 500, {"error": "服务器内部错误"}
+        out = json.dumps(payload, ensure_ascii=False, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        body = self._body() if method == "POST" else {}
+        if method == "POST" and url.path == "/api/login":
+            client = ratelimit.forwarded_client(self.headers.get("X-Forwarded-For"), self.client_address[0])
+            return login(client, body)
+
+        owner = self._owner()
+        for route_method, pattern, fn in ROUTES:
+            m = pattern.match(url.path)
+            if m:
+                if route_method != method:
+                    continue
+                mid = int(m.group(1)) if m.groups() else None
+                return fn(owner, mid, parse_qs(url.query), body)
+        raise ApiError(404, "没有这个接口")
+
+    def _owner(self):
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Bearer "):
+            raise ApiError(401, "缺少令牌")
+        verified = auth.verify_token(header[len("Bearer "):].strip())
+        if verified is None:
+            raise ApiError(401, "令牌无效或已过期")
+        return verified[0]
+
+    def _body(self):
+        # 请求体没读走就报错时连接上还留着它, 不能再接着当下一个请求读, 直接断开
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            raise ApiError(400, "Content-Length 不对")
+        if length > MAX_BODY:
+            self.close_connection = True
+            raise ApiError(413, "请求太大")
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise ApiError(400, "请求体不是合法的 JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "请求体必须是 JSON 对象")
+        return body
+
+    def log_message(self, fmt, *args):
+        log.debug("%s - %s", self.address_string(), fmt % args)
+
+
+def make_server(host="127.0.0.1", port=8502):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会员查询 / 结账 JSON 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if auth.get_secret() is None:
+        sys.exit("❌ 没有配置 NAIL_AUTH_SECRET (或 secrets.toml 的 [auth] secret), 不能验证令牌")
+    if journal.enabled():
+        journal.start()
+    server = make_server(args.host, args.port)
+    print(f"✅ 接口已启动: http://{args.host}:{args.port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
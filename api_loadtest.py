@@ -0,0 +1,163 @@
+"""api.py 的压测 (本地库 + seed.py 合成数据)
+
+    export DATABASE_URL=postgresql+psycopg2://localhost/nail_bench
+    python seed.py --shops 3 --members 2000 --transactions 50000 --reset
+    python api_loadtest.py                           # 另起一个 api.py 进程, 16 个线程压 10 秒
+    python api_loadtest.py --threads 32 --duration 30 --write-ratio 0.2
+    python api_loadtest.py --url http://127.0.0.1:8502   # 压已经在跑的 api.py (密钥要一致)
+
+每个线程一条 keep-alive 连接, 按比例混合 搜索 / 查余额 / 最近流水 / 充值+结账
+(写操作每次先充 20 再按原价 20 结账, 余额基本不变); 会员从 bench_shop_* 里随机抽。
+结束后打印每个接口的 请求数 / 出错数 / p50 / p95 / p99 和总的每秒请求数。
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from sqlalchemy import text
+
+import catalog
+import db
+import seed
+
+
+def _sample(shop, n=500):
+    with db.get_engine().connect() as c:
+        rows = c.execute(text("""
+            SELECT m.id, m.phone FROM members m JOIN accounts a ON a.member_id = m.id
+            WHERE m.owner_username = :o AND a.balance >= 100
+            ORDER BY random() LIMIT :n
+        """), {"o": shop, "n": n}).all()
+    if not rows:
+        sys.exit(f"❌ {shop} 没有会员, 先运行 python seed.py")
+    return rows
+
+
+class Client:
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def call(self, method, path, body=None):
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                          headers=self.headers)
+        resp = self.conn.getresponse()
+        return resp.status, json.loads(resp.read())
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit("❌ 接口进程没有启动")
+
+
+def _worker(url, token, members, item, write_ratio, deadline, seed_value, out):
+    rng = random.Random(seed_value)
+    client = Client(url, token)
+    while time.perf_counter() < deadline:
+        mid, phone = rng.choice(members)
+        r = rng.random()
+        if r < write_ratio:
+            calls = [("充值", "POST", f"/api/members/{mid}/recharge", {"amount": 20}),
+                     ("结账", "POST", f"/api/members/{mid}/checkout", {"items": [item], "price": 20})]
+        elif r < write_ratio + (1 - write_ratio) * 0.4:
+            calls = [("搜索", "GET", f"/api/members?q={phone[-4:]}", None)]
+        elif r < write_ratio + (1 - write_ratio) * 0.7:
+            calls = [("查余额", "GET", f"/api/members/{mid}", None)]
+        else:
+            calls = [("最近流水", "GET", f"/api/members/{mid}/transactions?limit=20", None)]
+        for name, method, path, body in calls:
+            t0 = time.perf_counter()
+            try:
+                status, _ = client.call(method, path, body)
+            except (OSError, http.client.HTTPException, ValueError):
+                status = 0
+                client = Client(url, token)
+            out.append((name, (time.perf_counter() - t0) * 1000, status))
+
+
+def run(url=None, shop="bench_shop_0", password="bench", threads=16, duration=10.0,
+        write_ratio=0.1, seed_value=7):
+    seed.check_local()
+    server = None
+    if url is None:
+        # 接口单独一个进程, 不和压测线程抢 GIL
+        os.environ.setdefault("NAIL_AUTH_SECRET", secrets.token_hex(16))
+        port = _free_port()
+        server = subprocess.Popen([sys.executable, "api.py", "--port", str(port)],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        _wait_ready(port)
+
+    status, resp = Client(url).call("POST", "/api/login", {"username": shop, "password": password})
+    if status != 200:
+        sys.exit(f"❌ 登录失败 ({status}): {resp.get('error')}")
+    members = _sample(shop)
+    menu = catalog.get(shop)
+    item = next([cat, sub] for cat, subs in menu.items.items() for sub in subs)
+
+    # 预热: 会员索引 / 价目表 / 连接池
+    Client(url, resp["token"]).call("GET", f"/api/members?q={members[0].phone[-4:]}")
+
+    out = []
+    deadline = time.perf_counter() + duration
+    workers = [threading.Thread(target=_worker, args=(url, resp["token"], members, item, write_ratio,
+                                                      deadline, seed_value + i, out))
+               for i in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - t0
+    if server is not None:
+        server.terminate()
+        server.wait()
+
+    print(f"{'接口':<10} {'请求数':>8} {'出错':>6} {'p50':>8} {'p95':>8} {'p99':>8} ms")
+    for name in ("搜索", "查余额", "最近流水", "充值", "结账"):
+        rows = [(ms, st) for n, ms, st in out if n == name]
+        if not rows:
+            continue
+        lat = np.array([ms for ms, _ in rows])
+        errors = sum(1 for _, st in rows if st != 200)
+        print(f"{name:<10} {len(rows):>8} {errors:>6} {np.percentile(lat, 50):>8.2f} "
+              f"{np.percentile(lat, 95):>8.2f} {np.percentile(lat, 99):>8.2f}")
+    print(f"共 {len(out)} 个请求, {threads} 个线程, {wall:.1f} 秒, {len(out) / wall:.0f} 请求/秒")
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="压已经在跑的接口; 不填就另起一个 api.py 进程")
+    ap.add_argument("--shop", default="bench_shop_0")
+    ap.add_argument("--password", default="bench")
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0, help="秒")
+    ap.add_argument("--write-ratio", type=float, default=0.1, help="充值+结账 占的比例")
+    a = ap.parse_args()
+    run(a.url, a.shop, a.password, a.threads, a.duration, a.write_ratio)
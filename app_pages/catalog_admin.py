@@ -0,0 +1,29 @@
+"""项目管理 (价目表)"""
+import streamlit as st
+
+import catalog
+import ui
+
+CURRENT_USER = ui.current_user()
+
+st.header("🏷️ 服务项目与价格")
+st.caption("结账时按这里的标价自动合计原价。删掉或取消勾选「上架」的项目不再出现在结账页，历史账目不受影响。")
+
+menu_catalog = catalog.get(CURRENT_USER)
+# key 跟着价目表版本走, 保存后编辑框从新数据重新开始
+edited = st.data_editor(menu_catalog.df[catalog.COLUMNS], num_rows="dynamic", hide_index=True, use_container_width=True,
+                        key=f"catalog_editor_{menu_catalog.loaded_at}",
+                        column_config={
+                            "icon": st.column_config.TextColumn("图标", width="small"),
+                            "category": st.column_config.TextColumn("大类", required=True),
+                            "item": st.column_config.TextColumn("项目", required=True),
+                            "price": st.column_config.NumberColumn("标价 (¥)", min_value=0, step=1, format="%.2f"),
+                            "active": st.column_config.CheckboxColumn("上架", default=True),
+                        })
+if st.button("💾 保存价目表", type="primary"):
+    try:
+        catalog.save(CURRENT_USER, edited)
+        st.toast("价目表已保存", icon="✅")
+        st.rerun()
+    except ValueError as e:
+        st.error(f"保存失败: {e}")
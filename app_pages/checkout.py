@@ -0,0 +1,119 @@
+"""消费结账 (实时计算 + 模糊搜索)
+
+选项目 / 改价格 和 签字付款 各是一个 fragment, 操作时只重跑自己那一段;
+会员在搜索词不变时一直用 session_state 里的, 编辑订单期间不查库。
+"""
+import streamlit as st
+from streamlit_drawable_canvas import st_canvas
+
+import catalog
+import db
+import journal
+import signatures
+import ui
+
+CURRENT_USER = ui.current_user()
+
+
+@st.fragment
+def order_section(m_disc):
+    """选项目 + 实时算价; 结果放在 session_state.spend_order 给付款区用"""
+    # --- 1. 选择项目 (价目表在内存里, 不查库) ---
+    menu_catalog = catalog.get(CURRENT_USER)
+
+    st.subheader("1. 选择项目")
+    selected_categories = st.multiselect("服务大类", options=menu_catalog.categories(),
+                                         format_func=menu_catalog.label)
+    final_item_list = []
+    line_items_selected = []       # [(大类, 项目, 标价)], 结账时写进 transaction_items
+    if selected_categories:
+        st.write("👇 **勾选细项:**")
+        for cat in selected_categories:
+            prices = menu_catalog.items[cat]
+            selected_subs = st.multiselect(f"{menu_catalog.label(cat)} - 内容", options=list(prices),
+                                           format_func=lambda s, p=prices: s if p[s] is None else f"{s} ¥{p[s]:g}")
+            if selected_subs:
+                final_item_list.append(f"{cat}({','.join(selected_subs)})")
+                line_items_selected += [(cat, sub, prices[sub]) for sub in selected_subs]
+
+    other_note = st.text_input("补充说明")
+    if other_note: final_item_list.append(f"备注[{other_note}]")
+
+    final_detail_string = " + ".join(final_item_list)
+    if final_detail_string: st.info(f"🛒 已选: {final_detail_string}")
+    st.write("---")
+
+    # --- 2. 金额确认 (重点修改区域) ---
+    st.subheader("2. 确认金额")
+
+    # 原价默认是所选项目的标价合计, 可以改
+    list_total = sum(p for _, _, p in line_items_selected if p is not None)
+    price = st.number_input("订单原价 (按标价自动合计, 可修改)", min_value=0.0, value=float(list_total), step=10.0)
+    final_price = price * m_disc
+
+    # 实时显示大红字价格
+    st.markdown(f"### 应扣款: <span style='color:red'>¥{final_price:.2f}</span>", unsafe_allow_html=True)
+
+    st.session_state.spend_order = {
+        "detail": final_detail_string, "items": line_items_selected, "price": final_price,
+    }
+
+
+@st.fragment
+def pay_section(m_id, m_bal):
+    """签字提交 (放进 form 防止误触); 订单内容取 order_section 最近一次的结果"""
+    with st.form("pay_form"):
+        st.write("请顾客签字 👇")
+        # 只取笔画 (json_data), 不让画布每次都回传整张 PNG
+        canvas_result = st_canvas(fill_color="rgba(255, 165, 0, 0.3)", stroke_width=signatures.STROKE_WIDTH,
+                                  background_color="#EEE", width=signatures.CANVAS_WIDTH,
+                                  height=signatures.CANVAS_HEIGHT, key="canvas_spend")
+
+        submit = st.form_submit_button("✅ 确认扣款", type="primary")
+
+        if submit:
+            order = st.session_state.get("spend_order") or {}
+            final_price = order.get("price", 0.0)
+            if not order.get("detail"):
+                st.warning("❌ 请至少选择一项")
+                return
+
+            if m_bal >= final_price:
+                sig = signatures.process_signature(canvas_result.json_data)
+
+                try:
+                    journal.checkout(CURRENT_USER, m_id, final_price, order["detail"], sig, order["items"])
+                except db.InsufficientBalance:
+                    ui.forget_member("spend_pick")
+                    st.error("余额不足 (可能刚在其他设备上消费过，请刷新)")
+                    return
+                # 余额变了, 下次整页重跑时重新查会员
+                ui.forget_member("spend_pick")
+                st.balloons()
+                st.toast(f"交易成功！(耗时 {db.last_timing('checkout'):.0f} ms)", icon="✅")
+                st.rerun()
+            else:
+                st.error("余额不足")
+
+
+search_term = st.text_input("搜索会员 (姓名 / 手机全号 / 尾号4位)").strip()
+
+if search_term:
+    # 同样的搜索逻辑 (内存索引), 搜索词不变就用上次查到的会员
+    row = ui.pick_member(search_term, "spend_pick", hold=True)
+
+    if row is not None:
+        m_id, m_name, m_bal, m_disc = int(row['id']), row['name'], float(row['balance']), float(row['current_discount'])
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("会员", m_name)
+        col2.metric("余额", f"¥{m_bal}")
+        col3.metric("权益", f"{int(m_disc*100)}折" if m_disc < 1 else "原价")
+        st.divider()
+
+        order_section(m_disc)
+
+        # --- 3. 签字提交 ---
+        pay_section(m_id, m_bal)
+    else:
+        st.warning("未找到会员 (请尝试全号、尾号或姓名)")
@@ -0,0 +1,54 @@
+"""顾客自助查询 (不用登录)"""
+import streamlit as st
+
+import db
+import ratelimit
+import ui
+import views
+
+st.title("👤 会员自助查询")
+st.info("输入您的 姓名 和 手机号，即可查询余额及消费记录。")
+
+with st.form("customer_check_form"):
+    c1, c2 = st.columns(2)
+    cust_name = c1.text_input("您的姓名").strip()
+    cust_phone = c2.text_input("您的手机号").strip()
+    submit = st.form_submit_button("🔍 立即查询")
+
+    if submit:
+        if not cust_name or not cust_phone:
+            st.error("请填写完整信息")
+        else:
+            ok, wait = ratelimit.allow_customer()
+            if not ok:
+                st.warning(f"查询太频繁了，请 {int(wait) + 1} 秒后再试。")
+                ui.show_diagnostics()
+                st.stop()
+            try:
+                df = db.customer_lookup(cust_name, cust_phone)
+            except db.Busy:
+                st.warning("查询人数较多，请稍后再试。")
+                ui.show_diagnostics()
+                st.stop()
+
+            if df.empty:
+                st.warning("未查询到会员信息，请检查姓名和手机号是否与登记的一致。")
+            else:
+                for row, trans_df in views.customer_cards(df):
+                    shop_name = row['shop_name']
+                    bal = row['balance']
+                    disc = row['current_discount']
+
+                    st.success(f"🏠 **{shop_name}** 的会员")
+                    col1, col2 = st.columns(2)
+                    col1.metric("当前余额", f"¥{bal}")
+                    col2.metric("享受折扣", f"{int(disc*100)}折" if disc < 1 else "无折扣")
+
+                    st.write("**📝 最近交易记录:**")
+
+                    if not trans_df.empty:
+                        st.dataframe(views.recent_table(trans_df), hide_index=True, use_container_width=True)
+                        st.caption("✅ 表示这笔记录已通过防篡改校验，写入后没有被改动过")
+                    else:
+                        st.caption("暂无交易记录")
+                    st.divider()
@@ -0,0 +1,158 @@
+"""账目查询 (经营趋势 + 明细翻页)"""
+import os
+from datetime import datetime, timedelta
+
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+import bulk
+import db
+import instrument
+import line_items
+import rollup
+import search_index
+import ui
+import views
+from signatures import load_signature
+
+CURRENT_USER = ui.current_user()
+
+st.header("📊 经营数据分析")
+
+# --- 1. 顶部图表：经营趋势 (读每日汇总表) ---
+st.subheader("📈 经营趋势")
+
+trend_range = st.radio("范围", list(views.TREND_RANGES), horizontal=True, label_visibility="collapsed")
+days, freq, label_fmt = views.TREND_RANGES[trend_range]
+chart_df = rollup.daily_totals(CURRENT_USER, days)
+
+if not chart_df.empty:
+    chart_df_pivot = views.trend_frame(chart_df, days, freq, label_fmt)
+
+    # 3. 画图
+    with instrument.span("altair_chart"):
+        chart = alt.Chart(chart_df_pivot).mark_bar().encode(
+            # X轴：改用 day_str (字符串)，并且类型设为 :O (Ordinal/有序分类)
+            x=alt.X('day_str:O', axis=alt.Axis(title='日期', labelAngle=0)), 
+
+            # Y轴：金额 (stack=None 必须保留)
+            y=alt.Y('total:Q', axis=alt.Axis(title='金额 (¥)'), stack=None),
+
+            # 颜色
+            color=alt.Color('type_cn:N', 
+                            scale=alt.Scale(domain=['消费扣款', '充值收入'], range=['#FF4B4B', '#00C805']),
+                            legend=alt.Legend(title="类型", orient="top-left")),
+
+            # 偏移：现在因为X轴是分类，这个偏移就能完美生效了
+            xOffset=alt.X('type_cn:N', sort=['消费扣款', '充值收入']),
+
+            # 提示框
+            tooltip=[
+                alt.Tooltip('day_str:N', title='日期'),
+                alt.Tooltip('type_cn:N', title='类型'),
+                alt.Tooltip('total:Q', title='金额')
+            ]
+        ).properties(
+            height=300
+        ).configure_axis(
+            labelFontSize=12,
+            titleFontSize=14
+        )
+        st.altair_chart(chart, use_container_width=True)
+
+else:
+    st.caption(f"{trend_range}暂无数据")
+
+st.divider()
+
+# --- 2. 详细查询 (保持不变，记得不要把这下面的代码删了) ---
+st.subheader("🔍 详细账目查询")
+
+col1, col2 = st.columns([1, 2])
+with col1:
+    search_term = st.text_input("👤 搜索会员 (姓名/全号/尾号)").strip()
+with col2:
+    today = datetime.now()
+    first_day = today.replace(day=1)
+    date_range = st.date_input("📅 选择日期范围", value=(first_day, today))
+
+# 过滤条件
+member_ids = search_index.search(CURRENT_USER, search_term) if search_term else None
+start_date = end_date = None
+if isinstance(date_range, tuple):
+    if len(date_range) > 0:
+        start_date = date_range[0]
+    if len(date_range) > 1:
+        end_date = date_range[1] + timedelta(days=1)
+
+# 翻页游标: 每一页的起点 (上一页最后一笔的 id), 条件变了就回到第一页
+page_size = st.selectbox("每页笔数", [20, 50, 100], index=1)
+filter_key = (search_term, start_date, end_date, page_size)
+if st.session_state.get("ledger_filter") != filter_key:
+    st.session_state.ledger_filter = filter_key
+    st.session_state.ledger_cursors = [None]
+cursors = st.session_state.ledger_cursors
+
+# 导出 CSV: 分批写临时文件, 不把整个范围读进内存
+with st.expander("📤 导出该日期范围的账目 (CSV)"):
+    if st.button("生成导出文件"):
+        old_export = st.session_state.get("ledger_export")
+        if old_export and os.path.exists(old_export[1]):
+            os.remove(old_export[1])
+        path, n = bulk.export_ledger_file(CURRENT_USER, start_date, end_date)
+        st.session_state.ledger_export = (filter_key, path, n)
+    export = st.session_state.get("ledger_export")
+    # 文件放久了会被 bulk 清掉, 那就重新生成
+    if export and export[0] == filter_key and os.path.exists(export[1]):
+        _, path, n = export
+        with open(path, "rb") as f:
+            st.download_button(f"⬇️ 下载 ({n} 笔)", f, file_name="账目导出.csv",
+                               mime="text/csv")
+
+# 服务项目排行 (整家店, 按 transaction_items 聚合); 和签名一样打开开关才查, 翻页时不跟着算
+with st.expander("🏷️ 服务项目排行"):
+    if st.toggle("统计该日期范围", key="item_report"):
+        items_df = line_items.item_report(CURRENT_USER, start_date, end_date)
+        if items_df.empty:
+            st.caption("该日期范围内没有消费明细")
+        else:
+            share = st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1)
+            st.dataframe(views.item_table(items_df), hide_index=True, use_container_width=True,
+                         column_config={"占比": share})
+
+# 统计栏 (整个范围, 数据库里算)
+total_cnt, total_recharge, total_spend = db.ledger_totals(CURRENT_USER, member_ids, start_date, end_date)
+df, has_more = db.ledger_page(CURRENT_USER, member_ids, start_date, end_date,
+                              before_id=cursors[-1], page_size=page_size)
+
+if total_cnt:
+    m1, m2, m3 = st.columns(3)
+    m1.metric("笔数", f"{total_cnt} 笔")
+    m2.metric("充值合计", f"¥{total_recharge:,.2f}")
+    m3.metric("消费合计", f"¥{total_spend:,.2f}")
+
+    st.write("---")
+    for i, row in df.iterrows():
+        try:
+            fmt_date = pd.to_datetime(row['date']).strftime('%Y-%m-%d %H:%M:%S')
+        except: fmt_date = row['date']
+
+        icon = views.TYPE_ICON.get(row['type'], "💅")
+        with st.expander(f"{icon} {fmt_date} | {row['name']} | ¥{row['amount']}"):
+            st.write(f"**详情:** {row['detail']}")
+            # 签名按需加载: 勾选后才去取缩略图
+            if row['signature_hash'] and st.toggle("查看签名", key=f"sig_{row['id']}"):
+                st.image(load_signature(row['signature_hash']), width=200)
+
+    # 翻页
+    p1, p2, p3 = st.columns([1, 2, 1])
+    if p1.button("⬅️ 上一页", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    p2.caption(f"第 {len(cursors)} 页 / 共 {-(-total_cnt // page_size)} 页")
+    if p3.button("下一页 ➡️", disabled=not has_more):
+        cursors.append(int(df['id'].iloc[-1]))
+        st.rerun()
+else:
+    st.info("暂无数据")
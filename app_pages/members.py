@@ -0,0 +1,148 @@
+"""会员管理 (全能编辑版)"""
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import bulk
+import db
+import journal
+import member_stats
+import search_index
+import ui
+import views
+
+CURRENT_USER = ui.current_user()
+
+st.header("🔍 会员档案管理")
+
+# 0. 批量导入 (从纸质登记或别的系统迁移过来时用)
+with st.expander("📥 批量导入会员 (CSV / Excel)"):
+    st.caption("表头: 姓名, 手机号, 余额, 折扣, 生日, 备注 (只有姓名和手机号必填; 折扣写 0.88 或 8.8)")
+    upload = st.file_uploader("选择文件", type=["csv", "xlsx", "xls"], key="bulk_upload")
+    if upload is not None:
+        try:
+            clean, report = bulk.validate(bulk.read_table(upload, upload.name), CURRENT_USER)
+        except (ValueError, ImportError) as e:
+            st.error(f"文件读取失败: {e}")
+        else:
+            st.write(f"可导入 **{len(clean)}** 人, 问题行 **{len(report)}** 行")
+            if not report.empty:
+                st.dataframe(report, hide_index=True, use_container_width=True)
+            if len(clean) and st.button(f"✅ 导入 {len(clean)} 位会员", type="primary"):
+                try:
+                    n = bulk.import_members(CURRENT_USER, clean)
+                    st.success(f"已导入 {n} 位会员")
+                except Exception as e:
+                    st.error(f"导入失败 (已全部回滚): {e}")
+
+# 1. 搜索框
+search_term = st.text_input("搜索会员 (支持姓名/全号/尾号)", placeholder="留空则浏览会员名录").strip()
+
+# 2. 没有搜索 -> 会员名录 (筛选 / 排序 / 翻页都在数据库里做, 每次只取一页)
+if not search_term:
+    f1, f2, f3 = st.columns(3)
+    sort = f1.selectbox("排序", list(member_stats.SORTS))
+    inactive_days = f2.number_input("多少天没来 (0 = 不限)", min_value=0, value=0, step=30)
+    min_balance = f3.number_input("余额高于 (¥, 0 = 不限)", min_value=0.0, value=0.0, step=100.0)
+    page_size = 50
+
+    # 条件变了就回到第一页
+    filter_key = (sort, inactive_days, min_balance)
+    if st.session_state.get("directory_filter") != filter_key:
+        st.session_state.directory_filter = filter_key
+        st.session_state.directory_page = 0
+    page = st.session_state.directory_page
+
+    df, total = member_stats.directory(CURRENT_USER, inactive_days or None, min_balance or None,
+                                       sort, page, page_size)
+    if not total:
+        st.info("暂无数据")
+    else:
+        st.write(f"共 **{total}** 位会员")
+        if journal.enabled() and journal.status()["pending"]:
+            st.caption("⏳ 本机还有没同步的结账 / 充值, 名录里的余额是同步前的 (按名字搜索能看到最新余额)")
+        money = st.column_config.NumberColumn(format="¥%.2f")
+        st.dataframe(views.directory_table(df), use_container_width=True, hide_index=True,
+                     column_config={"余额": money, "累计消费": money, "累计充值": money})
+
+        p1, p2, p3 = st.columns([1, 2, 1])
+        if p1.button("⬅️ 上一页", disabled=page == 0):
+            st.session_state.directory_page -= 1
+            st.rerun()
+        p2.caption(f"第 {page + 1} 页 / 共 {-(-total // page_size)} 页")
+        if p3.button("下一页 ➡️", disabled=(page + 1) * page_size >= total):
+            st.session_state.directory_page += 1
+            st.rerun()
+        st.caption("💡 提示：输入 **姓名** 或 **手机号** 锁定一人后，即可修改全部资料。")
+    st.stop()
+
+# 3. 搜索 (走内存索引, 数据库只按 id 取)
+df = db.member_list(CURRENT_USER, search_index.search(CURRENT_USER, search_term))
+
+# 4. 界面逻辑
+if df.empty:
+    st.info("暂无数据")
+else:
+    # --- 情况 A: 刚好锁定 1 个人 -> 进入【全能编辑模式】 ---
+    if len(df) == 1:
+        row = df.iloc[0]
+        m_id = int(row['id'])
+
+        st.success(f"正在编辑: **{row['name']}**")
+
+        with st.form("edit_full_profile"):
+            st.caption("👇 您可以在下方直接修改任何信息")
+
+            # 第一行：基本资料
+            c1, c2 = st.columns(2)
+            new_name = c1.text_input("姓名", value=row['name'])
+            new_phone = c2.text_input("手机号", value=row['phone'])
+
+            # 第二行：生日与余额
+            c3, c4 = st.columns(2)
+            # 处理生日格式，防止空值报错
+            try:
+                default_birth = pd.to_datetime(row['birthday']).date()
+            except:
+                default_birth = datetime(2000, 1, 1)
+            new_birth = c3.date_input("生日", value=default_birth, min_value=datetime(1900, 1, 1))
+
+            # 余额修改 (特别标注)
+            current_bal = float(row['balance']) if row['balance'] is not None else 0.0
+            new_balance = c4.number_input("账户余额 (¥)", value=current_bal, step=10.0, help="可以直接修改余额进行平账")
+
+            # 第三行：备注
+            new_note = st.text_area("备注", value=row['note'] if row['note'] else "", height=100)
+
+            # 保存按钮
+            if st.form_submit_button("💾 保存所有修改", type="primary"):
+                try:
+                    # 基本信息 + 余额一起保存 (注意：带 owner 限制，防止误改)
+                    db.update_member(CURRENT_USER, m_id, new_name, new_phone,
+                                     new_birth, new_note, new_balance, current_bal)
+                    search_index.upsert_member(CURRENT_USER, m_id, new_name, new_phone)
+
+                    st.success("✅ 档案已更新！")
+                    time.sleep(1)
+                    st.rerun()
+
+                except db.StaleBalance:
+                    st.error("保存失败：余额刚被其他设备修改过，请返回列表重新打开后再改。")
+                except Exception as e:
+                    # 捕捉手机号重复的错误
+                    if "UniqueViolation" in str(e) or "unique constraint" in str(e):
+                        st.error(f"保存失败：手机号 {new_phone} 已存在，请检查！")
+                    else:
+                        st.error(f"保存失败: {e}")
+
+        # 返回按钮
+        if st.button("🔙 返回列表"):
+             st.rerun()
+
+    # --- 情况 B: 多人 -> 显示表格 ---
+    else:
+        st.write(f"共找到 **{len(df)}** 位会员")
+        st.dataframe(views.member_table(df), use_container_width=True, hide_index=True)
+        st.caption("💡 提示：输入 **姓名** 或 **手机号** 锁定一人后，即可修改全部资料。")
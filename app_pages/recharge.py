@@ -0,0 +1,89 @@
+"""会员充值 / 新建会员 (合并版)"""
+import time
+from datetime import datetime
+
+import streamlit as st
+
+import db
+import journal
+import search_index
+import ui
+
+CURRENT_USER = ui.current_user()
+
+st.header("💰 会员充值 ")
+
+# 1. 统一搜索入口
+search_term = st.text_input("🔍 输入手机号/姓名/尾号 (回车确认)", placeholder="老客直接搜，新客输入手机号自动新建").strip()
+
+if search_term:
+    # --- 搜索逻辑 (内存索引) ---
+    row = ui.pick_member(search_term, "recharge_pick")
+
+    # === 分支 A: 找到了 -> 显示充值界面 ===
+    if row is not None:
+        m_id, m_name, m_bal, m_disc = int(row['id']), row['name'], float(row['balance']), float(row['current_discount'])
+        m_phone = row['phone']
+
+        st.success(f"✅ 找到会员: **{m_name}** ({m_phone})")
+        st.info(f"当前余额: **¥{m_bal}** | 当前折扣: **{int(m_disc*100) if m_disc<1 else '无'}**")
+
+        st.divider()
+        st.subheader("💸 会员充值")
+
+        with st.form("recharge_form"):
+            amount = st.number_input("充值金额", step=100.0)
+
+            st.write("**折扣设置:**")
+            option_list = [1.0, 0.95, 0.9, 0.88, 0.8, 0.7, 0.6, "自定义"]
+            selected_option = st.selectbox("选择折扣", option_list, 
+                                        format_func=lambda x: x if x == "自定义" else ("原价" if x==1.0 else f"{int(x*100) if x*100%10!=0 else int(x*10)}折"),
+                                        index=option_list.index(m_disc) if m_disc in option_list else 7)
+
+            if selected_option == "自定义":
+                new_discount = st.number_input("输入折扣 (如0.85)", min_value=0.0, max_value=1.0, value=m_disc, step=0.01)
+            else:
+                new_discount = float(selected_option)
+
+            if st.form_submit_button("确认充值"):
+                journal.recharge(CURRENT_USER, m_id, amount, new_discount)
+                st.toast(f"充值成功！(耗时 {db.last_timing('recharge'):.0f} ms)", icon="✅")
+                st.rerun()
+
+    # === 分支 B: 没找到 -> 显示新建界面 (自动带入开卡充值) ===
+    else:
+        st.warning(f"⚠️ 未找到 '{search_term}'，请录入新会员")
+
+        with st.form("new_member_form"):
+            col1, col2 = st.columns(2)
+            # 如果搜索的是手机号，自动填入
+            default_phone = search_term if search_term.isdigit() and len(search_term) >= 7 else ""
+            name = col1.text_input("姓名")
+            phone = col2.text_input("手机号", value=default_phone)
+            birthday = st.date_input("生日", value=datetime(2000, 1, 1), min_value=datetime(1950, 1, 1))
+            note = st.text_area("备注")
+
+            st.divider()
+            st.write("**💰 开卡设置 (选填)**")
+            initial_amount = st.number_input("开卡充值金额 (¥)", min_value=0.0, step=100.0)
+            initial_discount = st.selectbox("开卡折扣", [1.0, 0.95, 0.9, 0.88, 0.8, 0.7, 0.6], 
+                                          format_func=lambda x: "原价" if x==1.0 else f"{int(x*100) if x*100%10!=0 else int(x*10)}折")
+
+            submitted = st.form_submit_button("➕ 创建并开卡")
+
+            if submitted:
+                if not name or not phone:
+                    st.error("姓名和手机号必填！")
+                else:
+                    try:
+                        # 会员 + 账户 + 开卡流水, 一个事务完成
+                        m_id = db.create_member(CURRENT_USER, name, phone, birthday, note,
+                                                initial_amount, initial_discount)
+                        search_index.upsert_member(CURRENT_USER, m_id, name, phone)
+
+                        st.success(f"🎉 会员 {name} 创建成功！(余额: ¥{initial_amount}, 耗时 {db.last_timing('create_member'):.0f} ms)")
+                        time.sleep(1)
+                        st.rerun()
+
+                    except Exception as e:
+                        st.error(f"创建失败 (可能是手机号重复): {e}")       
@@ -0,0 +1,345 @@
+"""冷数据归档: 很久以前的流水按 店铺/月 搬到 Parquet 文件, 热表只留近期的
+
+    python archive.py run [--keep-months 12] [--owner <店铺>] [--dry-run]
+    python archive.py status
+
+- 只归档整月都早于 KEEP_MONTHS 个月之前的月份, 定期 (比如每月一次) 跑就能让
+  transactions 表的大小稳定在最近这段时间;
+- 只归档对账 (reconcile.py) 和哈希链校验 (audit.py) 都已经处理过的流水: 检查点里已经
+  算上了, 热表删掉不影响增量对账 / 校验, 两边的 --full 都会把归档文件一起读进来;
+- 每个 店铺+月 一个文件 {ARCHIVE_DIR}/{店铺}/{YYYY-MM}-{最大id}.parquet (zstd 压缩)。
+  先写好文件, 再在一个事务里登记 archived_months、删热表里的这些行 (行数对不上就回滚),
+  中途失败最多留下一个没登记的文件, 不会丢数据;
+- 账目查询 / 导出 的日期范围碰到已归档的月份时透明地读这些文件 (内存映射, 只读用到的列,
+  日期 / 会员 / id 条件下推到文件里过滤)。
+
+daily_totals 和 transaction_items 不归档, 趋势图和项目排行照常。
+归档之后这些流水只在文件里有, 所以目录必须在持久卷 (或挂载的网盘 / 对象存储) 上:
+环境变量 NAIL_ARCHIVE_DIR, 或 secrets.toml 里 [archive] dir = "..."。
+没有明确配置时 run 不归档 (不删热表); 读的时候默认找 ./archive。
+"""
+import argparse
+import functools
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+import db
+
+KEEP_MONTHS = 12
+# 翻页 / 合计 时留在内存里的归档文件个数 (每个是一家店一个月, 一般几十 KB 到几 MB)
+TABLE_CACHE_FILES = 64
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("member_id", pa.int64()),
+    ("type", pa.string()),
+    ("amount", pa.decimal128(12, 2)),
+    ("detail", pa.string()),
+    ("date", pa.timestamp("us", tz="UTC")),
+    ("signature_hash", pa.string()),
+    ("idempotency_key", pa.string()),
+    ("audit_seq", pa.int64()),          # 哈希链 (audit.py); 版本 12 之前归档的文件没有这两列
+    ("audit_hash", pa.string()),
+])
+# 翻页 / 合计 用不到的列, 缓存整个文件时不读
+_UNCACHED = {"idempotency_key", "audit_seq", "audit_hash"}
+
+
+def configured_dir():
+    """明确配置的归档目录, 没配置返回 None"""
+    path = os.environ.get("NAIL_ARCHIVE_DIR")
+    if path:
+        return path
+    try:
+        import streamlit as st
+        return st.secrets["archive"]["dir"]
+    except Exception:
+        return None
+
+
+def get_dir():
+    return configured_dir() or "archive"
+
+
+# --- 1. 读归档 ---
+def months(owner):
+    """这家店已归档的月份 (month 是当月 1 号)"""
+    return db.run_query("""
+        SELECT month, path, row_count, recharge, spend FROM archived_months
+        WHERE owner_username = :owner
+        ORDER BY month
+    """, {"owner": owner})
+
+
+@functools.lru_cache(maxsize=1)
+def _db_timezone():
+    """数据库会话时区: 日期条件要和 SQL 里 date >= :start_date 的含义一致"""
+    with db.get_engine().connect() as c:
+        return c.execute(text("SHOW TIME ZONE")).scalar()
+
+
+def _ts(d):
+    return pd.Timestamp(d).tz_localize(_db_timezone())
+
+
+def _overlapping(owner, start_date=None, end_date=None):
+    """和 [start_date, end_date) 有重叠的已归档月份"""
+    df = months(owner)
+    if df.empty:
+        return df
+    start = pd.to_datetime(df["month"])
+    keep = pd.Series(True, index=df.index)
+    if start_date is not None:
+        keep &= start + pd.DateOffset(months=1) > pd.Timestamp(start_date)
+    if end_date is not None:
+        keep &= start < pd.Timestamp(end_date)
+    return df[keep]
+
+
+def _read(owner, found, columns, member_ids=None, start_date=None, end_date=None, before_id=None,
+          cached=False, newest=None):
+    """从归档文件读流水, 过滤条件下推到 Parquet (按行组跳过);
+    cached=True 时整个文件留在内存里再过滤 (页面上反复查的 翻页 / 合计 用),
+    newest=n 时只要 id 最大的 n 笔 (在 Arrow 里排序截断, 再转 DataFrame)"""
+    filters = []
+    if member_ids is not None:
+        filters.append(("member_id", "in", [int(i) for i in member_ids] or [0]))
+    if start_date is not None:
+        filters.append(("date", ">=", _ts(start_date)))
+    if end_date is not None:
+        filters.append(("date", "<", _ts(end_date)))
+    if before_id is not None:
+        filters.append(("id", "<", int(before_id)))
+    base = get_dir()
+    if cached:
+        expr = pq.filters_to_expression(filters) if filters else None
+        parts = [_table(os.path.join(base, path)) for path in found["path"]]
+        parts = [t.filter(expr) if expr is not None else t for t in parts]
+    else:
+        parts = [pq.read_table(os.path.join(base, path), columns=columns, filters=filters or None,
+                               memory_map=True) for path in found["path"]]
+    table = pa.concat_tables(parts).select(columns)
+    if newest is not None:
+        table = table.sort_by([("id", "descending")]).slice(0, newest)
+    df = table.to_pandas()
+    if "date" in df.columns:
+        df["date"] = df["date"].dt.tz_convert(_db_timezone())
+    return df
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_FILES)
+def _table(full_path):
+    """整个归档文件 (不含幂等键和哈希链); 文件名带版本, 内容不会变, 不用失效"""
+    return pq.read_table(full_path, columns=[f.name for f in SCHEMA if f.name not in _UNCACHED],
+                         memory_map=True)
+
+
+def _with_names(owner, df):
+    """补上会员 姓名 / 手机号 (会员不归档, 按 id 现查)"""
+    if df.empty:
+        return df.assign(name=None, phone=None)
+    names = db.run_query("""
+        SELECT id AS member_id, name, phone FROM members
+        WHERE owner_username = :owner AND id = ANY(:ids)
+    """, {"owner": owner, "ids": [int(i) for i in df["member_id"].unique()] or [0]}).set_index("member_id")
+    return df.assign(name=df["member_id"].map(names["name"]), phone=df["member_id"].map(names["phone"]))
+
+
+def totals(owner, member_ids=None, start_date=None, end_date=None):
+    """归档部分的 笔数 / 充值合计 / 消费合计 (和 db.ledger_totals 同口径)"""
+    found = _overlapping(owner, start_date, end_date)
+    if found.empty:
+        return 0, 0.0, 0.0
+    # 整月都在范围里、又不按会员过滤的, 直接用登记时算好的合计
+    month_start = pd.to_datetime(found["month"])
+    whole = pd.Series(member_ids is None, index=found.index)
+    if start_date is not None:
+        whole &= month_start >= pd.Timestamp(start_date)
+    if end_date is not None:
+        whole &= month_start + pd.DateOffset(months=1) <= pd.Timestamp(end_date)
+    cnt = int(found.loc[whole, "row_count"].sum())
+    recharge = float(found.loc[whole, "recharge"].astype(float).sum())
+    spend = float(found.loc[whole, "spend"].astype(float).sum())
+    if (~whole).any():
+        df = _read(owner, found[~whole], ["type", "amount"], member_ids, start_date, end_date, cached=True)
+        amount = df["amount"].astype(float)
+        cnt += len(df)
+        recharge += float(amount[df["type"] == "RECHARGE"].sum())
+        spend += float(amount[df["type"] == "SPEND"].sum())
+    return cnt, recharge, spend
+
+
+def page(owner, member_ids=None, start_date=None, end_date=None, before_id=None, limit=50):
+    """归档部分 id < before_id 的最新 limit 笔, 列和 db.ledger_page 一样"""
+    found = _overlapping(owner, start_date, end_date)
+    if found.empty:
+        return None
+    df = _read(owner, found, ["id", "date", "member_id", "type", "amount", "detail", "signature_hash"],
+               member_ids, start_date, end_date, before_id, cached=True, newest=limit)
+    df["amount"] = df["amount"].astype(float)
+    return _with_names(owner, df)[["id", "date", "name", "phone", "type", "amount", "detail", "signature_hash"]]
+
+
+def frames(owner, start_date=None, end_date=None):
+    """按月份先后逐个返回归档流水 (导出用), 列和 bulk.export_ledger 一样"""
+    found = _overlapping(owner, start_date, end_date)
+    for i in range(len(found)):
+        df = _read(owner, found.iloc[[i]], ["id", "date", "member_id", "type", "amount", "detail"],
+                   None, start_date, end_date).sort_values("id")
+        if not df.empty:
+            df["amount"] = df["amount"].astype(float)
+            yield _with_names(owner, df)[["id", "date", "name", "phone", "type", "amount", "detail"]]
+
+
+def all_frames(c, columns):
+    """所有店铺的全部归档 (reconcile --full 用), 在调用方的连接 (快照) 里读登记表"""
+    base = get_dir()
+    for path in c.execute(text("SELECT path FROM archived_months ORDER BY owner_username, month")).scalars():
+        yield pq.read_table(os.path.join(base, path), columns=columns, memory_map=True).to_pandas()
+
+
+def owner_frames(c, columns, owner=None):
+    """(店铺, 一个月的归档) 逐个给出; owner=None 表示全部店铺 (rollup.rebuild 用)"""
+    base = get_dir()
+    sql = "SELECT owner_username, path FROM archived_months"
+    if owner is not None:
+        sql += " WHERE owner_username = :o"
+    for r in c.execute(text(sql + " ORDER BY owner_username, month"), {"o": owner}).all():
+        yield r.owner_username, pq.read_table(os.path.join(base, r.path), columns=columns, memory_map=True).to_pandas()
+
+
+def chained_frames(c, owner, columns):
+    """这家店归档文件里在哈希链上的流水 (audit.py 校验用), 没有链的老文件跳过"""
+    base = get_dir()
+    for path in c.execute(text("SELECT path FROM archived_months WHERE owner_username = :o ORDER BY month"),
+                          {"o": owner}).scalars():
+        full_path = os.path.join(base, path)
+        if "audit_seq" not in pq.read_schema(full_path).names:
+            continue
+        df = pq.read_table(full_path, columns=columns, memory_map=True).to_pandas()
+        yield df[df["audit_seq"].notna()]
+
+
+# --- 2. 归档 ---
+def candidates(keep_months=KEEP_MONTHS, owner=None):
+    """可以归档的 (店铺, 月份, 笔数, 最大 id)"""
+    sql = """
+        SELECT owner_username, CAST(date_trunc('month', date) AS date) AS month,
+               COUNT(*) AS row_count, MAX(id) AS max_id
+        FROM transactions
+        WHERE date < date_trunc('month', NOW()) - make_interval(months => :keep)
+          AND owner_username IS NOT NULL
+    """
+    params = {"keep": keep_months}
+    if owner is not None:
+        sql += " AND owner_username = :owner"
+        params["owner"] = owner
+    return db.run_query(sql + " GROUP BY 1, 2 ORDER BY 1, 2", params, ttl=0)
+
+
+def archive_month(owner, month):
+    """把一个 店铺+月 的流水写进归档文件并从热表删掉, 返回归档的笔数;
+    这个月里有对账 (reconcile.py) 或哈希链校验 (audit.py) 还没处理过的流水时不动, 返回 0"""
+    if configured_dir() is None:
+        raise RuntimeError("没有配置归档目录 (NAIL_ARCHIVE_DIR 或 [archive] dir), 不删热表里的流水")
+    window = {"owner": owner, "month": month}
+    where = """owner_username = :owner AND date >= CAST(:month AS date)
+               AND date < CAST(:month AS date) + interval '1 month'"""
+    with db.get_engine().connect() as c:
+        df = pd.read_sql(text(f"""
+            SELECT id, member_id, type, amount, detail, date, signature_hash, idempotency_key,
+                   audit_seq, audit_hash
+            FROM transactions WHERE {where} ORDER BY id
+        """), c, params=window, coerce_float=False)      # 金额保持 Decimal, 原样存成 decimal128
+        watermark = c.execute(text("SELECT COALESCE(MAX(watermark), 0) FROM reconcile_runs")).scalar()
+        verified = c.execute(text("SELECT COALESCE(MAX(seq), 0) FROM audit_checkpoints WHERE owner_username = :owner"),
+                             window).scalar()
+        old = c.execute(text("SELECT path FROM archived_months WHERE owner_username = :owner AND month = :month"),
+                        window).scalar()
+    if df.empty or df["id"].max() > watermark or df["audit_seq"].max() > verified:
+        return 0
+
+    base = get_dir()
+    new = pa.Table.from_pandas(df.assign(date=pd.to_datetime(df["date"], utc=True)),
+                               schema=SCHEMA, preserve_index=False)
+    if old is not None:
+        # 这个月以前归档过 (后来又补写了旧日期的流水): 合并成一个新文件; 老文件可能没有哈希链的列
+        new = pa.concat_tables([pq.read_table(os.path.join(base, old)), new], promote_options="default").sort_by("id")
+    path = f"{owner}/{month:%Y-%m}-{int(df['id'].max())}.parquet"
+    os.makedirs(os.path.join(base, owner), exist_ok=True)
+    pq.write_table(new, os.path.join(base, path), compression="zstd")
+    # 删热表之前先确认文件落盘
+    with open(os.path.join(base, path), "rb") as f:
+        os.fsync(f.fileno())
+
+    amount = new.column("amount").to_pandas().astype(float)
+    kind = new.column("type").to_pandas()
+    try:
+        with db.unit_of_work("archive", owner, ("transactions",)) as c:
+            n = c.execute(text(f"DELETE FROM transactions WHERE {where} AND id = ANY(:ids)"),
+                          {**window, "ids": df["id"].tolist()}).rowcount
+            if n != len(df):
+                raise RuntimeError(f"{owner} {month:%Y-%m}: 应删除 {len(df)} 笔, 实际 {n} 笔, 已回滚")
+            c.execute(text("""
+                INSERT INTO archived_months (owner_username, month, path, row_count, recharge, spend)
+                VALUES (:owner, :month, :path, :rows, :recharge, :spend)
+                ON CONFLICT (owner_username, month) DO UPDATE
+                SET path = EXCLUDED.path, row_count = EXCLUDED.row_count, recharge = EXCLUDED.recharge,
+                    spend = EXCLUDED.spend, archived_at = NOW()
+            """), {**window, "path": path, "rows": new.num_rows,
+                   "recharge": float(amount[kind == "RECHARGE"].sum()),
+                   "spend": float(amount[kind == "SPEND"].sum())})
+    except Exception:
+        os.remove(os.path.join(base, path))
+        raise
+    if old is not None:
+        os.remove(os.path.join(base, old))
+    db.cache.invalidate(owner, ("archived_months",))
+    return len(df)
+
+
+def run(keep_months=KEEP_MONTHS, owner=None, dry_run=False):
+    if not dry_run and configured_dir() is None:
+        print("❌ 没有配置归档目录: 设置 NAIL_ARCHIVE_DIR (或 secrets.toml 的 [archive] dir) 指向持久卷再归档")
+        return 0
+    todo = candidates(keep_months, owner)
+    total = 0
+    for r in todo.itertuples():
+        if dry_run:
+            print(f"{r.owner_username} {r.month:%Y-%m}: {r.row_count} 笔")
+            continue
+        n = archive_month(r.owner_username, r.month)
+        if n:
+            print(f"✅ {r.owner_username} {r.month:%Y-%m}: 归档 {n} 笔")
+        else:
+            print(f"⚠️ {r.owner_username} {r.month:%Y-%m}: 有流水还没对账或校验, 先跑 python reconcile.py 和 python audit.py")
+        total += n
+    return total
+
+
+def status():
+    return db.run_query("""
+        SELECT owner_username, COUNT(*) AS months, SUM(row_count) AS rows, MIN(month) AS first, MAX(month) AS last
+        FROM archived_months GROUP BY owner_username ORDER BY owner_username
+    """, ttl=0)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--keep-months", type=int, default=KEEP_MONTHS, help="热表保留最近几个月")
+    r.add_argument("--owner", help="只归档这家店")
+    r.add_argument("--dry-run", action="store_true", help="只列出要归档的月份")
+    sub.add_parser("status")
+    a = ap.parse_args()
+
+    if a.cmd == "run":
+        print(f"共归档 {run(a.keep_months, a.owner, a.dry_run)} 笔")
+    else:
+        df = status()
+        print(df.to_string(index=False) if not df.empty else "还没有归档")
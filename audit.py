@@ -0,0 +1,202 @@
+"""流水防篡改: 每家店的流水按写入顺序串成一条哈希链, 定期增量校验
+
+    python audit.py                  # 增量: 只校验上次检查点之后新写的流水
+    python audit.py --full           # 从链的第一笔重新校验 (连同 archive.py 归档出去的)
+    python audit.py --owner <店铺>    # 只校验某家店
+
+每笔流水 (充值 / 消费 / 会员管理改余额记的 ADJUST / 对账调整) 写入时, 由触发器在
+同一事务里给这家店的链头 (audit_heads) 排号: audit_seq = 上一笔 + 1,
+audit_hash = sha256(上一笔的 audit_hash | 这一笔的内容)。链头行锁保证同一家店依次排号,
+回滚的事务连号一起回滚, 不会有空号。改了任何一笔的 会员 / 类型 / 金额 / 日期 / 详情 /
+签名, 或者删掉、插进一笔, 从那一笔起的哈希就接不上; 关了触发器写进来的流水没有序号,
+校验时也会报出来。
+
+audit_checkpoints 记每家店校验通过的最后一笔 (序号 + 哈希)。增量校验先核对检查点那一笔
+的哈希没变, 再只按 (店铺, 序号) 索引读之后的新流水, 每次的开销只和新写了多少有关。
+顾客自助查询里序号不超过检查点的流水显示 ✅。
+
+余额 (accounts.balance) 应该等于流水之和, 由 reconcile.py 对账, 不在链上。
+链和检查点一起被整个重算时库里看不出来, 校验结束打印的链头哈希最好另外记一份。
+迁移 (版本 12) 之前已经归档的月份不在链上。
+"""
+import argparse
+import hashlib
+import heapq
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+import archive
+import db
+
+CHUNK = 50_000
+LOCK_KEY = 7_304_116          # pg_advisory_lock 用, 同一时间只跑一个校验
+
+COLUMNS = ["id", "member_id", "type", "amount", "date", "detail", "signature_hash", "audit_seq", "audit_hash"]
+
+
+# --- 1. 哈希 (和 migrations.V12_AUDIT_TRIGGER 里的拼法一致) ---
+def _text(v):
+    return "" if v is None or v != v else str(v)
+
+
+def _int(v):
+    # 列里有空值时 pandas 会把整数列变成浮点
+    return "" if v is None or v != v else str(int(v))
+
+
+def entry_hash(prev_hash, owner, r):
+    """上一笔的哈希 + 这一笔的内容 -> 这一笔的哈希; 金额两位小数, 日期是 UTC 微秒数"""
+    payload = "|".join([
+        prev_hash, owner, _int(r.audit_seq), _int(r.id), _int(r.member_id), r.type,
+        f"{r.amount:.2f}", str(pd.Timestamp(r.date).value // 1000), _text(r.detail), _text(r.signature_hash),
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def chain_existing(c, batch=CHUNK):
+    """迁移时给已有的流水按 id 顺序串上链 (每家店从第 1 笔开始), 并设好链头;
+    已经有链的店接在链头后面"""
+    owners = c.execute(text("""
+        SELECT DISTINCT owner_username FROM transactions
+        WHERE owner_username IS NOT NULL AND audit_seq IS NULL
+    """)).scalars().all()
+    for owner in owners:
+        head = c.execute(text("SELECT seq, hash FROM audit_heads WHERE owner_username = :o FOR UPDATE"),
+                         {"o": owner}).first()
+        after, (seq, prev) = 0, (int(head.seq), head.hash) if head else (0, "")
+        while True:
+            df = pd.read_sql(text(f"""
+                SELECT {", ".join(COLUMNS)} FROM transactions
+                WHERE owner_username = :o AND audit_seq IS NULL AND id > :after
+                ORDER BY id
+                LIMIT :n
+            """), c, params={"o": owner, "after": after, "n": batch}, coerce_float=False)
+            if df.empty:
+                break
+            df["audit_seq"] = range(seq + 1, seq + 1 + len(df))
+            hashes = []
+            for r in df.itertuples(index=False):
+                prev = entry_hash(prev, owner, r)
+                hashes.append(prev)
+            c.execute(text("""
+                UPDATE transactions t SET audit_seq = u.seq, audit_hash = u.hash
+                FROM unnest(CAST(:ids AS integer[]), CAST(:seqs AS bigint[]), CAST(:hashes AS text[])) AS u(id, seq, hash)
+                WHERE t.id = u.id
+            """), {"ids": df["id"].tolist(), "seqs": df["audit_seq"].tolist(), "hashes": hashes})
+            seq += len(df)
+            after = int(df["id"].iloc[-1])
+        c.execute(text("""
+            INSERT INTO audit_heads (owner_username, seq, hash) VALUES (:o, :seq, :hash)
+            ON CONFLICT (owner_username) DO UPDATE SET seq = EXCLUDED.seq, hash = EXCLUDED.hash
+        """), {"o": owner, "seq": seq, "hash": prev})
+
+
+# --- 2. 校验 ---
+def _hot_entries(c, owner, after):
+    """热表里序号 > after 的流水, 按序号分批"""
+    while True:
+        df = pd.read_sql(text(f"""
+            SELECT {", ".join(COLUMNS)} FROM transactions
+            WHERE owner_username = :o AND audit_seq > :after
+            ORDER BY audit_seq
+            LIMIT :n
+        """), c, params={"o": owner, "after": after, "n": CHUNK}, coerce_float=False)
+        if df.empty:
+            return
+        yield from df.itertuples(index=False)
+        after = int(df["audit_seq"].iloc[-1])
+
+
+def _archived_entries(c, owner):
+    df = pd.concat([pd.DataFrame(columns=COLUMNS), *archive.chained_frames(c, owner, COLUMNS)])
+    return df.sort_values("audit_seq").itertuples(index=False)
+
+
+def _stored_hash(c, owner, seq):
+    """第 seq 笔现在存的哈希 (已经归档的去归档文件里找), 找不到返回 None"""
+    h = c.execute(text("SELECT audit_hash FROM transactions WHERE owner_username = :o AND audit_seq = :s"),
+                  {"o": owner, "s": seq}).scalar()
+    if h is None:
+        for df in archive.chained_frames(c, owner, ["audit_seq", "audit_hash"]):
+            found = df.loc[df["audit_seq"] == seq, "audit_hash"]
+            if not found.empty:
+                return found.iloc[0]
+    return h
+
+
+def _verify_owner(c, owner, head, full):
+    """从检查点 (full 时从头) 往后逐笔重算, 遇到第一处接不上就停; 检查点推进到最后一笔对得上的"""
+    cp = None if full else c.execute(text("SELECT seq, hash FROM audit_checkpoints WHERE owner_username = :o"),
+                                     {"o": owner}).first()
+    seq, prev = (int(cp.seq), cp.hash) if cp else (0, "")
+    start, error = seq, None
+    if cp and _stored_hash(c, owner, seq) != prev:
+        error = f"检查点那一笔 (第 {seq} 笔) 被改过或删掉了"
+    else:
+        rows = _hot_entries(c, owner, seq)
+        if full:
+            rows = heapq.merge(_archived_entries(c, owner), rows, key=lambda r: r.audit_seq)
+        for r in rows:
+            if r.audit_seq != seq + 1:
+                error = f"第 {seq + 1} 笔不见了 (下一笔是第 {r.audit_seq} 笔)"
+                break
+            h = entry_hash(prev, owner, r)
+            if h != r.audit_hash:
+                error = f"第 {r.audit_seq} 笔 (流水 id {r.id}) 的内容和哈希对不上"
+                break
+            seq, prev = seq + 1, h
+        else:
+            if (seq, prev) != (head.seq, head.hash):
+                error = f"链头是第 {head.seq} 笔, 流水只接到第 {seq} 笔"
+        loose = c.execute(text("""
+            SELECT MIN(id) FROM transactions WHERE owner_username = :o AND audit_seq IS NULL
+        """), {"o": owner}).scalar()
+        if error is None and loose is not None:
+            error = f"流水 id {loose} 没有串在链上 (绕过触发器写进来的)"
+        if seq != start or full:
+            c.execute(text("""
+                INSERT INTO audit_checkpoints AS cp (owner_username, seq, hash) VALUES (:o, :seq, :hash)
+                ON CONFLICT (owner_username) DO UPDATE
+                SET seq = EXCLUDED.seq, hash = EXCLUDED.hash, verified_at = NOW()
+            """), {"o": owner, "seq": seq, "hash": prev})
+    return {"owner_username": owner, "checked": seq - start, "seq": seq, "hash": prev, "error": error}
+
+
+def verify(full=False, owner=None):
+    """校验一遍, 返回每家店一行: 这次校验的笔数 / 校验到第几笔 / 那一笔的哈希 / 出错原因 (没错为 None)"""
+    results = []
+    with db.get_engine().connect() as c:
+        c.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        c.commit()
+        try:
+            # 链头和流水在同一个快照里读, 校验期间照常收银也不会误报
+            c.execution_options(isolation_level="REPEATABLE READ")
+            with c.begin():
+                sql = "SELECT owner_username, seq, hash FROM audit_heads"
+                if owner is not None:
+                    sql += " WHERE owner_username = :o"
+                for head in c.execute(text(sql + " ORDER BY owner_username"), {"o": owner}).all():
+                    results.append(_verify_owner(c, head.owner_username, head, full))
+        finally:
+            c.execution_options(isolation_level="READ COMMITTED")
+            c.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+            c.commit()
+    db.cache.invalidate(owner, ("audit_checkpoints",))
+    return pd.DataFrame(results, columns=["owner_username", "checked", "seq", "hash", "error"])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--full", action="store_true", help="从链的第一笔重新校验")
+    ap.add_argument("--owner", help="只校验这家店")
+    a = ap.parse_args()
+
+    df = verify(a.full, a.owner)
+    for r in df.itertuples(index=False):
+        if r.error is None:
+            print(f"✅ {r.owner_username}: 新校验 {r.checked} 笔, 到第 {r.seq} 笔, 哈希 {r.hash}")
+        else:
+            print(f"❌ {r.owner_username}: {r.error} (第 {r.seq} 笔之前没问题)")
+    sys.exit(1 if df["error"].notna().any() else 0)
@@ -0,0 +1,142 @@
+"""店主登录: 密码哈希 + 签名的会话令牌
+
+- shop_owners.password 存 pbkdf2 哈希; 旧的明文密码在第一次登录成功时
+  自动升级, 也可以一次性全部转换:  python auth.py hash-existing
+- "免密登录" 的 Cookie 里放的是带过期时间、用服务器密钥 HMAC 签名的令牌
+  (账号 + 店名), 回访时本地验签即可, 不查数据库, 也不再把密码存进 Cookie。
+
+服务器密钥来自环境变量 NAIL_AUTH_SECRET 或 secrets.toml 的 [auth] secret;
+没有配置时不发放令牌 (只能每次输入密码)。更换密钥会让所有令牌失效。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import time
+
+from sqlalchemy import text
+
+import db
+
+PBKDF2_ITERATIONS = 200_000
+HASH_PREFIX = "pbkdf2_sha256"
+TOKEN_DAYS = 30
+
+
+# --- 1. 密码哈希 ---
+def hash_password(password):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"{HASH_PREFIX}${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return (stored or "").startswith(HASH_PREFIX + "$")
+
+
+def verify_password(stored, password):
+    """校验密码; 兼容还没升级的明文密码"""
+    if not stored:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    try:
+        _, iterations, salt, digest = stored.split("$")
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode(), _unb64(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, _unb64(digest))
+
+
+def authenticate(username, password):
+    """账号密码正确返回店名, 否则 None; 明文密码顺手升级成哈希"""
+    df = db.run_query("SELECT password, shop_name FROM shop_owners WHERE username = :u",
+                      {"u": username}, ttl=0)
+    if df.empty:
+        return None
+    stored, shop_name = df.iloc[0]["password"], df.iloc[0]["shop_name"]
+    if not verify_password(stored, password):
+        return None
+    if not is_hashed(stored):
+        _upgrade_plaintext(username, password, stored)
+    return shop_name
+
+
+def _upgrade_plaintext(username, password, stored):
+    """登录成功的明文密码换成哈希 (只有升级前的老账号会走到)"""
+    db.run_transaction("UPDATE shop_owners SET password = :p WHERE username = :u AND password = :old",
+                       {"p": hash_password(password), "u": username, "old": stored})
+
+
+# --- 2. 会话令牌 ---
+def get_secret():
+    secret = os.environ.get("NAIL_AUTH_SECRET")
+    if secret:
+        return secret.encode()
+    try:
+        import streamlit as st
+        return st.secrets["auth"]["secret"].encode()
+    except Exception:
+        return None
+
+
+def make_token(username, shop_name, days=TOKEN_DAYS, secret=None):
+    """签发令牌; 没有配置密钥时返回 None"""
+    secret = secret or get_secret()
+    if not secret:
+        return None
+    payload = _b64(json.dumps({"u": username, "s": shop_name, "exp": int(time.time()) + days * 86400},
+                              ensure_ascii=False).encode())
+    sig = _b64(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{sig}"
+
+
+def verify_token(token, secret=None):
+    """验签 + 检查过期; 通过返回 (账号, 店名), 否则 None"""
+    secret = secret or get_secret()
+    if not secret or not token or "." not in token:
+        return None
+    payload, sig = token.rsplit(".", 1)
+    expected = _b64(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+    # 按字节比: 伪造的 cookie 里有非 ASCII 字符时 str 比较会抛 TypeError
+    if not hmac.compare_digest(sig.encode(), expected.encode()):
+        return None
+    try:
+        data = json.loads(_unb64(payload))
+    except ValueError:
+        return None
+    if data.get("exp", 0) < time.time():
+        return None
+    return data["u"], data["s"]
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(s):
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+# --- 3. 历史明文密码一次性转换 ---
+def hash_existing(c):
+    """把 shop_owners 里所有明文密码换成哈希, 返回转换的条数"""
+    rows = c.execute(text("SELECT username, password FROM shop_owners")).all()
+    n = 0
+    for username, stored in rows:
+        if stored and not is_hashed(stored):
+            c.execute(text("UPDATE shop_owners SET password = :p WHERE username = :u"),
+                      {"p": hash_password(stored), "u": username})
+            n += 1
+    return n
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["hash-existing"]:
+        print(__doc__)
+        sys.exit(1)
+    with db.unit_of_work("hash_existing") as c:
+        print(f"✅ 已转换 {hash_existing(c)} 个明文密码")
@@ -0,0 +1,325 @@
+"""各页面查询的基准测试 (本地库 + seed.py 合成数据)
+
+    export DATABASE_URL=postgresql+psycopg2://localhost/nail_bench
+    python seed.py --shops 3 --members 2000 --transactions 50000 --reset
+    python benchmark.py run                       # 结果写到 bench_results/<git版本>.json
+    python benchmark.py run --label before --iterations 200
+    python benchmark.py compare bench_results/before.json bench_results/after.json
+
+每个操作都调用页面上同一套函数 (db / search_index / rollup / views),
+包括查询后的 pandas 整理; 默认每次调用前清空读缓存, 测的是数据库真实开销
+(--warm 则保留缓存, 测缓存命中后的情况)。结果里有 p50/p95/p99 延迟和
+tracemalloc 峰值内存, compare 会标出变慢超过阈值的操作。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+import catalog
+import db
+import line_items
+import member_stats
+import rollup
+import search_index
+import seed
+import signatures
+import views
+
+RESULTS_DIR = "bench_results"
+
+
+class Context:
+    """基准测试用到的样本 (从库里随机抽, 固定随机种子)"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        engine = db.get_engine()
+        with engine.connect() as c:
+            self.owners = [r[0] for r in c.execute(text(
+                "SELECT username FROM shop_owners WHERE username LIKE 'bench_shop_%' ORDER BY username"))]
+            if not self.owners:
+                sys.exit("❌ 没有测试数据, 先运行 python seed.py")
+            self.members = c.execute(text("""
+                SELECT m.id, m.name, m.phone, m.owner_username FROM members m
+                WHERE m.owner_username = ANY(:o) ORDER BY random() LIMIT 500
+            """), {"o": self.owners}).all()
+            self.sig_hashes = [r[0] for r in c.execute(text("SELECT hash FROM signature_blobs LIMIT 50"))]
+        self.signature_json = seed.fake_signature_json(rng)
+        self.new_phone_seq = int(time.time())
+
+    def owner(self):
+        return self.rng.choice(self.owners)
+
+    def member(self):
+        return self.rng.choice(self.members)
+
+
+# --- 各页面的操作 (名字 -> 函数), 每次调用相当于页面上的一次动作 ---
+def op_index_load(ctx):
+    search_index._load(ctx.owner())
+
+
+def op_catalog_load(ctx):
+    catalog._load(ctx.owner())
+
+
+def op_member_search(ctx):
+    m = ctx.member()
+    term = ctx.rng.choice([m.phone, m.phone[-4:], m.name])
+    ids = search_index.search(m.owner_username, term)
+    db.members_by_ids(m.owner_username, ids)
+
+
+def op_checkout(ctx):
+    m = ctx.member()
+    row = db.members_by_ids(m.owner_username, [m.id]).iloc[0]
+    price = 100.0 * float(row["current_discount"])
+    sig = signatures.process_signature(ctx.signature_json)
+    try:
+        db.checkout(m.owner_username, m.id, price, "手部(卸甲,款式)", sig,
+                    [("手部", "卸甲", None), ("手部", "款式", None)])
+    except db.InsufficientBalance:
+        # 余额不够的会员顺手充值, 也是一次收银操作
+        db.recharge(m.owner_username, m.id, 1000.0, float(row["current_discount"]))
+
+
+def op_recharge(ctx):
+    m = ctx.member()
+    row = db.members_by_ids(m.owner_username, [m.id]).iloc[0]
+    db.recharge(m.owner_username, m.id, 500.0, float(row["current_discount"]))
+
+
+def op_create_member(ctx):
+    ctx.new_phone_seq += 1
+    db.create_member(ctx.owner(), "基准测试", f"19{ctx.new_phone_seq % 10**9:09d}", None, "", 500.0, 0.9)
+
+
+def op_directory_first_page(ctx):
+    df, _ = member_stats.directory(ctx.owner())
+    views.directory_table(df)
+
+
+def op_directory_filtered(ctx):
+    df, _ = member_stats.directory(ctx.owner(), inactive_days=60, min_balance=500, sort="余额最高", page=1)
+    views.directory_table(df)
+
+
+def op_member_manage_search(ctx):
+    m = ctx.member()
+    df = db.member_list(m.owner_username, search_index.search(m.owner_username, m.name))
+    if len(df) > 1:
+        views.member_table(df)
+
+
+def _trend(ctx, label):
+    days, freq, fmt = views.TREND_RANGES[label]
+    df = rollup.daily_totals(ctx.owner(), days)
+    if not df.empty:
+        views.trend_frame(df, days, freq, fmt)
+
+
+def op_trend_7(ctx):
+    _trend(ctx, "近7天")
+
+
+def op_trend_365(ctx):
+    _trend(ctx, "近一年")
+
+
+def _month_range():
+    today = date.today()
+    return today.replace(day=1) - timedelta(days=31), today + timedelta(days=1)
+
+
+def op_ledger_totals(ctx):
+    start, end = _month_range()
+    db.ledger_totals(ctx.owner(), None, start, end)
+
+
+def op_ledger_first_page(ctx):
+    start, end = _month_range()
+    db.ledger_page(ctx.owner(), None, start, end, page_size=50)
+
+
+def op_ledger_deep_page(ctx):
+    """一年范围里翻到第 5 页"""
+    owner = ctx.owner()
+    start, end = date.today() - timedelta(days=365), date.today() + timedelta(days=1)
+    before = None
+    for _ in range(5):
+        df, more = db.ledger_page(owner, None, start, end, before_id=before, page_size=50)
+        if not more:
+            break
+        before = int(df["id"].iloc[-1])
+
+
+def op_ledger_member(ctx):
+    m = ctx.member()
+    start, end = date.today() - timedelta(days=365), date.today() + timedelta(days=1)
+    ids = search_index.search(m.owner_username, m.phone)
+    db.ledger_totals(m.owner_username, ids, start, end)
+    db.ledger_page(m.owner_username, ids, start, end, page_size=50)
+
+
+def op_item_report(ctx):
+    start, end = _month_range()
+    views.item_table(line_items.item_report(ctx.owner(), start, end))
+
+
+def op_signature_load(ctx):
+    if ctx.sig_hashes:
+        signatures.load_signature(ctx.rng.choice(ctx.sig_hashes))
+
+
+def op_customer_lookup(ctx):
+    m = ctx.member()
+    df = db.customer_lookup(m.name, m.phone)
+    for _, trans_df in views.customer_cards(df):
+        if not trans_df.empty:
+            views.recent_table(trans_df)
+
+
+OPERATIONS = {
+    "索引加载": op_index_load,
+    "价目表加载": op_catalog_load,
+    "会员搜索": op_member_search,
+    "消费结账": op_checkout,
+    "会员充值": op_recharge,
+    "新建会员": op_create_member,
+    "会员名录-首页": op_directory_first_page,
+    "会员名录-筛选": op_directory_filtered,
+    "会员管理-搜索": op_member_manage_search,
+    "经营趋势-7天": op_trend_7,
+    "经营趋势-一年": op_trend_365,
+    "账目合计-本月": op_ledger_totals,
+    "账目首页-本月": op_ledger_first_page,
+    "账目翻页-第5页": op_ledger_deep_page,
+    "账目-单个会员": op_ledger_member,
+    "服务项目排行-本月": op_item_report,
+    "签名加载": op_signature_load,
+    "顾客自助查询": op_customer_lookup,
+}
+
+
+def run(iterations=50, mem_iterations=5, warm=False, only=None, seed_value=7):
+    seed.check_local()
+    rng = random.Random(seed_value)
+    ctx = Context(rng)
+    # 搜索索引是进程级的, 先整体加载 (加载本身单独测)
+    for owner in ctx.owners:
+        search_index.get_index(owner)
+
+    results = {}
+    for name, fn in OPERATIONS.items():
+        if only and name not in only:
+            continue
+        fn(ctx)  # 预热一次 (连接池、导入等)
+        latencies = []
+        for _ in range(iterations):
+            if not warm:
+                db.cache.clear()
+            t0 = time.perf_counter()
+            fn(ctx)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        # 内存单独测, tracemalloc 本身会拖慢速度
+        peak = 0
+        for _ in range(mem_iterations):
+            if not warm:
+                db.cache.clear()
+            tracemalloc.start()
+            fn(ctx)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        lat = np.array(latencies)
+        results[name] = {
+            "n": iterations,
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            "mean_ms": round(float(lat.mean()), 3),
+            "peak_kib": round(peak / 1024, 1),
+        }
+        r = results[name]
+        print(f"{name:<16} p50 {r['p50_ms']:>8.2f}  p95 {r['p95_ms']:>8.2f}  "
+              f"p99 {r['p99_ms']:>8.2f} ms  峰值内存 {r['peak_kib']:>8.1f} KiB")
+
+    with db.get_engine().connect() as c:
+        counts = dict(c.execute(text("""
+            SELECT 'members', COUNT(*) FROM members UNION ALL
+            SELECT 'transactions', COUNT(*) FROM transactions
+        """)).all())
+        pg_version = c.execute(text("SHOW server_version")).scalar()
+    meta = {
+        "git": _git_rev(), "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "postgres": pg_version,
+        "iterations": iterations, "warm_cache": warm, "rows": counts,
+    }
+    return {"meta": meta, "results": results}
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path, threshold=0.2):
+    """对比两次结果 (按 p95), 变慢超过 threshold 的标红, 有则返回 False"""
+    old = json.load(open(old_path, encoding="utf-8"))["results"]
+    new = json.load(open(new_path, encoding="utf-8"))["results"]
+    ok = True
+    print(f"{'操作':<16} {'旧 p95':>10} {'新 p95':>10} {'变化':>8}")
+    for name in new:
+        if name not in old:
+            print(f"{name:<16} {'-':>10} {new[name]['p95_ms']:>10.2f}    (新增)")
+            continue
+        a, b = old[name]["p95_ms"], new[name]["p95_ms"]
+        change = (b - a) / a if a else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  ❌ 变慢"
+            ok = False
+        elif change < -threshold:
+            flag = "  ✅ 变快"
+        print(f"{name:<16} {a:>10.2f} {b:>10.2f} {change:>+7.0%}{flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--iterations", type=int, default=50)
+    r.add_argument("--mem-iterations", type=int, default=5)
+    r.add_argument("--warm", action="store_true", help="保留读缓存")
+    r.add_argument("--only", nargs="*", help="只跑这些操作")
+    r.add_argument("--label", help="结果文件名, 默认用 git 版本号")
+    c = sub.add_parser("compare")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.2, help="p95 变慢多少算退化 (默认 20%%)")
+    a = ap.parse_args()
+
+    if a.cmd == "run":
+        report = run(a.iterations, a.mem_iterations, a.warm, a.only)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{a.label or report['meta']['git']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {path}")
+    else:
+        sys.exit(0 if compare(a.old, a.new, a.threshold) else 1)
@@ -0,0 +1,226 @@
+"""批量导入会员 / 流式导出账目
+
+    python bulk.py import <店铺账号> members.xlsx [--dry-run]
+    python bulk.py export <店铺账号> ledger.csv [--start 2024-01-01] [--end 2024-12-31]
+
+导入文件的表头 (中英文都认, 只有 姓名/手机号 必填):
+    姓名 name | 手机号 phone | 余额 balance | 折扣 discount | 生日 birthday | 备注 note
+折扣写 0.88 或 8.8 (折) 都行, 空着就是不打折。
+
+校验整列一次做完 (pandas 向量化), 有问题的行连同原因一起返回, 和本店已有
+手机号或文件内重复的也算问题行。写入是一个事务: 按 CHUNK 行一批, 每批一条
+unnest 语句同时插 会员 + 账户 + 期初余额的 RECHARGE 流水。
+
+导出按 t.id 顺序用服务端游标分批读, 每批直接追加写进 CSV, 内存里最多
+一批数据, 多大的日期范围都可以; 已归档 (archive.py) 的月份按月从归档文件读。
+页面上的下载文件 (含姓名手机号) 放在单独的目录里, 超过 EXPORT_KEEP 秒的下次导出时删掉。
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+import archive
+import db
+import search_index
+
+CHUNK = 5000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "nail_salon_exports")
+EXPORT_KEEP = 3600          # 导出文件留多久 (秒), 够点下载就行
+
+COLUMNS = {
+    "姓名": "name", "手机号": "phone", "余额": "balance", "折扣": "discount",
+    "生日": "birthday", "备注": "note",
+}
+REQUIRED = ("name", "phone")
+
+EXPORT_COLUMNS = {
+    "id": "流水号", "date": "时间", "name": "姓名", "phone": "手机号",
+    "type": "类型", "amount": "金额", "detail": "详情",
+}
+
+
+# --- 1. 读文件 + 校验 ---
+def read_table(file, filename=None):
+    """CSV 或 Excel -> 全部按字符串读进来的 DataFrame (手机号不能被当成数字)"""
+    filename = (filename or getattr(file, "name", "")).lower()
+    if filename.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(file, dtype=str)
+    else:
+        df = pd.read_csv(file, dtype=str, encoding="utf-8-sig")
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.rename(columns=COLUMNS)
+
+
+def existing_phones(owner, phones):
+    if not phones:
+        return set()
+    df = db.run_query("SELECT phone FROM members WHERE owner_username = :owner AND phone = ANY(:phones)",
+                      {"owner": owner, "phones": list(phones)}, ttl=0)
+    return set(df["phone"])
+
+
+def validate(df, owner):
+    """返回 (可以导入的行, 问题行); 问题行带 行号 (对应表格里的行, 表头是第 1 行) 和 问题"""
+    missing = [c for c in REQUIRED if c not in df.columns]
+    if missing:
+        raise ValueError(f"缺少列: {', '.join(k for k, v in COLUMNS.items() if v in missing)}")
+    df = df.reindex(columns=list(COLUMNS.values()))
+    s = {c: df[c].fillna("").astype(str).str.strip() for c in df.columns}
+
+    name = s["name"]
+    phone = s["phone"].str.replace(r"[\s-]", "", regex=True)
+    balance = pd.to_numeric(s["balance"].where(s["balance"] != "", "0"), errors="coerce")
+    discount = pd.to_numeric(s["discount"].where(s["discount"] != "", "1"), errors="coerce")
+    discount = discount.where(discount <= 1, discount / 10)     # 8.8 -> 0.88
+    birthday = pd.to_datetime(s["birthday"].where(s["birthday"] != ""), errors="coerce")
+
+    problems = pd.Series("", index=df.index)
+
+    def flag(mask, msg):
+        problems.loc[mask] = problems[mask] + msg + "; "
+
+    flag(name == "", "姓名为空")
+    flag(~phone.str.fullmatch(r"\d{5,15}"), "手机号格式不对")
+    flag(balance.isna() | (balance < 0), "余额不是有效金额")
+    flag(discount.isna() | (discount <= 0) | (discount > 1), "折扣应在 0~1 (或 1~10 折) 之间")
+    flag(birthday.isna() & (s["birthday"] != ""), "生日日期无法识别")
+    flag(phone.duplicated(keep=False) & (phone != ""), "文件内手机号重复")
+    flag(phone.isin(existing_phones(owner, set(phone[phone != ""]))), "本店已有该手机号")
+
+    clean = pd.DataFrame({
+        "name": name, "phone": phone, "balance": balance.round(2), "discount": discount.round(2),
+        "birthday": birthday.dt.date, "note": s["note"],
+    })
+    bad = problems != ""
+    report = pd.DataFrame({
+        "行号": df.index[bad] + 2, "姓名": name[bad], "手机号": phone[bad],
+        "问题": problems[bad].str.rstrip("; "),
+    })
+    return clean[~bad].reset_index(drop=True), report.reset_index(drop=True)
+
+
+# --- 2. 批量写入 ---
+# 同一批的会员、账户、期初流水在一条语句里写完; 手机号店内唯一, 用它把新 id 对回去
+SQL_IMPORT = """
+    WITH src AS (
+        SELECT * FROM unnest(CAST(:name AS text[]), CAST(:phone AS text[]), CAST(:birthday AS date[]),
+                             CAST(:note AS text[]), CAST(:bal AS numeric[]), CAST(:disc AS numeric[]))
+            AS s(name, phone, birthday, note, bal, disc)
+    ), m AS (
+        INSERT INTO members (name, phone, birthday, note, owner_username)
+        SELECT name, phone, birthday, note, :owner FROM src
+        RETURNING id, phone
+    ), acc AS (
+        INSERT INTO accounts (member_id, balance, current_discount)
+        SELECT m.id, src.bal, src.disc FROM m JOIN src ON src.phone = m.phone
+        RETURNING member_id, balance
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, owner_username)
+        SELECT member_id, 'RECHARGE', balance, '批量导入期初余额', NOW(), :owner FROM acc
+        WHERE balance > 0
+        RETURNING id
+    )
+    SELECT COUNT(*) FROM m
+"""
+
+
+def import_members(owner, clean):
+    """把 validate 通过的行写进库 (一个事务), 返回导入的人数"""
+    if clean.empty:
+        return 0
+    n = 0
+    with db.unit_of_work("bulk_import", owner, ("members", "accounts", "transactions")) as c:
+        for i in range(0, len(clean), CHUNK):
+            part = clean.iloc[i:i + CHUNK]
+            n += c.execute(text(SQL_IMPORT), {
+                "owner": owner, "name": part["name"].tolist(), "phone": part["phone"].tolist(),
+                "birthday": [d if pd.notna(d) else None for d in part["birthday"]],
+                "note": [v or None for v in part["note"]],
+                "bal": part["balance"].tolist(), "disc": part["discount"].tolist(),
+            }).scalar()
+    # 一次进来很多人, 不逐个 upsert, 让索引下次搜索时整体重建
+    search_index.invalidate(owner)
+    return n
+
+
+# --- 3. 流式导出 ---
+def export_ledger(owner, out, start_date=None, end_date=None, chunk=CHUNK):
+    """按 t.id 顺序把流水分批写进 out (文本文件对象), 返回行数; end_date 不含当天"""
+    where, params = db._ledger_where(owner, None, start_date, end_date)
+    sql = f"""
+        SELECT t.id, t.date, m.name, m.phone, t.type, t.amount, t.detail
+        FROM transactions t
+        JOIN members m ON t.member_id = m.id
+        WHERE {where}
+        ORDER BY t.id
+    """
+    n = 0
+
+    def write(part):
+        part["date"] = pd.to_datetime(part["date"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+        part.rename(columns=EXPORT_COLUMNS).to_csv(out, header=n == 0, index=False)
+        return len(part)
+
+    # 已归档的月份 (id 更小) 在前, 一个月一批
+    for part in archive.frames(owner, start_date, end_date):
+        n += write(part)
+    with db.get_engine().connect().execution_options(stream_results=True, max_row_buffer=chunk) as c:
+        for part in pd.read_sql(text(sql), c, params=params, chunksize=chunk):
+            n += write(part)
+    if n == 0:
+        pd.DataFrame(columns=list(EXPORT_COLUMNS.values())).to_csv(out, index=False)
+    return n
+
+
+def _purge_exports(now=None):
+    """删掉过期的导出文件 (会话关掉后最后一个文件没人删)"""
+    cutoff = (now or time.time()) - EXPORT_KEEP
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def export_ledger_file(owner, start_date=None, end_date=None):
+    """导出到 EXPORT_DIR 下的临时文件 (给下载按钮用), 返回 (路径, 行数)"""
+    os.makedirs(EXPORT_DIR, mode=0o700, exist_ok=True)
+    _purge_exports()
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", dir=EXPORT_DIR, delete=False,
+                                     encoding="utf-8-sig", newline="") as f:
+        n = export_ledger(owner, f, start_date, end_date)
+    return f.name, n
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("import")
+    i.add_argument("owner")
+    i.add_argument("file")
+    i.add_argument("--dry-run", action="store_true", help="只校验不写入")
+    e = sub.add_parser("export")
+    e.add_argument("owner")
+    e.add_argument("file")
+    e.add_argument("--start", type=date.fromisoformat)
+    e.add_argument("--end", type=date.fromisoformat, help="含当天")
+    a = ap.parse_args()
+
+    if a.cmd == "import":
+        clean, report = validate(read_table(a.file), a.owner)
+        if not report.empty:
+            print(report.to_string(index=False))
+        print(f"可导入 {len(clean)} 人, 问题行 {len(report)} 行")
+        if not a.dry_run:
+            print(f"✅ 已导入 {import_members(a.owner, clean)} 人")
+    else:
+        end = a.end + timedelta(days=1) if a.end else None
+        with open(a.file, "w", encoding="utf-8-sig", newline="") as f:
+            print(f"✅ 已导出 {export_ledger(a.owner, f, a.start, end)} 笔")
@@ -0,0 +1,136 @@
+"""每个店铺一份的服务价目表 (大类 / 项目 / 标价 / 是否上架)
+
+进程级缓存, 和 search_index 一样: 每家店第一次用到时从数据库加载一次,
+在 项目管理 里保存后整体失效; 结账页重跑时只读内存, 不查库。
+新店第一次加载时按 DEFAULT_MENU 建一份默认价目表 (标价空着, 店主自己填)。
+"""
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+import db
+
+# 兜底: 超过这个时间 (秒) 重新加载, 别的进程改了价目表也能看到
+MAX_AGE = 600
+
+# 原来写死在结账页里的菜单, 作为新店的默认价目表: 大类 -> (图标, [项目])
+DEFAULT_MENU = {
+    "手部": ("🖐️", ["卸甲", "修补", "延长", "款式", "饰品"]),
+    "睫毛": ("👁️", ["卸睫毛", "漫画款", "婴儿弯", "YY单根", "设计款", "蛋白矫正"]),
+    "足部": ("🦶", ["卸甲", "水晶矫正", "甲片", "款式", "足部护理"]),
+    "眉毛": ("🤨", ["野生眉", "线条眉", "雾眉", "洗眉"]),
+}
+
+COLUMNS = ["icon", "category", "item", "price", "active"]
+
+SQL_INSERT = """
+    INSERT INTO service_catalog (owner_username, icon, category, item, price, active, sort_order)
+    SELECT :owner, * FROM unnest(CAST(:icon AS text[]), CAST(:category AS text[]), CAST(:item AS text[]),
+                                 CAST(:price AS numeric[]), CAST(:active AS boolean[]),
+                                 CAST(:sort_order AS integer[]))
+"""
+SQL_UPSERT = SQL_INSERT + """
+    ON CONFLICT (owner_username, category, item) DO UPDATE
+    SET icon = EXCLUDED.icon, price = EXCLUDED.price, active = EXCLUDED.active,
+        sort_order = EXCLUDED.sort_order
+"""
+SQL_SEED = SQL_INSERT + " ON CONFLICT DO NOTHING"
+
+
+class Catalog:
+    def __init__(self, df):
+        self.df = df                       # 全部项目 (含下架的), 项目管理页用
+        self.icons = {}                    # 大类 -> 图标
+        self.items = {}                    # 大类 -> {项目: 标价或 None}, 只有上架的, 按排序
+        for r in df[df["active"]].itertuples():
+            self.icons.setdefault(r.category, r.icon)
+            self.items.setdefault(r.category, {})[r.item] = None if pd.isna(r.price) else float(r.price)
+        self.loaded_at = time.monotonic()
+
+    def categories(self):
+        return list(self.items)
+
+    def label(self, category):
+        icon = self.icons.get(category)
+        return f"{icon} {category}" if icon else category
+
+
+def _params(df):
+    return {
+        "icon": df["icon"].tolist(), "category": df["category"].tolist(), "item": df["item"].tolist(),
+        "price": [None if pd.isna(p) else float(p) for p in df["price"]],
+        "active": [bool(a) for a in df["active"]], "sort_order": list(range(len(df))),
+    }
+
+
+def seed_defaults(c, owners):
+    """给这些店铺写入默认价目表 (已经有的项目不动)"""
+    rows = [(icon, cat, item) for cat, (icon, items) in DEFAULT_MENU.items() for item in items]
+    df = pd.DataFrame(rows, columns=["icon", "category", "item"]).assign(price=None, active=True)
+    for owner in owners:
+        c.execute(text(SQL_SEED), {"owner": owner, **_params(df)})
+
+
+# --- 进程级缓存: owner_username -> Catalog ---
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def _load(owner):
+    df = db.run_query("""
+        SELECT icon, category, item, price, active FROM service_catalog
+        WHERE owner_username = :owner
+        ORDER BY sort_order, id
+    """, {"owner": owner}, ttl=0)
+    df["price"] = pd.to_numeric(df["price"]).astype(float)
+    df["active"] = df["active"].astype(bool)
+    return Catalog(df)
+
+
+def get(owner):
+    cat = _catalogs.get(owner)
+    if cat is None or time.monotonic() - cat.loaded_at > MAX_AGE:
+        with _lock:
+            cat = _catalogs.get(owner)
+            if cat is None or time.monotonic() - cat.loaded_at > MAX_AGE:
+                cat = _load(owner)
+                if cat.df.empty:
+                    with db.unit_of_work("catalog_defaults", owner, ("service_catalog",)) as c:
+                        seed_defaults(c, [owner])
+                    cat = _load(owner)
+                _catalogs[owner] = cat
+    return cat
+
+
+def save(owner, df):
+    """保存项目管理页编辑后的整张表; 表里删掉的行改成下架 (历史账目还引用着)。
+    大类或项目为空的行忽略, 同一大类下项目重名抛 ValueError"""
+    df = df.reindex(columns=COLUMNS).copy()
+    for col in ("icon", "category", "item"):
+        df[col] = df[col].fillna("").astype(str).str.strip()
+    df = df[(df["category"] != "") & (df["item"] != "")]
+    dup = df[df.duplicated(["category", "item"], keep=False)]
+    if not dup.empty:
+        raise ValueError("项目重复: " + ", ".join(sorted(set(dup["category"] + "/" + dup["item"]))))
+    if (pd.to_numeric(df["price"], errors="coerce") < 0).any():
+        raise ValueError("标价不能为负数")
+    df["active"] = df["active"].fillna(True)
+    # 同一大类的图标以第一行为准
+    df["icon"] = df.groupby("category")["icon"].transform(lambda s: next((i for i in s if i), ""))
+
+    with db.unit_of_work("catalog_save", owner, ("service_catalog",)) as c:
+        c.execute(text("UPDATE service_catalog SET active = false WHERE owner_username = :owner"),
+                  {"owner": owner})
+        if not df.empty:
+            c.execute(text(SQL_UPSERT), {"owner": owner, **_params(df)})
+    invalidate(owner)
+
+
+def invalidate(owner=None):
+    with _lock:
+        if owner is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(owner, None)
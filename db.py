@@ -0,0 +1,412 @@
+"""数据访问层: 连接池 + 业务操作
+
+每个收银动作 (充值 / 结账 / 开卡) 都是一条带 RETURNING 的 CTE 语句,
+在一个事务里完成, 对 Supabase 只需要一次网络往返。
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import instrument
+import query_cache
+from query_cache import cache
+
+log = logging.getLogger("nail_salon.db")
+
+# --- 1. 连接池配置 ---
+# Streamlit Cloud 是单进程, 收银台 + 顾客扫码同时在线, 5 个常驻连接足够;
+# 高峰期最多再借 5 个, 借不到 10 秒就报错, 不让页面一直卡住。
+# 不开 pool_pre_ping (每次借连接都会多一次往返), 改用 pool_recycle
+# 在 Supabase 断开空闲连接之前主动回收。
+POOL_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_timeout": 10,
+    "pool_recycle": 300,
+}
+
+_engines = {}
+
+
+def get_engine():
+    """优先使用环境变量 DATABASE_URL (本地库/脚本), 否则用 secrets 里的 supabase 连接"""
+    url = os.environ.get("DATABASE_URL")
+    if url:
+        if url not in _engines:
+            _engines[url] = create_engine(url, **POOL_OPTIONS)
+        return _engines[url]
+
+    import streamlit as st
+    return st.connection("supabase", type="sql", **POOL_OPTIONS).engine
+
+
+# --- 2. 耗时统计 ---
+# 最近 200 次操作的耗时 (操作名, 毫秒), 用来对比优化前后的延迟
+TIMINGS = deque(maxlen=200)
+
+
+def last_timing(op):
+    """返回某个操作最近一次的耗时 (毫秒), 没有记录则返回 None"""
+    for name, ms in reversed(TIMINGS):
+        if name == op:
+            return ms
+    return None
+
+
+@contextmanager
+def unit_of_work(op, owner=None, tables=(), member_id=None):
+    """一个业务操作 = 一个事务; 退出时提交 (出错回滚) 并记录耗时,
+    提交成功后让 读缓存 里受影响的 店铺/表/会员 条目失效"""
+    t0 = time.perf_counter()
+    with instrument.span(f"事务:{op}"), get_engine().begin() as c:
+        yield c
+    if tables:
+        cache.invalidate(owner, tables, member_id)
+    ms = (time.perf_counter() - t0) * 1000
+    TIMINGS.append((op, ms))
+    log.info("%s 耗时 %.1f ms", op, ms)
+
+
+# --- 3. 通用读写 ---
+@instrument.timed("run_query")
+def run_query(query_str, params=None, ttl=query_cache.DEFAULT_TTL):
+    """只读查询; ttl=0 表示不走缓存"""
+    if params is None: params = {}
+    if not ttl:
+        return _read(query_str, params)
+    key = cache.make_key(query_str, params)
+    df = cache.get(key)
+    if df is None:
+        df = _read(query_str, params)
+        cache.put(key, query_str, params, df, ttl)
+    return df
+
+
+@instrument.timed("run_query:数据库")
+def _read(query_str, params):
+    with get_engine().connect() as c:
+        return pd.read_sql(text(query_str), c, params=params)
+
+
+def run_transaction(query_str, params):
+    with unit_of_work("run_transaction", params.get("owner"), query_cache.write_tables(query_str),
+                      params.get("mid")) as c:
+        c.execute(text(query_str), params)
+
+
+# --- 4. 业务操作 (每个都是一条语句) ---
+# 余额一律在数据库里按增量改 (balance = balance ± :amt), 不用页面上早先读到的余额
+# 算好再写回; 两台平板同时给一个会员结账也不会丢更新, 行锁只在这一条语句里持有。
+class InsufficientBalance(Exception):
+    """扣款时余额不够 (可能刚在别的设备上消费过)"""
+
+
+class StaleBalance(Exception):
+    """会员管理改余额时, 余额已经被别的设备改过"""
+
+
+SQL_RECHARGE = """
+    WITH acc AS (
+        UPDATE accounts SET balance = balance + :amt, current_discount = :disc
+        WHERE member_id = :mid
+        RETURNING member_id, balance
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, owner_username)
+        SELECT member_id, 'RECHARGE', :amt, :detail, NOW(), :owner FROM acc
+        RETURNING id
+    )
+    SELECT balance FROM acc
+"""
+
+# 消费明细 (见 line_items.py): 接在 RETURNING id, date 的 t 后面, 和流水一起写
+SQL_ITEMS_CTE = """items AS (
+        INSERT INTO transaction_items (transaction_id, owner_username, date, category, item, price, amount_share)
+        SELECT t.id, :owner, t.date, i.category, i.item, i.price, i.share
+        FROM t, unnest(CAST(:item_cat AS text[]), CAST(:item_name AS text[]),
+                       CAST(:item_price AS numeric[]), CAST(:item_share AS numeric[]))
+            AS i(category, item, price, share)
+    )"""
+
+# 余额够才扣 (条件更新), 扣成功了才写签名、流水和明细; 签名按内容哈希写进
+# signature_blobs (已存在就跳过), 流水里只存哈希
+SQL_CHECKOUT = f"""
+    WITH acc AS (
+        UPDATE accounts SET balance = balance - :amt
+        WHERE member_id = :mid AND balance >= :amt
+        RETURNING member_id, balance
+    ), sig AS (
+        INSERT INTO signature_blobs (hash, strokes, png, thumb)
+        SELECT CAST(:sig_hash AS text), CAST(:sig_strokes AS bytea), CAST(:sig_png AS bytea), CAST(:sig_thumb AS bytea)
+        WHERE CAST(:sig_hash AS text) IS NOT NULL AND EXISTS (SELECT 1 FROM acc)
+        ON CONFLICT (hash) DO NOTHING
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, signature_hash, owner_username)
+        SELECT member_id, 'SPEND', :amt, :detail, NOW(), :sig_hash, :owner FROM acc
+        RETURNING id, date
+    ), {SQL_ITEMS_CTE}
+    SELECT balance FROM acc
+"""
+
+# 开卡: 会员 + 账户 + (可选) 开卡充值流水, 新会员 id 直接 RETURNING, 不再回查
+SQL_CREATE_MEMBER = """
+    WITH m AS (
+        INSERT INTO members (name, phone, birthday, note, owner_username)
+        VALUES (:name, :phone, :birthday, :note, :owner)
+        RETURNING id
+    ), acc AS (
+        INSERT INTO accounts (member_id, balance, current_discount)
+        SELECT id, :amt, :disc FROM m
+        RETURNING member_id
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, owner_username)
+        SELECT member_id, 'RECHARGE', :amt, :detail, NOW(), :owner FROM acc
+        WHERE :amt > 0
+        RETURNING id
+    )
+    SELECT id FROM m
+"""
+
+SQL_UPDATE_MEMBER = """
+    UPDATE members
+    SET name = :name, phone = :phone, birthday = :birth, note = :note
+    WHERE id = :mid AND owner_username = :owner
+    RETURNING id
+"""
+
+# 改了余额: 只有余额还是页面上看到的那个值才写 (乐观并发), 否则整条不生效;
+# 差额记一笔 ADJUST 流水 (可正可负), 对账时流水加起来仍然等于余额
+SQL_UPDATE_MEMBER_BALANCE = """
+    WITH m AS (
+        UPDATE members
+        SET name = :name, phone = :phone, birthday = :birth, note = :note
+        WHERE id = :mid AND owner_username = :owner
+        RETURNING id
+    ), acc AS (
+        UPDATE accounts SET balance = :bal
+        WHERE member_id IN (SELECT id FROM m) AND balance = CAST(:old_bal AS numeric)
+        RETURNING member_id
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, owner_username)
+        SELECT member_id, 'ADJUST', CAST(:bal AS numeric) - CAST(:old_bal AS numeric), :detail, NOW(), :owner
+        FROM acc
+        RETURNING id
+    )
+    SELECT member_id FROM acc
+"""
+
+
+def recharge(owner, member_id, amount, new_discount):
+    """会员充值: 余额 + amount、改折扣 + 记一笔 RECHARGE, 返回充值后的余额"""
+    with unit_of_work("recharge", owner, ("accounts", "transactions"), member_id) as c:
+        return float(c.execute(text(SQL_RECHARGE), {
+            "mid": member_id, "disc": new_discount, "amt": amount,
+            "detail": f"充值{amount}, 折扣变{new_discount:.2f}", "owner": owner,
+        }).scalar())
+
+
+def checkout(owner, member_id, amount, detail, signature, items=()):
+    """消费结账: 余额够就扣 + 记一笔 SPEND (+ 签名 + 明细), 返回扣款后的余额; 不够抛 InsufficientBalance。
+    items 是 [(大类, 项目, 标价或 None)]"""
+    import line_items
+    import signatures
+    params = {
+        "mid": member_id, "amt": amount, "detail": detail, "owner": owner,
+        **signatures.blob_params(signature), **line_items.item_params(items, amount),
+    }
+    with unit_of_work("checkout", owner, ("accounts", "transactions", "transaction_items"), member_id) as c:
+        balance = c.execute(text(SQL_CHECKOUT), params).scalar()
+    if balance is None:
+        raise InsufficientBalance()
+    return float(balance)
+
+
+def create_member(owner, name, phone, birthday, note, initial_amount, initial_discount):
+    """新建会员并开卡, 返回新会员 id"""
+    with unit_of_work("create_member") as c:
+        mid = c.execute(text(SQL_CREATE_MEMBER), {
+            "name": name, "phone": phone, "birthday": birthday, "note": note, "owner": owner,
+            "amt": initial_amount, "disc": initial_discount,
+            "detail": f"开卡充值{initial_amount}, 初始折扣{initial_discount}",
+        }).scalar()
+    # 新会员不会有会员级缓存, 只清店铺级的
+    cache.invalidate(owner, ("members", "accounts", "transactions"), mid)
+    return mid
+
+
+def update_member(owner, member_id, name, phone, birthday, note, balance, old_balance):
+    """会员管理: 资料 + 余额一起保存, 改了余额记一笔 ADJUST;
+    余额在这期间被别处改过则抛 StaleBalance (资料也不保存)。
+    balance / old_balance 是页面上显示的, 含本地日志 (journal.py) 还没补写的增量"""
+    import journal
+    # 库里的余额不含未同步的部分: 比较和写入都先扣掉, 补写时再加上去, 不会算两遍
+    delta = journal.pending([member_id]).get(member_id, [0.0])[0]
+    params = {
+        "name": name, "phone": phone, "birth": birthday, "note": note,
+        "mid": member_id, "owner": owner, "bal": round(balance - delta, 2), "old_bal": round(old_balance - delta, 2),
+        "detail": f"会员管理调整余额 {old_balance:.2f} → {balance:.2f}",
+    }
+    with unit_of_work("update_member", owner, ("members", "accounts", "transactions"), member_id) as c:
+        if balance == old_balance:
+            c.execute(text(SQL_UPDATE_MEMBER), params)
+        elif c.execute(text(SQL_UPDATE_MEMBER_BALANCE), params).scalar() is None:
+            raise StaleBalance()
+
+
+# --- 5. 按 id 取会员 (配合 search_index 的搜索结果) ---
+def members_by_ids(owner, ids, ttl=query_cache.DEFAULT_TTL):
+    """按搜索结果的顺序返回会员及账户信息; ttl=0 直接查库 (别的进程写的余额不会在缓存里过期前看不到)"""
+    if not ids:
+        return pd.DataFrame(columns=["id", "name", "phone", "balance", "current_discount"])
+    df = run_query("""
+        SELECT m.id, m.name, m.phone, a.balance, a.current_discount
+        FROM members m
+        JOIN accounts a ON m.id = a.member_id
+        WHERE m.owner_username = :owner AND m.id = ANY(:ids)
+    """, {"owner": owner, "ids": list(ids)}, ttl=ttl)
+    order = {mid: i for i, mid in enumerate(ids)}
+    return _with_pending(df.sort_values("id", key=lambda s: s.map(order)).reset_index(drop=True))
+
+
+def _with_pending(df):
+    """开了本地日志 (journal.py) 时, 余额加上还没补写到库里的部分"""
+    import journal
+    return journal.overlay(df)
+
+
+# --- 6. 账目查询 (按 t.id 键集分页, 合计在数据库里算) ---
+def _ledger_where(owner, member_ids=None, start_date=None, end_date=None):
+    """账目查询的公共过滤条件; member_ids=None 表示不按会员过滤, end_date 不含当天"""
+    where = ["t.owner_username = :owner"]
+    params = {"owner": owner}
+    if member_ids is not None:
+        where.append("t.member_id = ANY(:ids)")
+        params["ids"] = list(member_ids) or [0]
+    if start_date is not None:
+        where.append("t.date >= :start_date")
+        params["start_date"] = start_date
+    if end_date is not None:
+        where.append("t.date < :end_date")
+        params["end_date"] = end_date
+    return " AND ".join(where), params
+
+
+def ledger_totals(owner, member_ids=None, start_date=None, end_date=None):
+    """整个日期范围的 笔数 / 充值合计 / 消费合计"""
+    where, params = _ledger_where(owner, member_ids, start_date, end_date)
+    df = run_query(f"""
+        SELECT COUNT(*) AS cnt,
+               COALESCE(SUM(t.amount) FILTER (WHERE t.type = 'RECHARGE'), 0) AS recharge,
+               COALESCE(SUM(t.amount) FILTER (WHERE t.type = 'SPEND'), 0) AS spend
+        FROM transactions t
+        WHERE {where}
+    """, params)
+    row = df.iloc[0]
+    # 日期范围碰到已归档的月份时加上归档文件里的部分
+    import archive
+    cnt, recharge, spend = archive.totals(owner, member_ids, start_date, end_date)
+    return int(row["cnt"]) + cnt, float(row["recharge"]) + recharge, float(row["spend"]) + spend
+
+
+def ledger_page(owner, member_ids=None, start_date=None, end_date=None, before_id=None, page_size=50,
+                ttl=query_cache.DEFAULT_TTL):
+    """取一页流水 (t.id 倒序, 只取 id < before_id 的), 返回 (DataFrame, 是否还有下一页)"""
+    where, params = _ledger_where(owner, member_ids, start_date, end_date)
+    if before_id is not None:
+        where += " AND t.id < :before_id"
+        params["before_id"] = before_id
+    params["limit"] = page_size + 1
+    df = run_query(f"""
+        SELECT t.id, t.date, m.name, m.phone, t.type, t.amount, t.detail, t.signature_hash
+        FROM transactions t
+        JOIN members m ON t.member_id = m.id
+        WHERE {where}
+        ORDER BY t.id DESC
+        LIMIT :limit
+    """, params, ttl=ttl)
+    # 热表和归档各取一页再合并 (归档的多是更早的流水, 翻到后面才会用上)
+    import archive
+    cold = archive.page(owner, member_ids, start_date, end_date, before_id, page_size + 1)
+    if cold is not None and not cold.empty:
+        df = pd.concat([df, cold], ignore_index=True).sort_values("id", ascending=False, ignore_index=True)
+        df = df.head(page_size + 1)
+    return df.head(page_size), len(df) > page_size
+
+
+# --- 7. 会员管理列表 ---
+def member_list(owner, ids):
+    """会员管理的搜索结果: 按 ids 的顺序只取这些 (整家店的列表见 member_stats.directory)"""
+    df = run_query("""
+        SELECT m.id, m.name, m.phone, m.birthday, m.note, m.created_at,
+               a.balance, a.current_discount
+        FROM members m
+        LEFT JOIN accounts a ON m.id = a.member_id
+        WHERE m.owner_username = :owner AND m.id = ANY(:ids)
+    """, {"owner": owner, "ids": list(ids) or [0]})
+    if not df.empty:
+        order = {mid: i for i, mid in enumerate(ids)}
+        df = df.sort_values("id", key=lambda s: s.map(order)).reset_index(drop=True)
+    return _with_pending(df)
+
+
+# --- 8. 顾客自助查询 ---
+# 柜台摆了二维码后, 顾客查询会一阵一阵地来, 不能占满收银台要用的连接:
+# 一条语句查出所有会员卡 + 每张卡最近几笔, 结果按 (姓名, 手机号) 缓存
+# CUSTOMER_TTL 秒; 没命中缓存时最多 CUSTOMER_DB_SLOTS 个查询同时用连接,
+# 等 CUSTOMER_WAIT 秒还排不上就报 Busy。
+CUSTOMER_TTL = 30
+CUSTOMER_DB_SLOTS = 2
+CUSTOMER_WAIT = 3
+_customer_slots = threading.BoundedSemaphore(CUSTOMER_DB_SLOTS)
+
+
+class Busy(Exception):
+    """顾客查询排队超时"""
+
+
+# verified: 这笔已经过了哈希链校验 (audit.py 的检查点之内)
+SQL_CUSTOMER_LOOKUP = """
+    WITH mem AS (
+        SELECT m.id, m.name, a.balance, s.shop_name, a.current_discount, m.owner_username
+        FROM members m
+        JOIN accounts a ON m.id = a.member_id
+        JOIN shop_owners s ON m.owner_username = s.username
+        WHERE m.phone = :phone AND m.name = :name
+    ), recent AS (
+        SELECT t.member_id, t.id AS tx_id, t.date, t.type, t.amount, t.detail, t.audit_seq,
+               ROW_NUMBER() OVER (PARTITION BY t.member_id ORDER BY t.id DESC) AS rn
+        FROM transactions t
+        WHERE t.member_id IN (SELECT id FROM mem)
+    )
+    SELECT mem.id, mem.name, mem.balance, mem.shop_name, mem.current_discount,
+           r.tx_id, r.date, r.type, r.amount, r.detail, COALESCE(r.audit_seq <= cp.seq, false) AS verified
+    FROM mem
+    LEFT JOIN recent r ON r.member_id = mem.id AND r.rn <= :limit
+    LEFT JOIN audit_checkpoints cp ON cp.owner_username = mem.owner_username
+    ORDER BY mem.id, r.tx_id DESC
+"""
+
+
+@instrument.timed("customer_lookup")
+def customer_lookup(name, phone, limit=5):
+    """顾客在各家店的会员卡 + 最近 limit 笔流水, 一行一笔 (没有流水的卡 tx_id 为空)"""
+    params = {"name": name, "phone": phone, "limit": limit}
+    key = cache.make_key(SQL_CUSTOMER_LOOKUP, params)
+    df = cache.get(key)
+    if df is not None:
+        return _with_pending(df)
+    if not _customer_slots.acquire(timeout=CUSTOMER_WAIT):
+        raise Busy()
+    try:
+        df = _read(SQL_CUSTOMER_LOOKUP, params)
+    finally:
+        _customer_slots.release()
+    # 查到了就只跟这几张卡有关, 别的会员结账不用清掉它
+    ids = frozenset(int(i) for i in df["id"].unique())
+    cache.put(key, SQL_CUSTOMER_LOOKUP, params, df, CUSTOMER_TTL, members=ids or None)
+    return _with_pending(df)
@@ -0,0 +1,249 @@
+"""查询计划回归检查: 热点查询不能退化成全表扫描
+
+    export DATABASE_URL=postgresql+psycopg2://localhost/nail_bench
+    python explain_check.py            # 没有测试数据时先自动 seed
+    python explain_check.py --seed     # 重新生成测试数据再检查
+
+做法: 在本地库 (seed.py 合成数据) 上把 benchmark.py 里每个页面操作跑一遍,
+用 SQLAlchemy 事件抓下实际发出的每条语句和参数, 逐条 EXPLAIN (写语句也只
+EXPLAIN 不执行), 计划里对大表出现 Seq Scan 就算失败。
+
+另外扫一遍源码 (AST) 里的 SQL 字符串:
+- 页面 (streamlit_app.py / ui.py / app_pages/) 里不应该再有 SQL (都放到 db.py 等模块), 有就失败;
+- 其他模块里没被任何操作跑到的 SQL 列出来提醒 (--strict 时也算失败),
+  新加查询时记得在 benchmark.OPERATIONS 或下面的 EXTRA_OPERATIONS 里登记。
+"""
+import argparse
+import ast
+import glob
+import io
+import json
+import random
+import re
+import sys
+from datetime import date, timedelta
+
+import pandas as pd
+from sqlalchemy import event, text
+
+import auth
+import benchmark
+import bulk
+import catalog
+import db
+import migrations
+import seed
+
+# 数据量上来后必须走索引的表
+LARGE_TABLES = {"members", "accounts", "transactions", "signature_blobs", "member_stats"}
+
+# 本来就要读一整家店的操作, 允许对这些表顺序扫描
+ALLOW_SEQ_SCAN = {
+    "索引加载": {"members"},
+    "会员名录-首页": {"member_stats"},     # 不带筛选的总人数 (COUNT), 列表本身走索引
+    "导出账目": {"members"},
+}
+
+# 一次性迁移 / 维护脚本 (函数或 SQL 常量), 或者只有旧数据才会走到的分支, 不要求有操作跑到
+COLD_FUNCTIONS = {"rollup.rebuild", "rollup.REBUILD_SQL", "rollup.ADD_ARCHIVED_SQL",
+                  "member_stats.rebuild", "member_stats.REBUILD_SQL",
+                  "signatures.backfill_thumbnails", "signatures.convert_pngs",
+                  "auth.hash_existing", "auth._upgrade_plaintext",
+                  "line_items.backfill", "catalog.seed_defaults",
+                  "archive.candidates", "archive.archive_month", "archive.all_frames", "archive.owner_frames",
+                  "archive.chained_frames", "archive.status"}
+
+# 页面脚本: 里面不应该有 SQL
+UI_MODULES = ["streamlit_app.py", "ui.py", *sorted(glob.glob("app_pages/*.py"))]
+SCAN_MODULES = [*UI_MODULES, "db.py", "rollup.py", "signatures.py", "auth.py", "bulk.py", "line_items.py",
+                "catalog.py", "archive.py", "member_stats.py"]
+SQL_START = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+
+
+def op_login(ctx):
+    auth.authenticate(ctx.owner(), "bench")
+
+
+def op_export(ctx):
+    bulk.export_ledger(ctx.owner(), io.StringIO(), *benchmark._month_range())
+
+
+def op_import_check(ctx):
+    m = ctx.member()
+    bulk.existing_phones(m.owner_username, [m.phone, "19900000000"])
+
+
+def op_member_save(ctx):
+    m = ctx.member()
+    row = db.member_list(m.owner_username, [m.id]).iloc[0]
+    bal = float(row["balance"])
+    db.update_member(m.owner_username, m.id, row["name"], row["phone"], None, row["note"], bal, bal)
+    db.update_member(m.owner_username, m.id, row["name"], row["phone"], None, row["note"], bal + 1, bal)
+
+
+def op_catalog_save(ctx):
+    owner = ctx.owner()
+    catalog.save(owner, catalog.get(owner).df)
+
+
+def op_ledger_with_archive(ctx):
+    """一年范围, 翻到归档的月份 (没归档过时和普通翻页一样)"""
+    m = ctx.member()
+    start, end = date.today() - timedelta(days=365), date.today()
+    db.ledger_totals(m.owner_username, [m.id], start, end)
+    db.ledger_page(m.owner_username, [m.id], start, end, page_size=50)
+
+
+def op_import(ctx):
+    ctx.new_phone_seq += 2
+    clean, _ = bulk.validate(pd.DataFrame({
+        "name": ["导入检查", "导入检查"],
+        "phone": [f"18{(ctx.new_phone_seq + i) % 10**9:09d}" for i in range(2)],
+        "balance": ["100", ""],
+    }), ctx.owner())
+    bulk.import_members(ctx.owner(), clean)
+
+
+EXTRA_OPERATIONS = {
+    "店主登录": op_login,
+    "会员管理-保存": op_member_save,
+    "导出账目": op_export,
+    "导入查重": op_import_check,
+    "批量导入": op_import,
+    "项目管理-保存": op_catalog_save,
+    "账目-含归档": op_ledger_with_archive,
+}
+
+
+# --- 1. 抓语句 ---
+def capture(operations, ctx):
+    """跑一遍每个操作, 返回 [(操作名, 语句, 参数)], 同一条语句只留第一次"""
+    seen, out = set(), []
+    current = [None]
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        # pandas 自己会查 pg_catalog (判断表是否存在), 不算业务查询
+        if executemany or not SQL_START.match(statement) or "pg_catalog" in statement or statement in seen:
+            return
+        seen.add(statement)
+        out.append((current[0], statement, parameters))
+
+    engine = db.get_engine()
+    event.listen(engine, "before_cursor_execute", before)
+    try:
+        for name, fn in operations.items():
+            current[0] = name
+            db.cache.clear()
+            fn(ctx)
+    finally:
+        event.remove(engine, "before_cursor_execute", before)
+    return out
+
+
+# --- 2. EXPLAIN ---
+def seq_scans(plan):
+    """计划树里所有顺序扫描的表名"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def explain(statement, parameters):
+    raw = db.get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        plan = cur.fetchone()[0]
+        raw.rollback()
+    finally:
+        raw.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+# --- 3. 源码里的 SQL ---
+def _normalize(sql):
+    sql = re.sub(r"%\(\w+\)s|(?<!:):\w+", "?", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def source_sql(path):
+    """文件里的 SQL 字符串: [(行号, [固定片段])]; f-string 只取其中的固定部分,
+    COLD_FUNCTIONS 里的函数跳过"""
+    module = path[:-3]
+    tree = ast.parse(open(path, encoding="utf-8").read())
+    found = []
+    for top in tree.body:
+        name = getattr(top, "name", None)
+        if isinstance(top, ast.Assign) and isinstance(top.targets[0], ast.Name):
+            name = top.targets[0].id
+        if f"{module}.{name}" in COLD_FUNCTIONS:
+            continue
+        for node in ast.walk(top):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                parts = [node.value]
+            elif isinstance(node, ast.JoinedStr):
+                parts = [v.value for v in node.values if isinstance(v, ast.Constant)]
+            else:
+                continue
+            if parts and SQL_START.match(parts[0]) and re.search(r"\b(FROM|INTO|SET)\b", " ".join(parts), re.I):
+                found.append((node.lineno, [p for p in map(_normalize, parts) if p]))
+    # f-string 里的常量片段也会被单独遍历到, 去掉被包含的重复项
+    return [f for f in found if not any(f is not g and f[0] == g[0] and len(g[1]) > len(f[1]) for g in found)]
+
+
+def uncovered(statements):
+    executed = [_normalize(s) for _, s, _ in statements]
+    missing = []
+    for path in SCAN_MODULES:
+        for lineno, parts in source_sql(path):
+            if not any(all(p in e for p in parts) for e in executed):
+                missing.append((path, lineno, parts[0][:70]))
+    return missing
+
+
+def check(strict=False):
+    seed.check_local()
+    ctx = benchmark.Context(random.Random(7))
+    statements = capture({**benchmark.OPERATIONS, **EXTRA_OPERATIONS}, ctx)
+
+    ok = True
+    print(f"共 {len(statements)} 条不同的语句\n")
+    for op, statement, params in statements:
+        tables = set(seq_scans(explain(statement, params)))
+        bad = (tables & LARGE_TABLES) - ALLOW_SEQ_SCAN.get(op, set())
+        if bad:
+            ok = False
+            print(f"❌ [{op}] 全表扫描 {', '.join(sorted(bad))}:\n    {_normalize(statement)[:160]}")
+        else:
+            print(f"✅ [{op}] {_normalize(statement)[:90]}")
+
+    print()
+    for path, lineno, head in uncovered(statements):
+        if path in UI_MODULES:
+            ok = False
+            print(f"❌ {path}:{lineno} 页面里直接写了 SQL, 请移到 db.py: {head}")
+        else:
+            ok = ok and not strict
+            print(f"⚠️ {path}:{lineno} 没有操作跑到这条 SQL: {head}")
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seed", action="store_true", help="先重新生成测试数据")
+    ap.add_argument("--strict", action="store_true", help="没跑到的 SQL 也算失败")
+    a = ap.parse_args()
+    seed.check_local()
+    if a.seed:
+        seed.seed(shops=3, members=2000, transactions=50000, reset=True)
+    else:
+        migrations.migrate()
+        with db.get_engine().connect() as c:
+            if not c.execute(text("SELECT 1 FROM shop_owners WHERE username LIKE 'bench_shop_%'")).first():
+                seed.seed(shops=3, members=2000, transactions=50000)
+    sys.exit(0 if check(a.strict) else 1)
@@ -0,0 +1,152 @@
+"""热点路径埋点: 每次重跑的查询耗时、行数、数据量
+
+开发者用。环境变量 NAIL_DIAG=1 时侧边栏出现 "性能诊断" 开关, 打开后
+每次重跑记录被 @timed / span() 包住的调用, 按页面汇总, 并追加到
+NAIL_DIAG_LOG (默认 diagnostics.jsonl) 供离线分析。
+
+没打开时被包住的函数只多一次 threading.local 属性查找。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+AVAILABLE = os.environ.get("NAIL_DIAG") == "1"
+LOG_PATH = os.environ.get("NAIL_DIAG_LOG", "diagnostics.jsonl")
+
+# 每个脚本线程当前正在记录的重跑 (没在记录时为 None)
+_local = threading.local()
+_log_lock = threading.Lock()
+
+# 进程级: 页面 -> {"reruns": 次数, "wall_ms": 总耗时, "calls": {调用名: [次数, 毫秒, 行数, 字节]}}
+PAGE_STATS = {}
+
+
+class Rerun:
+    def __init__(self, page=None):
+        self.page = page
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.last_end = self.t0
+        self.calls = []          # [(调用名, 毫秒, 行数, 字节)]
+        self.wall_ms = None
+
+    def add(self, name, ms, rows, nbytes):
+        self.calls.append((name, ms, rows, nbytes))
+        self.last_end = time.perf_counter()
+
+
+def _size(result):
+    """估算返回值的 行数 / 字节数"""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if hasattr(result, "memory_usage"):          # DataFrame
+        return len(result), int(result.memory_usage(index=False).sum())
+    if isinstance(result, (bytes, bytearray, str)):
+        return None, len(result)
+    return None, None
+
+
+def timed(name):
+    """装饰器: 记录函数的耗时和返回值大小"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rerun = getattr(_local, "rerun", None)
+            if rerun is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            finally:
+                rows, nbytes = _size(result)
+                rerun.add(name, (time.perf_counter() - t0) * 1000, rows, nbytes)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def span(name):
+    """代码块版的 timed, 用于不方便拆成函数的地方"""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rerun.add(name, (time.perf_counter() - t0) * 1000, None, None)
+
+
+def start_rerun(page=None):
+    rerun = _local.rerun = Rerun(page)
+    return rerun
+
+
+def stop_recording():
+    _local.rerun = None
+
+
+def set_page(page):
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun.page = page
+
+
+def finish_rerun(rerun):
+    """结束一次重跑: 计入页面汇总并写日志。被 st.stop() 提前打断的重跑
+    会在下一次重跑开始时补上, 耗时算到最后一次记录的调用为止"""
+    if rerun.wall_ms is not None:
+        return
+    if getattr(_local, "rerun", None) is rerun:
+        rerun.wall_ms = (time.perf_counter() - rerun.t0) * 1000
+        _local.rerun = None
+    else:
+        rerun.wall_ms = (rerun.last_end - rerun.t0) * 1000
+
+    page = rerun.page or "-"
+    stats = PAGE_STATS.setdefault(page, {"reruns": 0, "wall_ms": 0.0, "calls": {}})
+    stats["reruns"] += 1
+    stats["wall_ms"] += rerun.wall_ms
+    for name, ms, rows, nbytes in rerun.calls:
+        agg = stats["calls"].setdefault(name, [0, 0.0, 0, 0])
+        agg[0] += 1
+        agg[1] += ms
+        agg[2] += rows or 0
+        agg[3] += nbytes or 0
+
+    line = json.dumps({
+        "ts": rerun.started_at, "page": page, "wall_ms": round(rerun.wall_ms, 2),
+        "calls": [{"name": n, "ms": round(ms, 2), "rows": r, "bytes": b} for n, ms, r, b in rerun.calls],
+    }, ensure_ascii=False)
+    try:
+        with _log_lock, open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass
+
+
+def summarize(calls):
+    """按调用名合并一次重跑里的记录"""
+    out = {}
+    for name, ms, rows, nbytes in calls:
+        agg = out.setdefault(name, {"调用": name, "次数": 0, "耗时ms": 0.0, "行数": 0, "字节": 0})
+        agg["次数"] += 1
+        agg["耗时ms"] += ms
+        agg["行数"] += rows or 0
+        agg["字节"] += nbytes or 0
+    return sorted(out.values(), key=lambda r: -r["耗时ms"])
+
+
+def page_summary():
+    """各页面平均每次重跑的耗时"""
+    return [
+        {"页面": page, "重跑次数": s["reruns"], "平均耗时ms": s["wall_ms"] / s["reruns"],
+         "平均调用次数": sum(c[0] for c in s["calls"].values()) / s["reruns"]}
+        for page, s in PAGE_STATS.items()
+    ]
@@ -0,0 +1,341 @@
+"""本地预写日志: 结账 / 充值先记在本机, 立即返回, 后台补写到数据库
+
+收银台到 Supabase 的网络慢或者断了的时候, 结账不用等远端提交:
+- 每笔操作先追加到本机 SQLite (WAL + synchronous=FULL, 断电也不丢), 马上确认;
+- 后台线程按顺序每次取 BATCH 笔, 在一个事务里补写; 每笔带幂等键
+  (transactions.idempotency_key), 重放只记一次; 连不上就指数退避重试;
+- 页面上的余额会加上还没补写的增量, 侧边栏显示待同步的笔数。
+
+日志文件必须放在持久卷上: 已经确认过的结账只记在这个文件里, 容器重启 / 重新部署
+把它清掉就永远丢了 (Streamlit Cloud 这类托管环境的本地磁盘都是临时的)。
+开启: 环境变量 NAIL_JOURNAL=/持久卷/journal.db 加 NAIL_JOURNAL_PERSISTENT=1, 或 secrets.toml 里
+    [journal]
+    path = "/持久卷/journal.db"
+    persistent = true
+只配了路径、没声明是持久卷时不记新的, checkout / recharge 直接走 db 里的同名函数
+(同步写库); 文件里原来没同步完的照样补写。没配置路径时也是直接写库。
+日志只在本机: 多台设备都开时, 各自只看得到自己还没同步的那部分。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+import db
+import line_items
+import signatures
+from query_cache import cache
+
+log = logging.getLogger("nail_salon.journal")
+
+BATCH = 50
+FLUSH_INTERVAL = 2      # 没有新记录时多久检查一次 (秒)
+MAX_BACKOFF = 60
+KEEP_DAYS = 7           # 已同步的记录留几天再删 (方便对账)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+        key         TEXT NOT NULL UNIQUE,
+        op          TEXT NOT NULL,              -- checkout / recharge
+        owner       TEXT NOT NULL,
+        member_id   INTEGER NOT NULL,
+        amount      REAL NOT NULL,
+        detail      TEXT,
+        discount    REAL,
+        signature   BLOB,
+        items       TEXT,                       -- JSON [(大类, 项目, 标价)]
+        created_at  REAL NOT NULL,
+        flushed_at  REAL,
+        attempts    INTEGER NOT NULL DEFAULT 0,
+        last_error  TEXT
+    );
+    CREATE INDEX IF NOT EXISTS entries_pending ON entries (seq) WHERE flushed_at IS NULL;
+"""
+
+# 补写语句: 先按幂等键插流水, 插进去了才按增量改余额 (已经写过的重放什么都不做)。
+# 已有的键要先用 NOT EXISTS 挑掉: 哈希链的 BEFORE INSERT 触发器在 ON CONFLICT 判断之前
+# 就会推进链头, 被 DO NOTHING 丢掉的行也会在链上留下一个空号。ON CONFLICT 只兜底并发重放。
+# 这些笔在柜台上已经确认过了, 补写时不再检查余额够不够
+SQL_APPLY_CHECKOUT = f"""
+    WITH sig AS (
+        INSERT INTO signature_blobs (hash, strokes, png, thumb)
+        SELECT CAST(:sig_hash AS text), CAST(:sig_strokes AS bytea), CAST(:sig_png AS bytea), CAST(:sig_thumb AS bytea)
+        WHERE CAST(:sig_hash AS text) IS NOT NULL
+        ON CONFLICT (hash) DO NOTHING
+    ), t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, signature_hash,
+                                  owner_username, idempotency_key)
+        SELECT member_id, 'SPEND', :amt, :detail, :date, :sig_hash, :owner, :key
+        FROM accounts WHERE member_id = :mid
+          AND NOT EXISTS (SELECT 1 FROM transactions WHERE idempotency_key = :key)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING member_id, id, date
+    ), {db.SQL_ITEMS_CTE}
+    UPDATE accounts SET balance = balance - :amt
+    WHERE member_id IN (SELECT member_id FROM t)
+"""
+
+SQL_APPLY_RECHARGE = """
+    WITH t AS (
+        INSERT INTO transactions (member_id, type, amount, detail, date, owner_username, idempotency_key)
+        SELECT member_id, 'RECHARGE', :amt, :detail, :date, :owner, :key
+        FROM accounts WHERE member_id = :mid
+          AND NOT EXISTS (SELECT 1 FROM transactions WHERE idempotency_key = :key)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING member_id
+    )
+    UPDATE accounts SET balance = balance + :amt, current_discount = :disc
+    WHERE member_id IN (SELECT member_id FROM t)
+"""
+
+_conn = None
+_lock = threading.Lock()          # 保护 _conn (sqlite 连接跨线程共用)
+_wake = threading.Event()
+_worker = None
+_last_error = None                # 最近一次整批失败 (连不上库等) 的原因
+
+
+def get_path():
+    path = os.environ.get("NAIL_JOURNAL")
+    if path:
+        return path
+    try:
+        import streamlit as st
+        return st.secrets["journal"]["path"]
+    except Exception:
+        return None
+
+
+def enabled():
+    """有日志文件 (补写 / 叠加余额 / 侧边栏状态都看这个)"""
+    return get_path() is not None
+
+
+_warned = False
+
+
+def durable():
+    """新的结账 / 充值能不能只记在本地: 要配了路径并且声明在持久卷上"""
+    global _warned
+    if not enabled():
+        return False
+    flag = os.environ.get("NAIL_JOURNAL_PERSISTENT")
+    if flag is None:
+        try:
+            import streamlit as st
+            flag = st.secrets["journal"].get("persistent", False)
+        except Exception:
+            flag = False
+    ok = str(flag).lower() in ("1", "true", "yes")
+    if not ok and not _warned:
+        _warned = True
+        log.warning("journal %s 没声明在持久卷上 (NAIL_JOURNAL_PERSISTENT / [journal] persistent), "
+                    "结账 / 充值改为直接写库", get_path())
+    return ok
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(get_path(), check_same_thread=False, isolation_level=None)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")
+        _conn.executescript(SCHEMA)
+        # 旧版本建的日志文件没有 items 列
+        if "items" not in {r["name"] for r in _conn.execute("PRAGMA table_info(entries)")}:
+            _conn.execute("ALTER TABLE entries ADD COLUMN items TEXT")
+    return _conn
+
+
+# --- 1. 收银台调用 (签名和 db.checkout / db.recharge 一样) ---
+def record(op, owner, member_id, amount, detail, discount=None, signature=None, items=None):
+    """追加一笔到本地日志, 返回幂等键"""
+    t0 = time.perf_counter()
+    key = uuid.uuid4().hex
+    items = json.dumps(list(items), ensure_ascii=False) if items is not None else None
+    with _lock:
+        _db().execute("""
+            INSERT INTO entries (key, op, owner, member_id, amount, detail, discount, signature, items, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (key, op, owner, member_id, amount, detail, discount, signature, items, time.time()))
+    start()
+    _wake.set()
+    db.TIMINGS.append((op, (time.perf_counter() - t0) * 1000))
+    return key
+
+
+def checkout(owner, member_id, amount, detail, signature, items=()):
+    """日志在持久卷上就只记一笔, 否则直接写库 (余额不够时 db.checkout 抛 InsufficientBalance)"""
+    if not durable():
+        return db.checkout(owner, member_id, amount, detail, signature, items)
+    return record("checkout", owner, member_id, amount, detail, signature=signature, items=items)
+
+
+def recharge(owner, member_id, amount, new_discount):
+    if not durable():
+        return db.recharge(owner, member_id, amount, new_discount)
+    return record("recharge", owner, member_id, amount, f"充值{amount}, 折扣变{new_discount:.2f}",
+                  discount=new_discount)
+
+
+# --- 2. 读余额时叠加未同步的部分 ---
+def pending(member_ids=None):
+    """未同步的 {会员id: [余额增量, 最新折扣或 None]}"""
+    if not enabled():
+        return {}
+    sql = "SELECT member_id, op, amount, discount FROM entries WHERE flushed_at IS NULL"
+    args = ()
+    if member_ids is not None:
+        member_ids = [int(i) for i in member_ids]
+        if not member_ids:
+            return {}
+        sql += f" AND member_id IN ({','.join('?' * len(member_ids))})"
+        args = member_ids
+    with _lock:
+        rows = _db().execute(sql + " ORDER BY seq", args).fetchall()
+    out = {}
+    for r in rows:
+        p = out.setdefault(r["member_id"], [0.0, None])
+        if r["op"] == "recharge":
+            p[0] += r["amount"]
+            p[1] = r["discount"]
+        else:
+            p[0] -= r["amount"]
+    return out
+
+
+def overlay(df):
+    """给带 id / balance (/ current_discount) 列的查询结果加上未同步的增量"""
+    if df.empty or "balance" not in df.columns or not enabled():
+        return df
+    for mid, (delta, disc) in pending(df["id"].unique()).items():
+        mask = df["id"] == mid
+        df.loc[mask, "balance"] = df.loc[mask, "balance"].astype(float) + delta
+        if disc is not None and "current_discount" in df.columns:
+            df.loc[mask, "current_discount"] = disc
+    return df
+
+
+def status():
+    """侧边栏用: 待同步笔数、最早一笔等了多久、出错原因"""
+    with _lock:
+        row = _db().execute("""
+            SELECT COUNT(*) AS n, MIN(created_at) AS oldest,
+                   (SELECT last_error FROM entries WHERE flushed_at IS NULL AND last_error IS NOT NULL
+                    ORDER BY seq LIMIT 1) AS err
+            FROM entries WHERE flushed_at IS NULL
+        """).fetchone()
+    n = row["n"]
+    return {
+        "pending": n,
+        "oldest_s": time.time() - row["oldest"] if n else None,
+        "error": (row["err"] or _last_error) if n else None,
+    }
+
+
+# --- 3. 后台补写 ---
+def start():
+    """启动补写线程 (已经在跑就什么都不做); 上次没写完的记录也会接着写"""
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="journal-flush", daemon=True)
+            _worker.start()
+
+
+def _run():
+    global _last_error
+    failures = 0
+    while True:
+        if failures:
+            time.sleep(min(MAX_BACKOFF, 2 ** failures))
+        else:
+            _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            while flush_once():
+                pass
+            failures, _last_error = 0, None
+        except Exception as e:
+            failures += 1
+            _last_error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            log.warning("本地日志补写失败 (第 %d 次): %s", failures, _last_error)
+
+
+def flush_once():
+    """补写一批, 返回是否可能还有下一批; 有写不进去的就抛异常 (由调用方退避重试)"""
+    with _lock:
+        rows = _db().execute("SELECT * FROM entries WHERE flushed_at IS NULL ORDER BY seq LIMIT ?",
+                             (BATCH,)).fetchall()
+    if not rows:
+        _purge()
+        return False
+    try:
+        _apply(rows)
+        done, error = rows, None
+    except (OperationalError, InterfaceError):
+        # 连不上库, 整批原样留着
+        raise
+    except Exception:
+        # 某一笔数据有问题: 逐笔重写, 把它挑出来, 别的照常
+        done, error = [], None
+        for r in rows:
+            try:
+                _apply([r])
+                done.append(r)
+            except Exception as e:
+                error = e
+                with _lock:
+                    _db().execute("UPDATE entries SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                                  (str(e).splitlines()[0], r["seq"]))
+    _mark_flushed(done)
+    if error is not None:
+        raise error
+    return len(rows) == BATCH
+
+
+def _apply(rows):
+    """一批记录在一个事务里写进库"""
+    with db.unit_of_work("journal_flush") as c:
+        for r in rows:
+            params = {
+                "key": r["key"], "mid": r["member_id"], "owner": r["owner"], "amt": r["amount"],
+                "detail": r["detail"], "date": datetime.fromtimestamp(r["created_at"], timezone.utc),
+            }
+            if r["op"] == "checkout":
+                # 旧版本记的没有 items, 从 detail 里拆
+                items = json.loads(r["items"]) if r["items"] else [
+                    (cat, item, None) for cat, item in line_items.parse_detail(r["detail"])]
+                res = c.execute(text(SQL_APPLY_CHECKOUT), {**params, **signatures.blob_params(r["signature"]),
+                                                           **line_items.item_params(items, r["amount"])})
+            else:
+                res = c.execute(text(SQL_APPLY_RECHARGE), {**params, "disc": r["discount"]})
+            # 没改到余额: 要么是已经写过的重放, 要么会员账户不在了; 后者不能当成已同步
+            if not res.rowcount and c.execute(text("SELECT 1 FROM transactions WHERE idempotency_key = :key"),
+                                              {"key": r["key"]}).first() is None:
+                raise LookupError(f"会员 {r['member_id']} 的账户不存在, 这笔没有写进去")
+
+
+def _mark_flushed(rows):
+    if not rows:
+        return
+    with _lock:
+        _db().executemany("UPDATE entries SET flushed_at = ?, last_error = NULL WHERE seq = ?",
+                          [(time.time(), r["seq"]) for r in rows])
+    # 远端提交到这里标记之间的一瞬间, 页面上的余额可能差这几笔, 下一次重跑就对了
+    for r in rows:
+        cache.invalidate(r["owner"], ("accounts", "transactions", "transaction_items"), r["member_id"])
+
+
+def _purge():
+    with _lock:
+        _db().execute("DELETE FROM entries WHERE flushed_at < ?", (time.time() - KEEP_DAYS * 86400,))
@@ -0,0 +1,109 @@
+"""消费明细: 每笔消费拆成 (大类, 项目, 标价, 分摊金额) 存进 transaction_items
+
+结账时和流水在同一条语句里写入 (db.SQL_ITEMS_CTE); 老流水只有 detail 字符串
+(如 "手部(卸甲,延长) + 备注[...]"), 用 parse_detail 拆开补进来:
+
+    python line_items.py backfill
+
+账目查询里的 "服务项目排行" 直接在这张表上按 店铺+日期 走索引聚合。
+"""
+import re
+import sys
+
+from sqlalchemy import text
+
+import db
+
+# 各段用 " + " 连接; 大类名里可以有空格 (取出来再去掉两头的空白)
+ITEM_RE = re.compile(r"(?:^|\+)\s*([^()]+?)\s*\(([^)]*)\)")
+NOTE_RE = re.compile(r"备注\[.*?\]")
+BATCH = 5000
+
+
+def parse_detail(detail):
+    """detail 字符串 -> [(大类, 项目)]; 备注不算项目"""
+    items = []
+    for cat, subs in ITEM_RE.findall(NOTE_RE.sub("", detail or "")):
+        items.extend((cat, s.strip()) for s in subs.split(",") if s.strip())
+    return items
+
+
+def item_params(items, amount):
+    """结账语句里写明细要用的数组参数; items 是 [(大类, 项目, 标价或 None)]。
+    实收金额按标价比例分摊 (有项目没标价时平均分), 分不尽的零头算在最后一项"""
+    items = list(items)
+    if not items:
+        return {"item_cat": [], "item_name": [], "item_price": [], "item_share": []}
+    prices = [p for _, _, p in items]
+    if all(p is not None for p in prices) and sum(prices) > 0:
+        weights = [p / sum(prices) for p in prices]
+    else:
+        weights = [1 / len(items)] * len(items)
+    shares = [round(amount * w, 2) for w in weights]
+    shares[-1] = round(amount - sum(shares[:-1]), 2)
+    return {
+        "item_cat": [c for c, _, _ in items], "item_name": [i for _, i, _ in items],
+        "item_price": prices, "item_share": shares,
+    }
+
+
+# --- 历史流水补明细 ---
+def backfill(c, batch=BATCH):
+    """给还没有明细的 SPEND 流水解析 detail 补上, 返回补了多少笔流水"""
+    after, n = 0, 0
+    while True:
+        rows = c.execute(text("""
+            SELECT t.id, t.owner_username, t.date, t.amount, t.detail
+            FROM transactions t
+            WHERE t.type = 'SPEND' AND t.id > :after
+              AND NOT EXISTS (SELECT 1 FROM transaction_items i WHERE i.transaction_id = t.id)
+            ORDER BY t.id
+            LIMIT :n
+        """), {"after": after, "n": batch}).all()
+        if not rows:
+            return n
+        cols = {k: [] for k in ("tid", "owner", "date", "item_cat", "item_name", "item_price", "item_share")}
+        for r in rows:
+            p = item_params([(cat, item, None) for cat, item in parse_detail(r.detail)], float(r.amount))
+            k = len(p["item_cat"])
+            cols["tid"] += [r.id] * k
+            cols["owner"] += [r.owner_username] * k
+            cols["date"] += [r.date] * k
+            for key in ("item_cat", "item_name", "item_price", "item_share"):
+                cols[key] += p[key]
+        c.execute(text("""
+            INSERT INTO transaction_items (transaction_id, owner_username, date, category, item, price, amount_share)
+            SELECT * FROM unnest(CAST(:tid AS integer[]), CAST(:owner AS text[]), CAST(:date AS timestamptz[]),
+                                 CAST(:item_cat AS text[]), CAST(:item_name AS text[]),
+                                 CAST(:item_price AS numeric[]), CAST(:item_share AS numeric[]))
+        """), cols)
+        after = rows[-1].id
+        n += len(rows)
+
+
+# --- 报表 ---
+def item_report(owner, start_date=None, end_date=None):
+    """日期范围内每个项目的 次数 / 分摊营收, 营收高的在前; end_date 不含当天"""
+    where = ["owner_username = :owner"]
+    params = {"owner": owner}
+    if start_date is not None:
+        where.append("date >= :start_date")
+        params["start_date"] = start_date
+    if end_date is not None:
+        where.append("date < :end_date")
+        params["end_date"] = end_date
+    return db.run_query(f"""
+        SELECT category, item, COUNT(*) AS cnt, SUM(amount_share) AS revenue
+        FROM transaction_items
+        WHERE {" AND ".join(where)}
+        GROUP BY category, item
+        ORDER BY revenue DESC, cnt DESC
+    """, params)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print(__doc__)
+        sys.exit(1)
+    with db.unit_of_work("backfill_items", tables=("transaction_items",)) as c:
+        print(f"✅ 已为 {backfill(c)} 笔消费补上明细")
@@ -0,0 +1,131 @@
+"""会员统计表 member_stats (余额, 到店次数, 最近到店, 累计消费 / 充值), 会员名录直接查它
+
+平时由触发器在写流水 / 改余额的同一个事务里更新 (见 migrations.py 版本 13):
+一笔 SPEND 算一次到店; 归档 (archive.py) 只删热表里的流水, 统计不受影响。
+和流水对不上时可以重建 (会把归档文件一起读进来):
+
+    python member_stats.py rebuild            # 全部店铺
+    python member_stats.py rebuild <店铺账号>  # 单个店铺
+"""
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+import archive
+import db
+
+REBUILD_SQL = """
+    INSERT INTO member_stats (member_id, owner_username, balance, visits, last_visit, total_spend, total_recharge)
+    SELECT m.id, m.owner_username, COALESCE(a.balance, 0),
+           COALESCE(t.visits, 0), t.last_visit, COALESCE(t.spend, 0), COALESCE(t.recharge, 0)
+    FROM members m
+    LEFT JOIN accounts a ON a.member_id = m.id
+    LEFT JOIN (
+        SELECT member_id,
+               COUNT(*) FILTER (WHERE type = 'SPEND') AS visits,
+               MAX(date) FILTER (WHERE type = 'SPEND') AS last_visit,
+               SUM(amount) FILTER (WHERE type = 'SPEND') AS spend,
+               SUM(amount) FILTER (WHERE type = 'RECHARGE') AS recharge
+        FROM transactions
+        GROUP BY member_id
+    ) t ON t.member_id = m.id
+    WHERE m.owner_username IS NOT NULL {owner_filter}
+"""
+
+
+def _archived_totals(c):
+    """归档文件里每个会员的 到店次数 / 最近到店 / 消费 / 充值"""
+    parts = []
+    for df in archive.all_frames(c, ["member_id", "type", "amount", "date"]):
+        spend, amount = df["type"] == "SPEND", df["amount"].astype(float)
+        parts.append(pd.DataFrame({
+            "member_id": df["member_id"], "visits": spend.astype(int), "last_visit": df["date"].where(spend),
+            "spend": amount.where(spend, 0.0), "recharge": amount.where(df["type"] == "RECHARGE", 0.0),
+        }))
+    if not parts:
+        return None
+    return (pd.concat(parts).groupby("member_id")
+            .agg(visits=("visits", "sum"), last_visit=("last_visit", "max"),
+                 spend=("spend", "sum"), recharge=("recharge", "sum")).reset_index())
+
+
+def rebuild(c, owner=None):
+    """在给定连接 (事务) 里重算统计; owner=None 表示全部店铺"""
+    params = {}
+    owner_filter = ""
+    if owner is not None:
+        owner_filter = "AND owner_username = :owner"
+        params["owner"] = owner
+    c.execute(text("DELETE FROM member_stats WHERE TRUE " + owner_filter), params)
+    c.execute(text(REBUILD_SQL.format(owner_filter=owner_filter.replace("owner_username", "m.owner_username"))),
+              params)
+    old = _archived_totals(c)
+    if old is None:
+        return
+    c.execute(text(f"""
+        UPDATE member_stats s
+        SET visits = s.visits + u.visits, last_visit = GREATEST(s.last_visit, u.last_visit),
+            total_spend = s.total_spend + u.spend, total_recharge = s.total_recharge + u.recharge
+        FROM unnest(CAST(:mid AS integer[]), CAST(:visits AS integer[]), CAST(:last AS timestamptz[]),
+                    CAST(:spend AS numeric[]), CAST(:recharge AS numeric[])) AS u(member_id, visits, last_visit, spend, recharge)
+        WHERE s.member_id = u.member_id {owner_filter.replace("owner_username", "s.owner_username")}
+    """), {**params, "mid": old["member_id"].astype(int).tolist(), "visits": old["visits"].astype(int).tolist(),
+           "last": [None if pd.isna(t) else t.to_pydatetime() for t in old["last_visit"]],
+           "spend": old["spend"].round(2).tolist(), "recharge": old["recharge"].round(2).tolist()})
+
+
+# --- 会员名录 ---
+# 排序方式 -> ORDER BY (同样的值再按会员 id 倒序, 翻页时顺序固定)
+SORTS = {
+    "最近到店": "last_visit DESC NULLS LAST",
+    "最久没来": "last_visit ASC NULLS FIRST",
+    "余额最高": "balance DESC",
+    "累计消费最多": "total_spend DESC",
+    "到店次数最多": "visits DESC",
+    "新会员在前": "member_id DESC",
+}
+
+
+def _where(owner, inactive_days=None, min_balance=None):
+    where = ["owner_username = :owner"]
+    params = {"owner": owner}
+    if inactive_days:
+        # 从来没消费过的也算
+        where.append("(last_visit IS NULL OR last_visit < NOW() - make_interval(days => :inactive_days))")
+        params["inactive_days"] = int(inactive_days)
+    if min_balance is not None:
+        where.append("balance > :min_balance")
+        params["min_balance"] = min_balance
+    return " AND ".join(where), params
+
+
+def directory(owner, inactive_days=None, min_balance=None, sort="最近到店", page=0, page_size=50):
+    """会员名录的一页 + 符合条件的总人数; 筛选 / 排序 / 分页都在 member_stats 上做,
+    姓名手机号只按这一页的 id 去 members 取。
+    余额是库里的, 不叠加本地日志 (journal.py) 还没补写的部分, 和余额筛选 / 排序对得上"""
+    where, params = _where(owner, inactive_days, min_balance)
+    total = int(db.run_query(f"SELECT COUNT(*) AS n FROM member_stats WHERE {where}", params).iloc[0]["n"])
+    df = db.run_query(f"""
+        SELECT member_id AS id, balance, visits, last_visit, total_spend, total_recharge
+        FROM member_stats
+        WHERE {where}
+        ORDER BY {SORTS[sort]}, member_id DESC
+        LIMIT :limit OFFSET :offset
+    """, {**params, "limit": page_size, "offset": page * page_size})
+    names = db.run_query("""
+        SELECT id, name, phone, created_at FROM members
+        WHERE owner_username = :owner AND id = ANY(:ids)
+    """, {"owner": owner, "ids": [int(i) for i in df["id"]] or [0]}).set_index("id")
+    df = df.assign(**{c: df["id"].map(names[c]) for c in names.columns})
+    return df, total
+
+
+if __name__ == "__main__":
+    if not sys.argv[1:] or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(1)
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    with db.unit_of_work("member_stats_rebuild", target, ("member_stats",)) as c:
+        rebuild(c, target)
+    print(f"✅ 已重建 {target or '全部店铺'} 的会员统计")
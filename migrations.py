@@ -0,0 +1,464 @@
+"""数据库结构版本管理
+
+    python migrations.py            # 升级到最新版本
+    python migrations.py status     # 查看已执行的版本
+
+当前版本记录在 schema_migrations 表里; 每个版本在一个事务里执行,
+失败整体回滚。新版本只能追加在 MIGRATIONS 末尾, 已发布的不要改。
+"""
+import sys
+
+from sqlalchemy import text
+
+import db
+
+# --- 版本 1: 现有的四张表 (Supabase 上已经存在时全部跳过) ---
+V1_BASELINE = """
+    CREATE TABLE IF NOT EXISTS shop_owners (
+        username   text PRIMARY KEY,
+        password   text NOT NULL,
+        shop_name  text NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS members (
+        id              serial PRIMARY KEY,
+        name            text NOT NULL,
+        phone           text NOT NULL,
+        birthday        date,
+        note            text,
+        owner_username  text REFERENCES shop_owners(username),
+        created_at      timestamptz NOT NULL DEFAULT NOW(),
+        UNIQUE (owner_username, phone)
+    );
+    CREATE TABLE IF NOT EXISTS accounts (
+        member_id         integer PRIMARY KEY REFERENCES members(id),
+        balance           numeric(12, 2) NOT NULL DEFAULT 0,
+        current_discount  numeric(4, 2) NOT NULL DEFAULT 1
+    );
+    CREATE TABLE IF NOT EXISTS transactions (
+        id              serial PRIMARY KEY,
+        member_id       integer REFERENCES members(id),
+        type            text NOT NULL,
+        amount          numeric(12, 2) NOT NULL,
+        detail          text,
+        date            timestamptz NOT NULL DEFAULT NOW(),
+        signature       text,
+        owner_username  text
+    );
+"""
+
+# --- 版本 2: 签名移出流水表, 按内容哈希去重存放 ---
+V2_SIGNATURE_BLOBS = """
+    CREATE TABLE IF NOT EXISTS signature_blobs (
+        hash        text PRIMARY KEY,          -- sha256(png) 十六进制
+        png         bytea NOT NULL,            -- 原图
+        thumb       bytea,                     -- 缩略图 (账目查询里显示这个)
+        created_at  timestamptz NOT NULL DEFAULT NOW()
+    );
+    ALTER TABLE transactions
+        ADD COLUMN IF NOT EXISTS signature_hash text REFERENCES signature_blobs(hash);
+
+    -- 历史签名 (base64 PNG) 搬到 signature_blobs, 原列清空
+    INSERT INTO signature_blobs (hash, png)
+    SELECT DISTINCT ON (h) h, png
+    FROM (
+        SELECT encode(sha256(decode(signature, 'base64')), 'hex') AS h,
+               decode(signature, 'base64') AS png
+        FROM transactions
+        WHERE signature IS NOT NULL AND signature <> ''
+    ) s
+    ON CONFLICT (hash) DO NOTHING;
+
+    UPDATE transactions
+    SET signature_hash = encode(sha256(decode(signature, 'base64')), 'hex'),
+        signature = NULL
+    WHERE signature IS NOT NULL AND signature <> '';
+"""
+
+# --- 版本 3: 每日收支汇总, 由触发器在写流水的同一事务里累加 ---
+V3_DAILY_TOTALS = """
+    CREATE TABLE IF NOT EXISTS daily_totals (
+        owner_username  text NOT NULL,
+        day             date NOT NULL,
+        type            text NOT NULL,
+        total           numeric(14, 2) NOT NULL DEFAULT 0,
+        cnt             integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (owner_username, day, type)
+    );
+
+    CREATE OR REPLACE FUNCTION daily_totals_on_insert() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF NEW.type IN ('RECHARGE', 'SPEND') THEN
+            INSERT INTO daily_totals AS d (owner_username, day, type, total, cnt)
+            VALUES (NEW.owner_username, date(NEW.date), NEW.type, NEW.amount, 1)
+            ON CONFLICT (owner_username, day, type)
+            DO UPDATE SET total = d.total + EXCLUDED.total, cnt = d.cnt + 1;
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_daily_totals ON transactions;
+    CREATE TRIGGER trg_daily_totals AFTER INSERT ON transactions
+        FOR EACH ROW EXECUTE FUNCTION daily_totals_on_insert();
+"""
+
+# --- 版本 5: 流水幂等键 (本地日志补写时同一笔只生效一次) ---
+V5_IDEMPOTENCY_KEY = """
+    ALTER TABLE transactions ADD COLUMN IF NOT EXISTS idempotency_key text UNIQUE;
+"""
+
+# --- 版本 6: 热点查询的索引 + 约束 (线上库的表是早先手工建的, 不能指望索引都在) ---
+V6_INDEXES = """
+    -- 会员最近流水 / 顾客自助查询: 按会员取最新几笔
+    CREATE INDEX IF NOT EXISTS transactions_member_recent_idx ON transactions (member_id, id DESC);
+    -- 账目查询: 店铺 + 日期范围
+    CREATE INDEX IF NOT EXISTS transactions_owner_date_idx ON transactions (owner_username, date);
+    -- 折扣只能在 (0, 1] 之间; NOT VALID 只约束新数据, 不因为历史脏数据迁移失败
+    ALTER TABLE accounts DROP CONSTRAINT IF EXISTS accounts_discount_range;
+    ALTER TABLE accounts ADD CONSTRAINT accounts_discount_range
+        CHECK (current_discount > 0 AND current_discount <= 1) NOT VALID;
+"""
+
+# --- 版本 7: 对账检查点 (reconcile.py) ---
+V7_RECONCILE = """
+    -- 每个会员截至 last_tx_id 的流水余额 (充值 +, 消费 -, 调整 ±)
+    CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+        member_id       integer PRIMARY KEY REFERENCES members(id),
+        ledger_balance  numeric(12, 2) NOT NULL DEFAULT 0,
+        last_tx_id      integer NOT NULL,
+        updated_at      timestamptz NOT NULL DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS reconcile_runs (
+        id              serial PRIMARY KEY,
+        started_at      timestamptz NOT NULL DEFAULT NOW(),
+        watermark       integer NOT NULL,          -- 这次处理到的流水 id
+        tx_processed    integer NOT NULL,
+        discrepancies   integer NOT NULL
+    );
+"""
+
+# --- 版本 8: 消费明细 (line_items.py) ---
+V8_LINE_ITEMS = """
+    -- transaction_id 不加外键: 以后流水归档出去了, 项目统计还能查
+    CREATE TABLE IF NOT EXISTS transaction_items (
+        id              bigserial PRIMARY KEY,
+        transaction_id  integer NOT NULL,
+        owner_username  text NOT NULL,
+        date            timestamptz NOT NULL,
+        category        text NOT NULL,
+        item            text NOT NULL,
+        price           numeric(12, 2),                -- 标价, 老流水补的没有
+        amount_share    numeric(12, 2) NOT NULL        -- 实收金额分摊到这一项的部分
+    );
+    CREATE INDEX IF NOT EXISTS transaction_items_tx_idx ON transaction_items (transaction_id);
+    -- 项目排行: 店铺 + 日期范围, 聚合列放进索引里, 只扫索引
+    CREATE INDEX IF NOT EXISTS transaction_items_owner_date_idx
+        ON transaction_items (owner_username, date) INCLUDE (category, item, amount_share);
+"""
+
+# --- 版本 9: 每家店自己的服务价目表 (catalog.py) ---
+V9_SERVICE_CATALOG = """
+    CREATE TABLE IF NOT EXISTS service_catalog (
+        id              serial PRIMARY KEY,
+        owner_username  text NOT NULL REFERENCES shop_owners(username),
+        icon            text NOT NULL DEFAULT '',
+        category        text NOT NULL,
+        item            text NOT NULL,
+        price           numeric(12, 2) CHECK (price >= 0),     -- 标价, 空着表示结账时手填
+        active          boolean NOT NULL DEFAULT true,         -- 下架后结账页不再显示
+        sort_order      integer NOT NULL DEFAULT 0,
+        UNIQUE (owner_username, category, item)
+    );
+"""
+
+# --- 版本 10: 冷数据归档登记 (archive.py) ---
+V10_ARCHIVED_MONTHS = """
+    -- 已经搬到 Parquet 文件的 店铺+月, 热表里这些月份的流水已删除
+    CREATE TABLE IF NOT EXISTS archived_months (
+        owner_username  text NOT NULL,
+        month           date NOT NULL,                 -- 当月 1 号
+        path            text NOT NULL,                 -- 相对归档目录
+        row_count       integer NOT NULL,
+        recharge        numeric(14, 2) NOT NULL,       -- 整月合计, 账目合计直接用
+        spend           numeric(14, 2) NOT NULL,
+        archived_at     timestamptz NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (owner_username, month)
+    );
+"""
+
+# --- 版本 11: 签名改存笔画 (差分编码), PNG 列只留给还没转换的老签名 ---
+V11_SIGNATURE_STROKES = """
+    ALTER TABLE signature_blobs
+        ADD COLUMN IF NOT EXISTS strokes bytea,          -- signatures.encode_strokes 的格式
+        ALTER COLUMN png DROP NOT NULL;
+    ALTER TABLE signature_blobs DROP CONSTRAINT IF EXISTS signature_blobs_content_chk;
+    ALTER TABLE signature_blobs
+        ADD CONSTRAINT signature_blobs_content_chk CHECK (strokes IS NOT NULL OR png IS NOT NULL);
+"""
+
+# --- 版本 12: 流水哈希链 (audit.py), 每家店按写入顺序排号, 每笔的哈希接着上一笔 ---
+V12_AUDIT_CHAIN = """
+    ALTER TABLE transactions
+        ADD COLUMN IF NOT EXISTS audit_seq bigint,          -- 这家店的第几笔
+        ADD COLUMN IF NOT EXISTS audit_hash text;           -- sha256(上一笔的 audit_hash | 这笔的内容)
+    CREATE UNIQUE INDEX IF NOT EXISTS transactions_audit_idx ON transactions (owner_username, audit_seq);
+
+    -- 每家店链上的最后一笔; 触发器在这一行上排队, 同一家店的流水依次排号
+    CREATE TABLE IF NOT EXISTS audit_heads (
+        owner_username  text PRIMARY KEY,
+        seq             bigint NOT NULL,
+        hash            text NOT NULL
+    );
+    -- 校验通过的最后一笔
+    CREATE TABLE IF NOT EXISTS audit_checkpoints (
+        owner_username  text PRIMARY KEY,
+        seq             bigint NOT NULL,
+        hash            text NOT NULL,
+        verified_at     timestamptz NOT NULL DEFAULT NOW()
+    );
+"""
+
+# 拼法和 audit.entry_hash 一致: 金额两位小数, 日期取 UTC 微秒数 (不受会话时区影响)
+V12_AUDIT_TRIGGER = """
+    CREATE OR REPLACE FUNCTION audit_chain_on_insert() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        prev text;
+    BEGIN
+        IF NEW.owner_username IS NULL THEN
+            RETURN NEW;
+        END IF;
+        INSERT INTO audit_heads AS h (owner_username, seq, hash) VALUES (NEW.owner_username, 1, '')
+        ON CONFLICT (owner_username) DO UPDATE SET seq = h.seq + 1
+        RETURNING h.seq, h.hash INTO NEW.audit_seq, prev;
+        NEW.audit_hash := encode(sha256(convert_to(concat_ws('|',
+            prev, NEW.owner_username, NEW.audit_seq, NEW.id, COALESCE(NEW.member_id::text, ''), NEW.type,
+            round(NEW.amount, 2), round(extract(epoch FROM NEW.date) * 1000000)::bigint,
+            COALESCE(NEW.detail, ''), COALESCE(NEW.signature_hash, '')), 'UTF8')), 'hex');
+        UPDATE audit_heads SET hash = NEW.audit_hash WHERE owner_username = NEW.owner_username;
+        RETURN NEW;
+    END $$;
+
+    -- 没串上链的流水 (关了触发器直接写进来的), 校验时按店铺查, 正常情况下是空的
+    CREATE INDEX IF NOT EXISTS transactions_unchained_idx ON transactions (owner_username)
+        WHERE audit_seq IS NULL;
+
+    DROP TRIGGER IF EXISTS trg_audit_chain ON transactions;
+    CREATE TRIGGER trg_audit_chain BEFORE INSERT ON transactions
+        FOR EACH ROW EXECUTE FUNCTION audit_chain_on_insert();
+"""
+
+
+# --- 版本 13: 会员统计 (member_stats.py), 会员名录只查这张表 ---
+V13_MEMBER_STATS = """
+    CREATE TABLE IF NOT EXISTS member_stats (
+        member_id       integer PRIMARY KEY REFERENCES members(id),
+        owner_username  text NOT NULL,
+        balance         numeric(12, 2) NOT NULL DEFAULT 0,     -- 同 accounts.balance
+        visits          integer NOT NULL DEFAULT 0,            -- 消费 (SPEND) 笔数
+        last_visit      timestamptz,                           -- 最近一笔消费
+        total_spend     numeric(14, 2) NOT NULL DEFAULT 0,
+        total_recharge  numeric(14, 2) NOT NULL DEFAULT 0
+    );
+    -- 最近到店 / 最久没来 两种排序正反向都能直接走这个索引
+    CREATE INDEX IF NOT EXISTS member_stats_last_visit_idx
+        ON member_stats (owner_username, last_visit DESC NULLS LAST);
+    CREATE INDEX IF NOT EXISTS member_stats_balance_idx ON member_stats (owner_username, balance);
+"""
+
+# 流水和余额各一个触发器, 和写入在同一个事务里; 归档删流水不动统计
+V13_MEMBER_STATS_TRIGGERS = """
+    CREATE OR REPLACE FUNCTION member_stats_on_transaction() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF NEW.type IN ('RECHARGE', 'SPEND') THEN
+            INSERT INTO member_stats AS s (member_id, owner_username, visits, last_visit, total_spend, total_recharge)
+            SELECT m.id, m.owner_username,
+                   CASE WHEN NEW.type = 'SPEND' THEN 1 ELSE 0 END,
+                   CASE WHEN NEW.type = 'SPEND' THEN NEW.date END,
+                   CASE WHEN NEW.type = 'SPEND' THEN NEW.amount ELSE 0 END,
+                   CASE WHEN NEW.type = 'RECHARGE' THEN NEW.amount ELSE 0 END
+            FROM members m
+            WHERE m.id = NEW.member_id AND m.owner_username IS NOT NULL
+            ON CONFLICT (member_id) DO UPDATE
+            SET visits = s.visits + EXCLUDED.visits,
+                last_visit = GREATEST(s.last_visit, EXCLUDED.last_visit),
+                total_spend = s.total_spend + EXCLUDED.total_spend,
+                total_recharge = s.total_recharge + EXCLUDED.total_recharge;
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION member_stats_on_account() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO member_stats AS s (member_id, owner_username, balance)
+        SELECT m.id, m.owner_username, NEW.balance
+        FROM members m
+        WHERE m.id = NEW.member_id AND m.owner_username IS NOT NULL
+        ON CONFLICT (member_id) DO UPDATE SET balance = EXCLUDED.balance;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_member_stats ON transactions;
+    CREATE TRIGGER trg_member_stats AFTER INSERT ON transactions
+        FOR EACH ROW EXECUTE FUNCTION member_stats_on_transaction();
+    DROP TRIGGER IF EXISTS trg_member_stats_balance ON accounts;
+    CREATE TRIGGER trg_member_stats_balance AFTER INSERT OR UPDATE OF balance ON accounts
+        FOR EACH ROW EXECUTE FUNCTION member_stats_on_account();
+"""
+
+
+# --- 版本 14: 会员资料变更号, 别的进程 (api.py / 另一台实例) 的会员搜索索引靠它发现要重新加载 ---
+# 语句级触发器, 批量导入一条语句只加一次
+V14_MEMBER_GENERATION = """
+    CREATE TABLE IF NOT EXISTS member_generation (
+        owner_username  text PRIMARY KEY,
+        gen             bigint NOT NULL DEFAULT 0
+    );
+
+    CREATE OR REPLACE FUNCTION member_generation_bump() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO member_generation AS g (owner_username, gen)
+        SELECT DISTINCT owner_username, 1 FROM changed WHERE owner_username IS NOT NULL
+        ON CONFLICT (owner_username) DO UPDATE SET gen = g.gen + 1;
+        RETURN NULL;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trg_member_generation_insert ON members;
+    CREATE TRIGGER trg_member_generation_insert AFTER INSERT ON members
+        REFERENCING NEW TABLE AS changed
+        FOR EACH STATEMENT EXECUTE FUNCTION member_generation_bump();
+    DROP TRIGGER IF EXISTS trg_member_generation_update ON members;
+    CREATE TRIGGER trg_member_generation_update AFTER UPDATE ON members
+        REFERENCING NEW TABLE AS changed
+        FOR EACH STATEMENT EXECUTE FUNCTION member_generation_bump();
+"""
+
+
+def _members_phone_index(c):
+    """店铺 + 手机号: 新库建表时有唯一约束, 老库没有就补一个普通索引 (老数据可能有重复)"""
+    exists = c.execute(text("""
+        SELECT 1 FROM pg_indexes
+        WHERE tablename = 'members' AND position('(owner_username, phone)' IN indexdef) > 0
+    """)).first()
+    if not exists:
+        c.execute(text("CREATE INDEX members_owner_phone_idx ON members (owner_username, phone)"))
+
+
+def _name_trigram_index(c):
+    """姓名模糊搜索 (ILIKE) 用的 pg_trgm 索引; 库里没有这个扩展就跳过"""
+    if not c.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+        print("⚠️ 数据库没有 pg_trgm 扩展, 跳过姓名三元组索引")
+        return
+    c.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    c.execute(text("CREATE INDEX IF NOT EXISTS members_name_trgm_idx ON members USING gin (name gin_trgm_ops)"))
+
+
+def _backfill_thumbnails(c):
+    import signatures
+    signatures.backfill_thumbnails(c)
+
+
+def _chain_existing_transactions(c):
+    import audit
+    audit.chain_existing(c)
+
+
+def _rebuild_member_stats(c):
+    import member_stats
+    member_stats.rebuild(c)
+
+
+def _rebuild_daily_totals(c):
+    import rollup
+    rollup.rebuild(c)
+
+
+def _hash_plaintext_passwords(c):
+    import auth
+    auth.hash_existing(c)
+
+
+def _backfill_line_items(c):
+    import line_items
+    line_items.backfill(c)
+
+
+def _seed_service_catalog(c):
+    import catalog
+    catalog.seed_defaults(c, c.execute(text("SELECT username FROM shop_owners")).scalars().all())
+
+
+# (版本号, 说明, 步骤列表); 步骤是 SQL 字符串或者接收连接的函数
+MIGRATIONS = [
+    (1, "基础表", [V1_BASELINE]),
+    (2, "签名单独存放 + 缩略图", [V2_SIGNATURE_BLOBS, _backfill_thumbnails]),
+    (3, "每日收支汇总表", [V3_DAILY_TOTALS, _rebuild_daily_totals]),
+    (4, "店主密码改为哈希存储", [_hash_plaintext_passwords]),
+    (5, "流水幂等键", [V5_IDEMPOTENCY_KEY]),
+    (6, "热点查询索引 + 约束", [V6_INDEXES, _members_phone_index, _name_trigram_index]),
+    (7, "对账检查点", [V7_RECONCILE]),
+    (8, "消费明细", [V8_LINE_ITEMS, _backfill_line_items]),
+    (9, "服务价目表", [V9_SERVICE_CATALOG, _seed_service_catalog]),
+    (10, "冷数据归档", [V10_ARCHIVED_MONTHS]),
+    (11, "签名改存笔画", [V11_SIGNATURE_STROKES]),
+    (12, "流水哈希链", [V12_AUDIT_CHAIN, _chain_existing_transactions, V12_AUDIT_TRIGGER]),
+    (13, "会员统计", [V13_MEMBER_STATS, _rebuild_member_stats, V13_MEMBER_STATS_TRIGGERS]),
+    (14, "会员资料变更号", [V14_MEMBER_GENERATION]),
+]
+
+
+def current_version(c):
+    c.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     integer PRIMARY KEY,
+            name        text NOT NULL,
+            applied_at  timestamptz NOT NULL DEFAULT NOW()
+        )
+    """))
+    return c.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def migrate(engine=None, target=None):
+    """依次执行还没执行过的版本, 返回执行了的版本号列表"""
+    engine = engine or db.get_engine()
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with engine.begin() as c:
+            if version <= current_version(c):
+                continue
+            for step in steps:
+                if callable(step):
+                    step(c)
+                else:
+                    c.exec_driver_sql(step)
+            c.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                      {"v": version, "n": name})
+        applied.append(version)
+        print(f"✅ 版本 {version}: {name}")
+    return applied
+
+
+def status(engine=None):
+    engine = engine or db.get_engine()
+    with engine.begin() as c:
+        current_version(c)
+        rows = c.execute(text("SELECT version, name, applied_at FROM schema_migrations ORDER BY version")).all()
+    done = {r.version for r in rows}
+    for r in rows:
+        print(f"  [x] {r.version:>3}  {r.name}  ({r.applied_at:%Y-%m-%d %H:%M})")
+    for version, name, _ in MIGRATIONS:
+        if version not in done:
+            print(f"  [ ] {version:>3}  {name}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        status()
+    else:
+        if not migrate():
+            print("已经是最新版本")
@@ -0,0 +1,136 @@
+"""run_query 前面的读缓存 (按店铺隔离, 写入时精确失效)
+
+缓存键 = (店铺, SQL, 参数)。每条缓存记下它读了哪些表、是不是只针对某几个
+会员; 写操作提交后按 店铺 / 表 / 会员 只清掉受影响的条目。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# 最多缓存多少条结果 (LRU 淘汰), 默认存活多少秒 (兜底其他进程的写入)
+MAX_ENTRIES = 512
+DEFAULT_TTL = 60
+
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.I)
+_WRITE_TABLES = re.compile(r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+([A-Za-z_][A-Za-z0-9_]*)", re.I)
+
+# 由触发器顺带写入的表: 写了左边的表, 右边的表缓存也要失效
+DERIVED_TABLES = {
+    "transactions": ("daily_totals", "audit_heads", "member_stats"),
+    "accounts": ("member_stats",),
+}
+
+
+def read_tables(sql):
+    return frozenset(t.lower() for t in _READ_TABLES.findall(sql))
+
+
+def write_tables(sql):
+    return frozenset(t.lower() for t in _WRITE_TABLES.findall(sql))
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def member_scope(params):
+    """参数里带了会员 id (mid / ids) 的查询只和这几个会员有关"""
+    if "mid" in params:
+        return frozenset([int(params["mid"])])
+    if "ids" in params:
+        return frozenset(int(i) for i in params["ids"])
+    return None
+
+
+class _Entry:
+    __slots__ = ("df", "expires", "owner", "tables", "members")
+
+    def __init__(self, df, expires, owner, tables, members):
+        self.df, self.expires, self.owner = df, expires, owner
+        self.tables, self.members = tables, members
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._epoch = 0               # 不分店铺的失效次数
+        self._generations = {}        # 店铺 -> 失效次数
+
+    @staticmethod
+    def make_key(sql, params):
+        return (params.get("owner"), sql, tuple(sorted((k, _freeze(v)) for k, v in params.items())))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry.expires < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            # 调用方会往 DataFrame 里加列, 给一份拷贝
+            return entry.df.copy()
+
+    def put(self, key, sql, params, df, ttl=DEFAULT_TTL, members=None):
+        """members: 参数里看不出会员、要查完才知道时由调用方给出"""
+        if members is None:
+            members = member_scope(params)
+        entry = _Entry(df.copy(), time.monotonic() + ttl, params.get("owner"),
+                       read_tables(sql), members)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, owner=None, tables=(), member_id=None):
+        """写入提交后调用: 清掉同店铺 (或不分店铺) 且读过这些表的缓存;
+        只针对别的会员的缓存保留"""
+        tables = frozenset(tables)
+        tables |= {d for t in tables for d in DERIVED_TABLES.get(t, ())}
+        with self._lock:
+            stale = [
+                k for k, e in self._data.items()
+                if (owner is None or e.owner is None or e.owner == owner)
+                and (not tables or e.tables & tables)
+                and (member_id is None or e.members is None or member_id in e.members)
+            ]
+            for k in stale:
+                del self._data[k]
+            self.invalidations += len(stale)
+            if owner is None:
+                self._epoch += 1
+            else:
+                self._generations[owner] = self._generations.get(owner, 0) + 1
+
+    def generation(self, owner):
+        """店铺的写入代数: 这家店每次写入后都会变。缓存之外自己存了查询结果的地方
+        (比如结账页存着的会员) 用它判断结果还能不能用"""
+        with self._lock:
+            return self._epoch, self._generations.get(owner, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._epoch += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data), "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions, "invalidations": self.invalidations,
+        }
+
+
+# 进程级单例, 所有会话共用 (键里带了店铺, 不会串店)
+cache = QueryCache()
@@ -0,0 +1,90 @@
+"""顾客扫码查询的限流: 令牌桶, 每个桶最多攒 BURST 次, 每 1/RATE 秒补一次
+
+每次查询扣两个桶:
+- 会话 (浏览器标签页) 一个, 总是有;
+- 来源 IP 一个, 只在知道真实来源时才有。同一家店的 Wi-Fi 出口 IP 相同, BURST 留得宽一些。
+
+X-Forwarded-For 最左边的值是客户端自己写的, 换一个就是新桶, 不能当标识。
+每层代理往末尾追加它看到的来源, 所以前面有 N 层自己的代理时取从右数第 N 个。
+N 用环境变量 NAIL_TRUSTED_PROXIES 配置:
+- 不设: 不知道前面有几层代理 (比如 Streamlit Community Cloud 托管), 只按会话限流;
+  连接 IP 是代理的, 拿它当桶会让所有店的顾客挤一个桶;
+- 0: 直连, 用连接 IP;
+- N: 自己的 nginx 等反向代理 N 层。
+"""
+import os
+import threading
+import time
+
+RATE = 0.2          # 每秒补充的次数 (平均 5 秒一次)
+BURST = 5
+MAX_CLIENTS = 10000
+_trusted = os.environ.get("NAIL_TRUSTED_PROXIES")
+TRUSTED_PROXIES = int(_trusted) if _trusted else None      # None = 不知道 (见上面)
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST, max_clients=MAX_CLIENTS):
+        self.rate, self.burst, self.max_clients = rate, burst, max_clients
+        self._buckets = {}          # 客户端 -> [剩余次数, 上次更新时间]
+        self._lock = threading.Lock()
+
+    def allow(self, client, cost=1):
+        """放行返回 (True, 0); 否则返回 (False, 还要等几秒)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                self._buckets[client] = [tokens - cost, now]
+                ok, wait = True, 0.0
+            else:
+                self._buckets[client] = [tokens, now]
+                ok, wait = False, (cost - tokens) / self.rate
+            if len(self._buckets) > self.max_clients:
+                self._prune(now)
+        return ok, wait
+
+    def _prune(self, now):
+        """已经补满的桶和新建的没区别, 删掉"""
+        full_after = self.burst / self.rate
+        for k in [k for k, (_, last) in self._buckets.items() if now - last > full_after]:
+            del self._buckets[k]
+
+
+def forwarded_client(forwarded, peer, trusted=None):
+    """可信代理记下的来源 IP (X-Forwarded-For 从右数第 trusted 个);
+    没配代理、没有这个头或者层数不够时用连接 IP (peer)"""
+    trusted = TRUSTED_PROXIES if trusted is None else trusted
+    if trusted and forwarded:
+        hops = [h.strip() for h in forwarded.split(",") if h.strip()]
+        if len(hops) >= trusted:
+            return hops[-trusted]
+    return peer
+
+
+def client_ids():
+    """当前请求要扣的桶: 会话, 以及 (配了 NAIL_TRUSTED_PROXIES 时) 来源 IP"""
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    ids = [f"session:{ctx.session_id if ctx else '-'}"]
+    if TRUSTED_PROXIES is not None:
+        ip = getattr(st.context, "ip_address", None)
+        ip = forwarded_client(st.context.headers.get("X-Forwarded-For"), ip if isinstance(ip, str) else None)
+        if ip:
+            ids.append(f"ip:{ip}")
+    return ids
+
+
+def allow_customer():
+    """顾客查询放行返回 (True, 0); 否则 (False, 还要等几秒)"""
+    for client in client_ids():
+        ok, wait = customer_limiter.allow(client)
+        if not ok:
+            return ok, wait
+    return True, 0.0
+
+
+# 进程级单例
+customer_limiter = TokenBucket()
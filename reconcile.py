@@ -0,0 +1,165 @@
+"""余额对账: 用流水重算每个会员的余额, 和 accounts.balance 对比
+
+    python reconcile.py                  # 增量: 只处理上次之后的新流水
+    python reconcile.py --full           # 清空检查点从头算
+    python reconcile.py --owner <店铺>    # 只看某家店的差异
+    python reconcile.py --adjust         # 差异写成 ADJUST 流水 (历史数据第一次对账时用)
+
+流水余额 = 充值 + 调整 (可正可负) - 消费。ledger_checkpoints 存每个会员截至
+某笔流水的流水余额, 每次只按 id 分批读之后的新流水, 在 pandas 里按会员
+汇总后加到检查点上; 对比在同一个快照 (REPEATABLE READ) 里做, 检查点之后
+才写入的流水现场补算, 所以跑的时候照常收银也不会误报。
+
+只处理 LAG 之前写入的流水: 还没提交的事务可能占着更小的 id, 等它们提交了再算。
+补写日志 (journal.py) 带着旧日期补写的流水恰好和对账同时提交时可能漏算,
+怀疑检查点不对时用 --full 重建 (会连同 archive.py 归档出去的流水一起重算)。
+"""
+import argparse
+import itertools
+import sys
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+import archive
+import db
+
+CHUNK = 50_000
+LAG = timedelta(minutes=5)
+LOCK_KEY = 7_304_115          # pg_advisory_lock 用, 同一时间只跑一个对账
+
+# 流水对余额的影响
+SIGNED_AMOUNT = "CASE t.type WHEN 'SPEND' THEN -t.amount ELSE t.amount END"
+
+# 当前余额 vs 检查点 + 检查点之后的流水
+SQL_COMPARE = f"""
+    WITH tail AS (
+        SELECT t.member_id, SUM({SIGNED_AMOUNT}) AS delta
+        FROM transactions t
+        WHERE t.id > :watermark
+        GROUP BY t.member_id
+    )
+    SELECT m.id AS member_id, m.owner_username, m.name, m.phone, a.balance,
+           COALESCE(cp.ledger_balance, 0) + COALESCE(tail.delta, 0) AS ledger
+    FROM accounts a
+    JOIN members m ON m.id = a.member_id
+    LEFT JOIN ledger_checkpoints cp ON cp.member_id = a.member_id
+    LEFT JOIN tail ON tail.member_id = a.member_id
+    WHERE a.balance <> COALESCE(cp.ledger_balance, 0) + COALESCE(tail.delta, 0)
+"""
+
+
+def _new_transactions(c, after, upto):
+    """按 id 分批读 (after, upto] 之间的流水, 逐批返回 DataFrame"""
+    while after < upto:
+        df = pd.read_sql(text("""
+            SELECT id, member_id, type, amount FROM transactions
+            WHERE id > :after AND id <= :upto
+            ORDER BY id
+            LIMIT :n
+        """), c, params={"after": after, "upto": upto, "n": CHUNK})
+        if df.empty:
+            return
+        yield df
+        after = int(df["id"].iloc[-1])
+
+
+def member_deltas(chunks):
+    """各批流水按会员汇总成余额变化 (向量化, 不逐行循环)"""
+    total = pd.Series(dtype="float64")
+    n = 0
+    for df in chunks:
+        signed = df["amount"].astype(float).where(df["type"] != "SPEND", -df["amount"].astype(float))
+        total = total.add(signed.groupby(df["member_id"]).sum(), fill_value=0)
+        n += len(df)
+    return total.round(2), n
+
+
+def run(full=False, owner=None):
+    """对一次账, 返回 (差异 DataFrame, 这次处理的流水笔数)"""
+    with db.get_engine().connect() as c:
+        c.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        c.commit()
+        try:
+            # 快照要在拿到锁之后才开始, 否则可能看不到上一次对账写的检查点
+            c.execution_options(isolation_level="REPEATABLE READ")
+            with c.begin():
+                if full:
+                    c.execute(text("DELETE FROM ledger_checkpoints"))
+                    watermark = 0
+                else:
+                    watermark = c.execute(text(
+                        "SELECT COALESCE(MAX(watermark), 0) FROM reconcile_runs")).scalar()
+                upto = c.execute(text("""
+                    SELECT COALESCE(MAX(id), 0) FROM transactions WHERE date < NOW() - :lag
+                """), {"lag": LAG}).scalar()
+                upto = max(upto, watermark)
+
+                chunks = _new_transactions(c, watermark, upto)
+                if full:
+                    # 已归档的流水不在热表里了, 从归档文件读
+                    chunks = itertools.chain(archive.all_frames(c, ["member_id", "type", "amount"]), chunks)
+                deltas, n = member_deltas(chunks)
+                if not deltas.empty:
+                    c.execute(text("""
+                        INSERT INTO ledger_checkpoints AS cp (member_id, ledger_balance, last_tx_id)
+                        SELECT * FROM unnest(CAST(:mid AS integer[]), CAST(:delta AS numeric[]),
+                                             CAST(:upto AS integer[]))
+                        ON CONFLICT (member_id) DO UPDATE
+                        SET ledger_balance = cp.ledger_balance + EXCLUDED.ledger_balance,
+                            last_tx_id = EXCLUDED.last_tx_id, updated_at = NOW()
+                    """), {"mid": [int(i) for i in deltas.index], "delta": deltas.tolist(),
+                           "upto": [upto] * len(deltas)})
+
+                diff = pd.read_sql(text(SQL_COMPARE + " ORDER BY m.owner_username, m.id"), c,
+                                   params={"watermark": upto})
+                c.execute(text("""
+                    INSERT INTO reconcile_runs (watermark, tx_processed, discrepancies)
+                    VALUES (:w, :n, :d)
+                """), {"w": upto, "n": n, "d": len(diff)})
+        finally:
+            c.execution_options(isolation_level="READ COMMITTED")
+            c.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+            c.commit()
+
+    diff["diff"] = (diff["balance"].astype(float) - diff["ledger"].astype(float)).round(2)
+    if owner is not None:
+        diff = diff[diff["owner_username"] == owner].reset_index(drop=True)
+    return diff, n
+
+
+def adjust(diff):
+    """把差异写成 ADJUST 流水 (余额不动, 流水补齐), 返回写了几笔;
+    差额在写入时按最新检查点重算, 对账之后又有收银也不会写错"""
+    if diff.empty:
+        return 0
+    with db.unit_of_work("reconcile_adjust") as c:
+        watermark = c.execute(text("SELECT COALESCE(MAX(watermark), 0) FROM reconcile_runs")).scalar()
+        n = c.execute(text(f"""
+            WITH d AS ({SQL_COMPARE})
+            INSERT INTO transactions (member_id, type, amount, detail, date, owner_username)
+            SELECT member_id, 'ADJUST', balance - ledger, '对账调整', NOW(), owner_username
+            FROM d WHERE member_id = ANY(:ids)
+        """),
+            {"watermark": watermark, "ids": [int(i) for i in diff["member_id"]]}).rowcount
+    for owner in diff["owner_username"].unique():
+        db.cache.invalidate(owner, ("transactions",))
+    return n
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--full", action="store_true", help="清空检查点从头算")
+    ap.add_argument("--owner", help="只报告这家店")
+    ap.add_argument("--adjust", action="store_true", help="把差异写成 ADJUST 流水")
+    a = ap.parse_args()
+
+    diff, n = run(a.full, a.owner)
+    print(f"处理新流水 {n} 笔, 余额和流水对不上的会员 {len(diff)} 个")
+    if not diff.empty:
+        print(diff[["owner_username", "member_id", "name", "phone", "balance", "ledger", "diff"]]
+              .to_string(index=False))
+        if a.adjust:
+            print(f"✅ 已写入 {adjust(diff)} 笔 ADJUST 流水")
+    sys.exit(1 if len(diff) and not a.adjust else 0)
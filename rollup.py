@@ -0,0 +1,72 @@
+"""每日收支汇总表 daily_totals (店铺, 日期, 类型, 金额合计, 笔数)
+
+平时由 transactions 上的触发器在同一个事务里累加 (见 migrations.py 版本 3),
+图表只读这张表, 不再扫流水。汇总和流水对不上时可以重建 (会把归档文件一起读进来):
+
+    python rollup.py rebuild            # 全部店铺
+    python rollup.py rebuild <店铺账号>  # 单个店铺
+"""
+import sys
+
+from sqlalchemy import text
+
+import db
+
+REBUILD_SQL = """
+    INSERT INTO daily_totals (owner_username, day, type, total, cnt)
+    SELECT owner_username, date(date), type, SUM(amount), COUNT(*)
+    FROM transactions
+    WHERE type IN ('RECHARGE', 'SPEND') {owner_filter}
+    GROUP BY owner_username, date(date), type
+"""
+
+# 归档的流水按天汇总后加上去; 日期在库里取, 和触发器按同一个时区切天
+ADD_ARCHIVED_SQL = """
+    INSERT INTO daily_totals AS d (owner_username, day, type, total, cnt)
+    SELECT :owner, date(u.date), u.type, SUM(u.amount), COUNT(*)
+    FROM unnest(CAST(:types AS text[]), CAST(:amounts AS numeric[]), CAST(:dates AS timestamptz[]))
+         AS u(type, amount, date)
+    GROUP BY date(u.date), u.type
+    ON CONFLICT (owner_username, day, type)
+    DO UPDATE SET total = d.total + EXCLUDED.total, cnt = d.cnt + EXCLUDED.cnt
+"""
+
+
+def rebuild(c, owner=None):
+    """在给定连接 (事务) 里重算汇总 (热表 + archive.py 归档的月份); owner=None 表示全部店铺"""
+    params = {}
+    owner_filter = ""
+    if owner is not None:
+        owner_filter = "AND owner_username = :owner"
+        params["owner"] = owner
+    c.execute(text("DELETE FROM daily_totals WHERE TRUE " + owner_filter), params)
+    c.execute(text(REBUILD_SQL.format(owner_filter=owner_filter)), params)
+    import archive
+    for shop, df in archive.owner_frames(c, ["type", "amount", "date"], owner):
+        df = df[df["type"].isin(["RECHARGE", "SPEND"])]
+        if df.empty:
+            continue
+        c.execute(text(ADD_ARCHIVED_SQL), {
+            "owner": shop, "types": df["type"].tolist(), "amounts": df["amount"].tolist(),
+            "dates": [t.to_pydatetime() for t in df["date"]],
+        })
+
+
+def daily_totals(owner, days):
+    """最近 days 天 (含今天) 每天每种类型的合计, 行数最多 days * 2"""
+    return db.run_query("""
+        SELECT day, type, total, cnt
+        FROM daily_totals
+        WHERE owner_username = :owner AND day > CURRENT_DATE - CAST(:days AS integer)
+        ORDER BY day
+    """, {"owner": owner, "days": days})
+
+
+if __name__ == "__main__":
+    if not sys.argv[1:] or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(1)
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    with db.unit_of_work("rollup_rebuild", target, ("daily_totals",)) as c:
+        rebuild(c, target)
+    print(f"✅ 已重建 {target or '全部店铺'} 的每日汇总")
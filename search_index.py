@@ -0,0 +1,160 @@
+"""每个店铺一份的会员内存索引 (手机号 / 尾号4位 / 姓名)
+
+进程级缓存, 每个店铺首次搜索时从数据库加载一次, 之后新建/修改会员时
+增量更新; 搜索本身不访问数据库。
+别的进程 (api.py / 另一台实例) 改了会员时本进程收不到 upsert_member: 每 CHECK_INTERVAL 秒
+最多查一次库里的变更号 (member_generation, 触发器维护), 变了就整体重新加载。
+"""
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+import db
+
+# 多久 (秒) 查一次会员资料变更号
+CHECK_INTERVAL = 5
+# 姓名前缀最多索引几个字 (中文姓名一般 2~4 个字)
+PREFIX_LEN = 6
+
+# 匹配度 (越小越靠前)
+RANK_PHONE = 0
+RANK_NAME = 1
+RANK_TAIL = 2
+RANK_NAME_PREFIX = 3
+
+
+def normalize_name(name):
+    """姓名归一化: 全角转半角、忽略大小写和空白"""
+    name = unicodedata.normalize("NFKC", name or "")
+    return "".join(name.split()).casefold()
+
+
+class MemberIndex:
+    def __init__(self):
+        self.members = {}                  # id -> (name, phone)
+        self.by_phone = {}                 # 完整手机号 -> id
+        # 以下每个桶都是 {id: None}, 利用 dict 的插入顺序: 越靠后越新,
+        # 取前 N 个最新会员时倒序遍历即可, 不用对整个桶排序
+        self.by_tail = defaultdict(dict)    # 尾号4位 -> {id}
+        self.by_name = defaultdict(dict)    # 归一化姓名 -> {id}
+        self.by_prefix = defaultdict(dict)  # 姓名前缀 -> {id}
+        self.gen = None                     # 加载时库里的变更号
+        self.checked_at = time.monotonic()
+
+    def add(self, mid, name, phone):
+        self.remove(mid)
+        phone = (phone or "").strip()
+        key = normalize_name(name)
+        self.members[mid] = (name, phone)
+        if phone:
+            self.by_phone[phone] = mid
+            if len(phone) >= 4:
+                self.by_tail[phone[-4:]][mid] = None
+        if key:
+            self.by_name[key][mid] = None
+            for i in range(1, min(len(key), PREFIX_LEN) + 1):
+                self.by_prefix[key[:i]][mid] = None
+
+    def remove(self, mid):
+        old = self.members.pop(mid, None)
+        if old is None:
+            return
+        name, phone = old
+        key = normalize_name(name)
+        if phone:
+            if self.by_phone.get(phone) == mid:
+                del self.by_phone[phone]
+            self.by_tail.get(phone[-4:], {}).pop(mid, None)
+        self.by_name.get(key, {}).pop(mid, None)
+        for i in range(1, min(len(key), PREFIX_LEN) + 1):
+            self.by_prefix.get(key[:i], {}).pop(mid, None)
+
+    def search(self, term, limit=20):
+        """返回按匹配度排序的会员 id 列表 (同一匹配度最近录入/修改的在前)"""
+        term = (term or "").strip()
+        if not term:
+            return []
+        key = normalize_name(term)
+        phone_id = self.by_phone.get(term)
+        tiers = [
+            [phone_id] if phone_id is not None else (),
+            self.by_name.get(key, ()),
+            self.by_tail.get(term, ()) if len(term) == 4 and term.isdigit() else (),
+            self.by_prefix.get(key[:PREFIX_LEN], ()) if key else (),
+        ]
+        result, seen = [], set()
+        # 按匹配度逐档取, 每档从最新的往前取, 取够 limit 个就停
+        for rank, ids in enumerate(tiers):
+            for mid in reversed(ids):
+                if len(result) >= limit:
+                    return result
+                if mid in seen:
+                    continue
+                # 超过前缀长度的输入, 再用完整前缀过滤一遍
+                if (rank == RANK_NAME_PREFIX and len(key) > PREFIX_LEN
+                        and not normalize_name(self.members[mid][0]).startswith(key)):
+                    continue
+                result.append(mid)
+                seen.add(mid)
+        return result
+
+
+# --- 进程级缓存: owner_username -> MemberIndex ---
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _generation(owner):
+    df = db.run_query("SELECT gen FROM member_generation WHERE owner_username = :owner", {"owner": owner}, ttl=0)
+    return int(df.iloc[0]["gen"]) if not df.empty else 0
+
+
+def _load(owner):
+    idx = MemberIndex()
+    # 先取变更号再读会员: 读的过程中别处又改了, 下次检查时会再加载一遍
+    idx.gen = _generation(owner)
+    # 不走查询缓存: 缓存只在本进程内失效, 别的进程改了会员时里面还是旧的
+    df = db.run_query("SELECT id, name, phone FROM members WHERE owner_username = :owner ORDER BY id",
+                      {"owner": owner}, ttl=0)
+    for mid, name, phone in zip(df["id"], df["name"], df["phone"]):
+        idx.add(int(mid), name, phone)
+    return idx
+
+
+def get_index(owner):
+    idx = _indexes.get(owner)
+    if idx is None or time.monotonic() - idx.checked_at > CHECK_INTERVAL:
+        with _lock:
+            idx = _indexes.get(owner)
+            if idx is None:
+                idx = _indexes[owner] = _load(owner)
+            elif time.monotonic() - idx.checked_at > CHECK_INTERVAL:
+                if _generation(owner) != idx.gen:
+                    idx = _indexes[owner] = _load(owner)
+                else:
+                    idx.checked_at = time.monotonic()
+    return idx
+
+
+def search(owner, term, limit=20):
+    idx = get_index(owner)
+    # 和 upsert_member 互斥, 避免遍历桶的时候桶被改
+    with _lock:
+        return idx.search(term, limit)
+
+
+def upsert_member(owner, mid, name, phone):
+    """新建/修改会员后调用; 索引还没加载过就不用管, 下次搜索时会整体加载"""
+    idx = _indexes.get(owner)
+    if idx is not None:
+        with _lock:
+            idx.add(int(mid), name, phone)
+
+
+def invalidate(owner=None):
+    with _lock:
+        if owner is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(owner, None)
@@ -0,0 +1,186 @@
+"""合成测试数据 (只用于本地库!)
+
+    DATABASE_URL=postgresql+psycopg2://localhost/nail_bench \\
+        python seed.py --shops 3 --members 2000 --transactions 50000 --reset
+
+同样的参数 + 同样的 --seed 生成的数据完全一样, 方便前后版本对比。
+店铺账号为 bench_shop_0 .. bench_shop_{N-1}, 密码都是 bench。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+import auth
+import catalog
+import db
+import line_items
+import migrations
+import signatures
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高"
+GIVEN = "丽娟敏静婷雪芳燕玲红霞梅琳晶颖洁佳欣怡萱"
+SERVICES = {
+    "手部": ["卸甲", "修补", "延长", "款式", "饰品"],
+    "睫毛": ["卸睫毛", "漫画款", "婴儿弯", "YY单根", "设计款", "蛋白矫正"],
+    "足部": ["卸甲", "水晶矫正", "甲片", "款式", "足部护理"],
+    "眉毛": ["野生眉", "线条眉", "雾眉", "洗眉"],
+}
+CHUNK = 5000
+
+
+def check_local():
+    """防止误把测试数据灌进线上库"""
+    url = os.environ.get("DATABASE_URL", "")
+    if not url or "supabase" in url:
+        sys.exit("❌ 请用 DATABASE_URL 指向本地数据库 (不能是 Supabase)")
+
+
+def fake_signature_json(rng):
+    """随手画几笔, 和结账页画布 (自由画笔) 的 json_data 一个样子"""
+    objects = []
+    for _ in range(rng.randint(2, 5)):
+        x, y = rng.randint(20, 560), rng.randint(20, 130)
+        path = [["M", x, y]]
+        for _ in range(rng.randint(8, 30)):
+            # 画布每移动几个像素记一个点, 一段 25 像素左右拆成 6 个二次曲线段
+            tx = min(590, max(10, x + rng.randint(-25, 25)))
+            ty = min(140, max(10, y + rng.randint(-15, 15)))
+            for k in range(1, 7):
+                px, py = x + (tx - x) * k / 6 + rng.uniform(-0.3, 0.3), y + (ty - y) * k / 6 + rng.uniform(-0.3, 0.3)
+                path.append(["Q", path[-1][-2], path[-1][-1], px, py])
+            x, y = tx, ty
+        path.append(["L", x, y])
+        objects.append({"type": "path", "stroke": "black", "strokeWidth": 2, "path": path})
+    return {"version": "5.3.0", "objects": objects}
+
+
+def fake_detail(rng):
+    parts = []
+    for cat in rng.sample(list(SERVICES), rng.randint(1, 2)):
+        parts.append(f"{cat}({','.join(rng.sample(SERVICES[cat], rng.randint(1, 2)))})")
+    return " + ".join(parts)
+
+
+def _insert_chunks(c, sql, columns):
+    """按列传数组, 用 unnest 批量插入, 每批 CHUNK 行"""
+    n = len(next(iter(columns.values())))
+    for i in range(0, n, CHUNK):
+        c.execute(text(sql), {k: list(v[i:i + CHUNK]) for k, v in columns.items()})
+
+
+def seed(shops=3, members=1000, transactions=20000, sig_ratio=0.5, days=365,
+         unique_signatures=50, seed=42, reset=False):
+    check_local()
+    rng = random.Random(seed)
+    nrng = np.random.default_rng(seed)
+    engine = db.get_engine()
+    if reset:
+        with engine.begin() as c:
+            c.exec_driver_sql("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+    migrations.migrate(engine)
+
+    t0 = time.perf_counter()
+    owners = [f"bench_shop_{i}" for i in range(shops)]
+    sig_pool = [signatures.blob_params(signatures.process_signature(fake_signature_json(rng)))
+                for _ in range(unique_signatures)]
+
+    with engine.begin() as c:
+        c.execute(text("""
+            INSERT INTO shop_owners (username, password, shop_name)
+            SELECT u, :pw, '测试店' || u FROM unnest(CAST(:owners AS text[])) u
+            ON CONFLICT DO NOTHING
+        """), {"owners": owners, "pw": auth.hash_password("bench")})
+        catalog.seed_defaults(c, owners)
+        for p in sig_pool:
+            c.execute(text("""
+                INSERT INTO signature_blobs (hash, strokes) VALUES (:sig_hash, :sig_strokes)
+                ON CONFLICT DO NOTHING
+            """), p)
+
+        # 会员 (手机号按店铺编号+序号生成, 店内唯一)
+        now = datetime.now()
+        m_owner, m_name, m_phone, m_created = [], [], [], []
+        for s_i, owner in enumerate(owners):
+            for i in range(members):
+                m_owner.append(owner)
+                m_name.append(rng.choice(SURNAMES) + "".join(rng.choices(GIVEN, k=rng.randint(1, 2))))
+                m_phone.append(f"13{s_i:02d}{i:07d}")
+                m_created.append(now - timedelta(days=rng.randint(0, days)))
+        _insert_chunks(c, """
+            INSERT INTO members (name, phone, owner_username, created_at)
+            SELECT * FROM unnest(CAST(:name AS text[]), CAST(:phone AS text[]),
+                                 CAST(:owner AS text[]), CAST(:created AS timestamptz[]))
+        """, {"name": m_name, "phone": m_phone, "owner": m_owner, "created": m_created})
+        ids = c.execute(text("""
+            SELECT id, owner_username FROM members WHERE owner_username = ANY(:owners) ORDER BY id
+        """), {"owners": owners}).all()
+        member_ids = np.array([r.id for r in ids])
+        member_owner = np.array([r.owner_username for r in ids])
+
+        # 流水: 三成半充值, 其余消费; 日期在最近 days 天里均匀分布, 按时间顺序写入
+        n = transactions
+        pick = nrng.integers(0, len(member_ids), n)
+        is_recharge = nrng.random(n) < 0.35
+        amount = np.where(is_recharge, nrng.choice([200, 500, 1000, 2000], n),
+                          nrng.integers(5, 60, n) * 10.0)
+        offsets = np.sort(nrng.random(n))[::-1] * days * 86400
+        dates = [now - timedelta(seconds=float(o)) for o in offsets]
+        details, sig_hashes = [], []
+        for r in is_recharge:
+            if r:
+                details.append("充值")
+                sig_hashes.append(None)
+            else:
+                details.append(fake_detail(rng))
+                sig_hashes.append(rng.choice(sig_pool)["sig_hash"] if rng.random() < sig_ratio else None)
+        _insert_chunks(c, """
+            INSERT INTO transactions (member_id, type, amount, detail, date, signature_hash, owner_username)
+            SELECT * FROM unnest(CAST(:mid AS integer[]), CAST(:type AS text[]), CAST(:amt AS numeric[]),
+                                 CAST(:detail AS text[]), CAST(:date AS timestamptz[]),
+                                 CAST(:sig AS text[]), CAST(:owner AS text[]))
+        """, {
+            "mid": member_ids[pick].tolist(), "type": np.where(is_recharge, "RECHARGE", "SPEND").tolist(),
+            "amt": amount.tolist(), "detail": details, "date": dates, "sig": sig_hashes,
+            "owner": member_owner[pick].tolist(),
+        })
+
+        # 账户余额 = 流水净额, 和账本一致
+        c.execute(text("""
+            INSERT INTO accounts (member_id, balance, current_discount)
+            SELECT m.id,
+                   COALESCE(SUM(CASE WHEN t.type = 'RECHARGE' THEN t.amount ELSE -t.amount END), 0),
+                   (ARRAY[1.0, 0.95, 0.9, 0.88, 0.8])[1 + m.id % 5]
+            FROM members m
+            LEFT JOIN transactions t ON t.member_id = m.id
+            WHERE m.owner_username = ANY(:owners)
+            GROUP BY m.id
+            ON CONFLICT (member_id) DO NOTHING
+        """), {"owners": owners})
+
+        # 消费明细 (和线上老数据一样从 detail 拆)
+        line_items.backfill(c)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+        c.exec_driver_sql("ANALYZE")
+    db.cache.clear()
+    print(f"✅ {shops} 家店 × {members} 会员, {transactions} 笔流水, 用时 {time.perf_counter() - t0:.1f}s")
+    return owners
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--shops", type=int, default=3)
+    ap.add_argument("--members", type=int, default=1000, help="每家店的会员数")
+    ap.add_argument("--transactions", type=int, default=20000, help="流水总笔数")
+    ap.add_argument("--sig-ratio", type=float, default=0.5, help="带签名的消费比例")
+    ap.add_argument("--days", type=int, default=365, help="流水分布在最近多少天")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--reset", action="store_true", help="先清空整个 public schema")
+    a = ap.parse_args()
+    seed(a.shops, a.members, a.transactions, a.sig_ratio, a.days, seed=a.seed, reset=a.reset)
@@ -0,0 +1,400 @@
+"""Streamlit 页面的多会话压测 (真的起一个 streamlit run, 本地库 + seed.py 合成数据)
+
+    export DATABASE_URL=postgresql+psycopg2://localhost/nail_bench
+    python seed.py --shops 3 --members 2000 --transactions 50000 --reset
+    python session_loadtest.py                              # 并发 1 2 4 8 逐级加, 每级 20 秒
+    python session_loadtest.py --levels 1 4 16 32 --duration 30 --customers 0.3
+    python session_loadtest.py --url http://127.0.0.1:8501   # 压已经在跑的实例 (只能看到库连接数)
+
+AppTest 每次重跑都会替换进程全局的 Runtime, 不能在一个进程里并发跑多个会话,
+所以这里另起一个 streamlit 进程, 每个模拟会话一条 websocket, 像浏览器前端一样:
+记住各控件的值、每次交互发一次重跑 (fragment 里的控件只重跑那个 fragment),
+收到 script_finished 算一次重跑结束; 页面渲染出来的控件按标签找 (和 AppTest 一样)。
+- 店员: 登录表单 (check_login → auth.authenticate) 登录一次, 然后循环
+  消费结账 搜索 → 选项目 → 改价 → 确认扣款, 会员充值 搜索 → 充值 (每轮结账 20 再充 20);
+- 顾客: 切到自助查询, 填姓名 + 手机号查询, 循环。每个顾客会话带一个不同的
+  X-Forwarded-For, 和真实顾客一样各自一个限流桶 (另起的 streamlit 进程按前面有一层代理
+  启动, NAIL_TRUSTED_PROXIES=1; 用 --url 压已有实例时要它也这样配)。
+会员从 bench_shop_* 里余额够的随机抽。需要 websockets 包 (pip install websockets)。
+
+每级结束打印: 每秒重跑次数、重跑耗时 p50 / p99 (从发出请求到 script_finished, 含排队)、
+各步骤的 p50、出错次数、库连接数峰值 (pg_stat_activity 里本库的连接 / 其中正在执行的),
+每个会话大约占多少内存 (建好会话前后 streamlit 进程 RSS 之差 / 会话数)。
+重跑开始排队时, p99 会比 p50 涨得快得多, 每秒重跑次数不再随并发增加。
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from sqlalchemy import text
+
+import db
+import seed
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+TIMEOUT = 60
+SAMPLE_INTERVAL = 0.05
+WIDGET_TYPES = ("text_input", "number_input", "multiselect", "selectbox", "radio", "button")
+
+
+def _sample(n=300):
+    with db.get_engine().connect() as c:
+        rows = c.execute(text("""
+            SELECT m.owner_username, m.name, m.phone FROM members m JOIN accounts a ON a.member_id = m.id
+            WHERE m.owner_username LIKE 'bench_shop_%' AND a.balance >= 100
+            ORDER BY random() LIMIT :n
+        """), {"n": n}).all()
+    if not rows:
+        sys.exit("❌ 没有测试数据, 先运行 python seed.py")
+    return rows
+
+
+# --- 1. 模拟浏览器 ---
+class Browser:
+    """一个浏览器标签页: 一条 websocket 会话, 控件的值存在这边, 每次重跑整体发过去"""
+
+    def __init__(self, url, headers=None):
+        from websockets.sync.client import connect
+        parts = urlsplit(url)
+        # 连接要一直开着 (会话的 session_state 跟着连接走), 不用 with; 新版 websockets 要求先 __enter__
+        self.ws = connect(f"ws://{parts.netloc}/_stcore/stream", subprotocols=["streamlit"],
+                          additional_headers=headers or {}, open_timeout=TIMEOUT, max_size=None).__enter__()
+        self.states = {}         # 控件 id -> 最近一次的 WidgetState
+        self.pending = {}        # 表单 id -> {控件 id: WidgetState}, 点提交时才发
+        self.widgets = []        # 当前页面上的控件 [(fragment_id, 类型, proto)]
+        self.alerts = []         # 本次重跑的 error / exception
+        self.pages = {}          # 页面标题 -> page_script_hash
+        self.page_hash = ""
+
+    def close(self):
+        self.ws.close()
+
+    def rerun(self, triggers=(), fragment_id=""):
+        """发一次重跑, 等到 script_finished; 返回是否成功 (没有报错)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        msg = BackMsg()
+        cs = msg.rerun_script
+        cs.page_script_hash = self.page_hash
+        cs.fragment_id = fragment_id
+        cs.widget_states.widgets.extend([*self.states.values(), *triggers])
+        self.ws.send(msg.SerializeToString())
+        return self._receive(fragment_id)
+
+    def _receive(self, fragment_id):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        if fragment_id:
+            self.widgets = [w for w in self.widgets if w[0] != fragment_id]
+        else:
+            self.widgets = []
+        self.alerts = []
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(self.ws.recv(timeout=TIMEOUT))
+            kind = fm.WhichOneof("type")
+            if kind == "new_session":
+                # 整页重跑开始 (包括脚本里 st.rerun() 触发的那次); fragment 重跑也会发, 但页面其余部分不动
+                if not fm.new_session.fragment_ids_this_run:
+                    self.widgets, self.alerts = [], []
+                self._pages(fm.new_session.app_pages)
+            elif kind == "navigation":
+                self._pages(fm.navigation.app_pages)
+                self.page_hash = fm.navigation.page_script_hash or self.page_hash
+            elif kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                el = fm.delta.new_element
+                ty = el.WhichOneof("type")
+                if ty in WIDGET_TYPES:
+                    self.widgets.append((fm.delta.fragment_id, ty, getattr(el, ty)))
+                elif ty == "exception" or (ty == "alert" and el.alert.format == el.alert.ERROR):
+                    self.alerts.append(ty)
+            elif kind == "script_finished":
+                if fm.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        live = {p.id for _, _, p in self.widgets}
+        self.states = {k: v for k, v in self.states.items() if k in live}
+        return "exception" not in self.alerts
+
+    def _pages(self, app_pages):
+        for p in app_pages:
+            self.pages[p.page_name] = p.page_script_hash
+
+    def switch_page(self, name):
+        self.page_hash = self.pages[name]
+        self.states = {}
+        return self.rerun()
+
+    # 和前端一样: 普通控件改了马上重跑, 表单里的控件等点提交
+    def find(self, kind, label):
+        for fragment_id, ty, proto in self.widgets:
+            if ty == kind and proto.label == label:
+                return fragment_id, proto
+        raise LookupError(f"页面上没有 {kind} {label!r}")
+
+    def _set(self, kind, label, fill):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        fragment_id, proto = self.find(kind, label)
+        ws = WidgetState(id=proto.id)
+        fill(ws, proto)
+        if proto.form_id:
+            self.pending.setdefault(proto.form_id, {})[proto.id] = ws
+            return True
+        self.states[proto.id] = ws
+        return self.rerun(fragment_id=fragment_id)
+
+    def input(self, label, value):
+        def fill(ws, proto):
+            ws.string_value = value
+        return self._set("text_input", label, fill)
+
+    def number(self, label, value):
+        def fill(ws, proto):
+            if proto.data_type == proto.INT:
+                ws.int_value = int(value)
+            else:
+                ws.double_value = float(value)
+        return self._set("number_input", label, fill)
+
+    def multiselect(self, label, values):
+        def fill(ws, proto):
+            ws.string_array_value.data[:] = values
+        return self._set("multiselect", label, fill)
+
+    def radio(self, label, value):
+        def fill(ws, proto):
+            ws.string_value = value
+        return self._set("radio", label, fill)
+
+    def click(self, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        fragment_id, proto = self.find("button", label)
+        if proto.is_form_submitter:
+            self.states.update(self.pending.pop(proto.form_id, {}))
+        return self.rerun([WidgetState(id=proto.id, trigger_value=True)], fragment_id)
+
+    def options(self, kind, label):
+        return list(self.find(kind, label)[1].options)
+
+
+# --- 2. 会话脚本 ---
+class Session:
+    """一个模拟会话; 每次重跑的耗时记到 out 里"""
+
+    def __init__(self, url, rng, members, password, out, headers=None):
+        self.url, self.rng, self.members, self.password, self.out = url, rng, members, password, out
+        self.browser = Browser(url, headers)
+        self.errors = 0
+
+    def step(self, name, action, *args):
+        t0 = time.perf_counter()
+        ok = action(*args)
+        self.out.append((name, (time.perf_counter() - t0) * 1000))
+        if not ok:
+            self.errors += 1
+
+
+class Cashier(Session):
+    def start(self):
+        b = self.browser
+        self.owner = self.rng.choice(self.members).owner_username
+        self.mine = [m for m in self.members if m.owner_username == self.owner]
+        self.step("打开页面", b.rerun)
+        b.input("商家账号", self.owner)
+        b.input("密码", self.password)
+        self.step("登录", b.click, "登录")
+        return "消费结账" in b.pages
+
+    def loop(self):
+        b = self.browser
+        m = self.rng.choice(self.mine)
+        self.step("打开结账页", b.switch_page, "消费结账")
+        self.step("结账-搜索", b.input, "搜索会员 (姓名 / 手机全号 / 尾号4位)", m.phone)
+        cat = self.rng.choice(b.options("multiselect", "服务大类"))
+        self.step("结账-选大类", b.multiselect, "服务大类", [cat])
+        item_label = f"{cat} - 内容"
+        self.step("结账-选项目", b.multiselect, item_label, [self.rng.choice(b.options("multiselect", item_label))])
+        self.step("结账-改价", b.number, "订单原价 (按标价自动合计, 可修改)", 20.0)
+        self.step("结账-扣款", b.click, "✅ 确认扣款")
+
+        self.step("打开充值页", b.switch_page, "会员充值")
+        self.step("充值-搜索", b.input, "🔍 输入手机号/姓名/尾号 (回车确认)", m.phone)
+        b.number("充值金额", 20.0)
+        self.step("充值-确认", b.click, "确认充值")
+
+
+class Customer(Session):
+    def start(self):
+        b = self.browser
+        self.step("打开页面", b.rerun)
+        self.step("切到顾客", b.radio, "请选择您的身份", "我是顾客 (自助查询)")
+        return True
+
+    def loop(self):
+        b = self.browser
+        m = self.rng.choice(self.members)
+        b.input("您的姓名", m.name)
+        b.input("您的手机号", m.phone)
+        self.step("顾客查询", b.click, "🔍 立即查询")
+
+
+def _drive(session, deadline, ready):
+    try:
+        ok = session.start()
+    except (LookupError, TimeoutError, OSError):
+        ok = False
+    finally:
+        ready.release()
+    if not ok:
+        session.errors += 1
+        return
+    while time.perf_counter() < deadline:
+        try:
+            session.loop()
+        except LookupError:
+            # 页面没按预期渲染 (比如上一步报错了), 这一轮作废
+            session.errors += 1
+        except (TimeoutError, OSError):
+            session.errors += 1
+            return
+
+
+# --- 3. 逐级加压 ---
+def _warm_up(url, members, password):
+    """店员、顾客先各走一遍 (导入页面模块、加载会员索引 / 价目表), 不计入结果"""
+    for s in (Cashier(url, random.Random(0), members, password, []),
+              Customer(url, random.Random(0), members, password, [], {"X-Forwarded-For": "10.255.0.1"})):
+        if s.start():
+            s.loop()
+        s.browser.close()
+
+
+def _rss_kib(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _watch_db(stop, peak):
+    """库连接数峰值 [全部, 正在执行]; 不算自己这一条"""
+    with db.get_engine().connect() as c:
+        while not stop.wait(SAMPLE_INTERVAL):
+            total, active = c.execute(text("""
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE state <> 'idle')
+                FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+            """)).one()
+            c.rollback()
+            peak[0], peak[1] = max(peak[0], total), max(peak[1], active)
+
+
+def run_level(url, pid, n, members, password, duration, customer_ratio, rng, level_no):
+    n_customers = round(n * customer_ratio) if n > 1 else 0
+    rss_before = _rss_kib(pid) if pid else None
+    out, peak, stop = [], [0, 0], threading.Event()
+    watcher = threading.Thread(target=_watch_db, args=(stop, peak), daemon=True)
+    watcher.start()
+
+    sessions = []
+    for i in range(n):
+        sub = random.Random(rng.random())
+        if i < n_customers:
+            headers = {"X-Forwarded-For": f"10.{level_no}.{i // 250}.{i % 250 + 1}"}
+            sessions.append(Customer(url, sub, members, password, out, headers))
+        else:
+            sessions.append(Cashier(url, sub, members, password, out))
+    ready = threading.Semaphore(0)
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_drive, args=(s, deadline, ready), daemon=True) for s in sessions]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for _ in threads:
+        ready.acquire()
+    # 会话都建好、登录完以后的内存增量 (会话断开前 session_state 一直在)
+    per_session = (_rss_kib(pid) - rss_before) / n if pid else None
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    stop.set()
+    watcher.join()
+    for s in sessions:
+        s.browser.close()
+
+    lat = np.array([ms for _, ms in out]) if out else np.zeros(1)
+    steps = {}
+    for step, ms in out:
+        steps.setdefault(step, []).append(ms)
+    return {
+        "sessions": n, "customers": n_customers, "reruns": len(out),
+        "errors": sum(s.errors for s in sessions),
+        "reruns_per_s": len(out) / wall,
+        "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99)),
+        "db_conn_peak": peak[0], "db_active_peak": peak[1], "session_kib": per_session,
+        "steps": {k: float(np.percentile(v, 50)) for k, v in steps.items()},
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_app():
+    """另起一个 streamlit 进程 (和线上一样的单进程), 等它能连上"""
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+                             "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+                            cwd=os.path.dirname(APP), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            env={**os.environ, "NAIL_TRUSTED_PROXIES": "1"})
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit("❌ streamlit 没有启动")
+
+
+def run(url=None, levels=(1, 2, 4, 8), duration=20.0, customer_ratio=0.25, password="bench", seed_value=7):
+    seed.check_local()
+    rng = random.Random(seed_value)
+    members = _sample()
+    proc = None
+    if url is None:
+        proc, url = _start_app()
+    try:
+        _warm_up(url, members, password)
+        print(f"连接池: {db.POOL_OPTIONS['pool_size']} 常驻 + {db.POOL_OPTIONS['max_overflow']} 溢出")
+        print(f"{'会话':>4} {'顾客':>4} {'重跑/秒':>8} {'p50':>8} {'p99':>8} {'出错':>5} "
+              f"{'库连接':>6} {'执行中':>6} {'每会话内存':>10}")
+        results = []
+        for i, n in enumerate(levels):
+            r = run_level(url, proc.pid if proc else None, n, members, password, duration, customer_ratio, rng, i)
+            results.append(r)
+            mem = f"{r['session_kib']:>7.0f} KiB" if r["session_kib"] is not None else f"{'-':>10}"
+            print(f"{r['sessions']:>4} {r['customers']:>4} {r['reruns_per_s']:>8.1f} {r['p50_ms']:>8.1f} "
+                  f"{r['p99_ms']:>8.1f} {r['errors']:>5} {r['db_conn_peak']:>6} {r['db_active_peak']:>6} {mem}")
+            print("     " + "  ".join(f"{k} {v:.0f}" for k, v in r["steps"].items()))
+        return results
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="压已经在跑的实例; 不填就另起一个 streamlit 进程")
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8], help="逐级的并发会话数")
+    ap.add_argument("--duration", type=float, default=20.0, help="每级压多少秒")
+    ap.add_argument("--customers", type=float, default=0.25, help="顾客会话占的比例")
+    ap.add_argument("--password", default="bench", help="bench_shop_* 的密码")
+    a = ap.parse_args()
+    run(a.url, a.levels, a.duration, a.customers, a.password)
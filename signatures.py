@@ -0,0 +1,370 @@
+"""顾客签名: 笔画矢量编码、按内容哈希去重存放、按需渲染
+
+签名不再放在 transactions 行里, 流水只记 signature_hash;
+内容在 signature_blobs 表, 账目查询展开某一笔时才去取。
+
+结账页直接用画布的 json_data (Fabric.js 的 path 对象) 取笔画坐标, 抽稀后按
+差分 + 变长整数编码存进 strokes 列, 一个签名几百字节; 显示时再渲染成 PNG / SVG。
+老版本存的是整张画布的 PNG (png / thumb 列), 可以离线转成笔画:
+
+    python signatures.py convert        # 转换成功的存上笔画 (显示用), 原图一律保留
+
+转换后的行哈希不变, 仍是原图的 sha256: 流水的 signature_hash 在哈希链 (audit.py)
+和归档文件里, 不能改; 原图留着, 哈希始终对得上存的内容, 笔迹认错了也能找回。
+"""
+import functools
+import hashlib
+import sys
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+from sqlalchemy import text
+
+import db
+import instrument
+
+THUMB_WIDTH = 200
+# 签名内容不会变 (按哈希寻址), 缓存可以放很久
+BLOB_TTL = 24 * 3600
+
+# 结账页画布尺寸和笔宽
+CANVAS_WIDTH = 600
+CANVAS_HEIGHT = 150
+STROKE_WIDTH = 2
+
+STROKES_MAGIC = b"SG1"
+PNG_MAGIC = b"\x89PNG"
+# 抽稀容差 (像素): 去掉的点离保留下来的折线都不超过这个距离
+SIMPLIFY_EPS = 0.8
+# PNG 转笔画后, 原图笔迹至少要有这么多被重新渲染的笔画盖住, 否则保留原图
+MIN_COVERAGE = 0.95
+
+
+# --- 1. 编码 / 解码 ---
+def _put_varint(out, n):
+    """非负整数 -> LEB128 (每字节 7 位, 最高位表示后面还有)"""
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+
+def encode_strokes(strokes, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, stroke_width=STROKE_WIDTH):
+    """[[(x, y), ...], ...] (整数像素) -> 字节。
+    格式: 魔数 | 宽 高 笔宽 笔画数 | 每笔: 点数, 各点相对上一个点的 (dx, dy);
+    数字都是变长整数, 差分先做 zigzag; 每笔第一个点相对上一笔的最后一个点"""
+    out = bytearray(STROKES_MAGIC)
+    for n in (width, height, stroke_width, len(strokes)):
+        _put_varint(out, n)
+    px = py = 0
+    for points in strokes:
+        _put_varint(out, len(points))
+        for x, y in points:
+            _put_varint(out, _zigzag(x - px))
+            _put_varint(out, _zigzag(y - py))
+            px, py = x, y
+    return bytes(out)
+
+
+def decode_strokes(data):
+    """encode_strokes 的逆操作 -> (宽, 高, 笔宽, 笔画列表)"""
+    if not data.startswith(STROKES_MAGIC):
+        raise ValueError("不是笔画格式的签名")
+    pos = len(STROKES_MAGIC)
+    header = []
+    for _ in range(4):
+        n, pos = _get_varint(data, pos)
+        header.append(n)
+    width, height, stroke_width, count = header
+    strokes, px, py = [], 0, 0
+    for _ in range(count):
+        n, pos = _get_varint(data, pos)
+        points = []
+        for _ in range(n):
+            dx, pos = _get_varint(data, pos)
+            dy, pos = _get_varint(data, pos)
+            px, py = px + _unzigzag(dx), py + _unzigzag(dy)
+            points.append((px, py))
+        strokes.append(points)
+    return width, height, stroke_width, strokes
+
+
+def _simplify(points, eps=SIMPLIFY_EPS):
+    """Ramer-Douglas-Peucker 抽稀 (用栈代替递归)"""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        i, j = stack.pop()
+        (x1, y1), (x2, y2) = points[i], points[j]
+        dx, dy = x2 - x1, y2 - y1
+        norm = (dx * dx + dy * dy) ** 0.5
+        far, far_d = None, eps
+        for k in range(i + 1, j):
+            x, y = points[k]
+            d = abs(dy * (x - x1) - dx * (y - y1)) / norm if norm else ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+            if d > far_d:
+                far, far_d = k, d
+        if far is not None:
+            keep[far] = True
+            stack += [(i, far), (far, j)]
+    return [p for p, k in zip(points, keep) if k]
+
+
+def strokes_from_json(json_data):
+    """画布 json_data -> (笔画列表, 笔宽)。只认自由画笔的 path 对象,
+    每条命令 (M / Q / L) 取终点, 取整去重后抽稀"""
+    strokes, width = [], STROKE_WIDTH
+    for obj in (json_data or {}).get("objects") or []:
+        if obj.get("type") != "path":
+            continue
+        width = max(1, round(obj.get("strokeWidth") or STROKE_WIDTH))
+        points = []
+        for cmd in obj.get("path") or []:
+            if len(cmd) < 3:
+                continue
+            p = (round(cmd[-2]), round(cmd[-1]))
+            if not points or points[-1] != p:
+                points.append(p)
+        if points:
+            strokes.append(_simplify(points))
+    return strokes, width
+
+
+@instrument.timed("process_signature")
+def process_signature(json_data, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+    """画布 json_data -> 笔画字节; 没签 (没有笔画) 返回 None"""
+    strokes, stroke_width = strokes_from_json(json_data)
+    if not strokes:
+        return None
+    return encode_strokes(strokes, width, height, stroke_width)
+
+
+def is_strokes(data):
+    return bytes(data[:len(STROKES_MAGIC)]) == STROKES_MAGIC
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# --- 2. 显示 ---
+@functools.lru_cache(maxsize=256)
+def render_png(data, width=None):
+    """笔画 -> 白底灰度 PNG; width 给了就缩到这个宽 (先按原尺寸画再缩, 边缘平滑些)"""
+    w, h, stroke_width, strokes = decode_strokes(data)
+    img = Image.new("L", (w, h), 255)
+    draw = ImageDraw.Draw(img)
+    r = stroke_width / 2
+    for points in strokes:
+        if len(points) > 1:
+            draw.line(points, fill=0, width=stroke_width, joint="curve")
+        # 两端补圆头, 只有一个点的笔画就是一个点
+        for x, y in (points[0], points[-1]):
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=0)
+    if width and width < w:
+        img = img.resize((width, max(1, h * width // w)), Image.LANCZOS)
+    out = BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def to_svg(data):
+    """笔画 -> SVG 文本 (每笔一条折线, 圆头圆角)"""
+    w, h, stroke_width, strokes = decode_strokes(data)
+    d = " ".join("M" + " L".join(f"{x} {y}" for x, y in points) + (" l0 0" if len(points) == 1 else "")
+                 for points in strokes)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">'
+            f'<path d="{d}" fill="none" stroke="black" stroke-width="{stroke_width}" '
+            f'stroke-linecap="round" stroke-linejoin="round"/></svg>')
+
+
+def make_thumbnail(png):
+    """(老格式) 缩到 THUMB_WIDTH 宽, 转成 16 色调色板 PNG (签名只有笔迹和背景, 足够了)"""
+    img = Image.open(BytesIO(png)).convert("RGBA")
+    if img.width > THUMB_WIDTH:
+        img = img.resize((THUMB_WIDTH, max(1, img.height * THUMB_WIDTH // img.width)))
+    # 透明背景铺白, 方便调色板压缩
+    bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
+    bg.alpha_composite(img)
+    small = bg.convert("RGB").quantize(colors=16)
+    out = BytesIO()
+    small.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def blob_params(sig):
+    """结账语句里写签名要用的参数; 没签名时全为 None。
+    升级前记在本地日志里的签名还是 PNG, 照老格式存 (原图 + 缩略图)"""
+    if not sig:
+        return {"sig_hash": None, "sig_strokes": None, "sig_png": None, "sig_thumb": None}
+    if sig.startswith(PNG_MAGIC):
+        return {"sig_hash": content_hash(sig), "sig_strokes": None, "sig_png": sig, "sig_thumb": make_thumbnail(sig)}
+    return {"sig_hash": content_hash(sig), "sig_strokes": sig, "sig_png": None, "sig_thumb": None}
+
+
+def load_signature(sig_hash, full=False):
+    """按哈希取签名 PNG (默认缩略图宽); 笔画格式的现场渲染, 老数据没有缩略图时退回原图"""
+    col = "png" if full else "COALESCE(thumb, png)"
+    df = db.run_query(f"SELECT COALESCE(strokes, {col}) AS data FROM signature_blobs WHERE hash = :h",
+                      {"h": sig_hash}, ttl=BLOB_TTL)
+    if df.empty:
+        return None
+    data = bytes(df.iloc[0]["data"])
+    if is_strokes(data):
+        return render_png(data, None if full else THUMB_WIDTH)
+    return data
+
+
+# --- 3. 历史数据 ---
+def backfill_thumbnails(c, batch=200):
+    """给还没有缩略图的 PNG 签名补上 (迁移历史数据时调用)"""
+    while True:
+        rows = c.execute(text("""
+            SELECT hash, png FROM signature_blobs
+            WHERE thumb IS NULL AND png IS NOT NULL AND strokes IS NULL
+            LIMIT :n
+        """), {"n": batch}).all()
+        if not rows:
+            return
+        for h, png in rows:
+            try:
+                thumb = make_thumbnail(bytes(png))
+            except Exception:
+                # 坏图就用原图顶上, 避免反复处理
+                thumb = bytes(png)
+            c.execute(text("UPDATE signature_blobs SET thumb = :t WHERE hash = :h"), {"t": thumb, "h": h})
+
+
+def _thin(mask):
+    """Zhang-Suen 细化: 笔迹二值图 -> 一像素宽的骨架"""
+    img = np.pad(mask.astype(np.uint8), 1)
+    while True:
+        changed = False
+        for step in (0, 1):
+            p = img
+            # 八邻域 P2..P9 (从正上方顺时针)
+            n = [p[:-2, 1:-1], p[:-2, 2:], p[1:-1, 2:], p[2:, 2:], p[2:, 1:-1], p[2:, :-2], p[1:-1, :-2], p[:-2, :-2]]
+            b = sum(n)
+            a = sum((n[i] == 0) & (n[(i + 1) % 8] == 1) for i in range(8))
+            if step == 0:
+                c1, c2 = n[0] * n[2] * n[4], n[2] * n[4] * n[6]
+            else:
+                c1, c2 = n[0] * n[2] * n[6], n[0] * n[4] * n[6]
+            drop = (p[1:-1, 1:-1] == 1) & (b >= 2) & (b <= 6) & (a == 1) & (c1 == 0) & (c2 == 0)
+            if drop.any():
+                img[1:-1, 1:-1][drop] = 0
+                changed = True
+        if not changed:
+            return img[1:-1, 1:-1].astype(bool)
+
+
+# 先走上下左右, 再走斜角, 免得阶梯状的拐角漏掉像素
+_STEPS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _trace(skeleton):
+    """骨架像素 -> 笔画 (先从端点出发, 剩下的是闭合的圈); 坐标是 (x, y)"""
+    left = {(int(x), int(y)) for y, x in zip(*np.nonzero(skeleton))}
+    pending = set(left)
+
+    def neighbours(p):
+        return [(p[0] + dx, p[1] + dy) for dx, dy in _STEPS if (p[0] + dx, p[1] + dy) in left]
+
+    ends = sorted(p for p in left if len(neighbours(p)) == 1)
+    strokes = []
+    for start in [*ends, *sorted(left)]:
+        if start not in pending:
+            continue
+        points, p = [start], start
+        pending.discard(start)
+        while True:
+            nxt = [q for q in neighbours(p) if q in pending]
+            if not nxt:
+                # 走到岔路口已画过的那一侧, 接上最后一个像素免得断开
+                joined = [q for q in neighbours(p) if len(points) < 2 or q != points[-2]]
+                if joined and len(points) > 1:
+                    points.append(joined[0])
+                break
+            p = nxt[0]
+            pending.discard(p)
+            points.append(p)
+        strokes.append(points)
+    return strokes
+
+
+def png_to_strokes(png):
+    """老的整张画布 PNG -> 笔画字节; 认不出笔迹或者转出来对不上原图返回 None"""
+    rgba = np.asarray(Image.open(BytesIO(png)).convert("RGBA"))
+    # 笔迹: 不透明且偏暗 (老画布是透明或 #EEE 底)
+    ink = (rgba[:, :, 3] > 127) & (rgba[:, :, :3].mean(axis=2) < 128)
+    if not ink.any():
+        return None
+    skeleton = _thin(ink)
+    stroke_width = max(1, round(ink.sum() / skeleton.sum()))
+    h, w = ink.shape
+    data = encode_strokes([_simplify(s) for s in _trace(skeleton)], w, h, stroke_width)
+
+    drawn = np.asarray(Image.open(BytesIO(render_png(data)))) < 128
+    near = np.pad(drawn, 1)
+    near = np.logical_or.reduce([near[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx] for dx, dy in [(0, 0), *_STEPS]])
+    if (ink & near).sum() < MIN_COVERAGE * ink.sum():
+        return None
+    return data
+
+
+def convert_pngs(c, batch=200):
+    """给存成 PNG 的签名加上笔画 (显示改用笔画, 原图保留, 缩略图不再需要);
+    返回 (转换数, 认不出笔迹的个数)"""
+    after, converted, kept = "", 0, 0
+    while True:
+        rows = c.execute(text("""
+            SELECT hash, png FROM signature_blobs
+            WHERE strokes IS NULL AND png IS NOT NULL AND hash > :after
+            ORDER BY hash LIMIT :n
+        """), {"after": after, "n": batch}).all()
+        if not rows:
+            return converted, kept
+        for h, png in rows:
+            try:
+                data = png_to_strokes(bytes(png))
+            except Exception:
+                data = None
+            if data is None:
+                kept += 1
+                continue
+            c.execute(text("UPDATE signature_blobs SET strokes = :s, thumb = NULL WHERE hash = :h"),
+                      {"s": data, "h": h})
+            converted += 1
+        after = rows[-1].hash
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["convert"]:
+        print(__doc__)
+        sys.exit(1)
+    with db.unit_of_work("convert_signatures", tables=("signature_blobs",)) as c:
+        converted, kept = convert_pngs(c)
+    print(f"✅ 已给 {converted} 个签名加上笔画, {kept} 个认不出笔迹只有原图")
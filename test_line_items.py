@@ -0,0 +1,23 @@
+"""line_items.parse_detail: 老流水 detail 字符串拆成 (大类, 项目)
+
+    python -m pytest test_line_items.py
+"""
+from line_items import parse_detail
+
+
+def test_single_category():
+    assert parse_detail("手部(卸甲,延长)") == [("手部", "卸甲"), ("手部", "延长")]
+
+
+def test_several_categories_and_note():
+    assert parse_detail("手部(卸甲) + 足部(单色) + 备注[朋友介绍(新客)]") == [("手部", "卸甲"), ("足部", "单色")]
+
+
+def test_category_with_space():
+    assert parse_detail("手部(卸甲) + Gel Nails(法式, 跳色)") == [
+        ("手部", "卸甲"), ("Gel Nails", "法式"), ("Gel Nails", "跳色")]
+
+
+def test_empty():
+    assert parse_detail(None) == []
+    assert parse_detail("备注[只聊天]") == []
@@ -0,0 +1,67 @@
+"""各页面共用的界面辅助 (页面脚本在 app_pages/ 下, 入口是 streamlit_app.py)"""
+from io import BytesIO
+
+import pandas as pd
+import streamlit as st
+
+import db
+import instrument
+import search_index
+
+
+def current_user():
+    return st.session_state.current_user
+
+
+@st.cache_resource(show_spinner=False)
+@instrument.timed("qr_code")
+def make_qr_png(url):
+    """店铺二维码 PNG; 进程里每个网址只生成一次"""
+    import qrcode
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    # --- 关键修复：把图片转成 Streamlit 能看懂的格式 (PNG流) ---
+    img_buffer = BytesIO()
+    img.save(img_buffer, format="PNG")
+    return img_buffer.getvalue()
+
+
+def pick_member(search_term, key, hold=False):
+    """内存索引搜会员; 多人匹配时让店员从排好序的结果里选, 没找到返回 None。
+    hold=True 时查到的会员存在 session_state 里, 搜索词不变、这家店也没有
+    新的写入 (db.cache.generation) 就不再查库"""
+    owner = current_user()
+    gen = db.cache.generation(owner)
+    found = st.session_state.get(f"{key}_found") if hold else None
+    if found is not None and found[:2] == (search_term, gen):
+        df = found[2]
+    else:
+        df = db.members_by_ids(owner, search_index.search(owner, search_term))
+        if hold:
+            st.session_state[f"{key}_found"] = (search_term, gen, df)
+    if df.empty:
+        return None
+    if len(df) == 1:
+        return df.iloc[0]
+    pos = st.selectbox(f"找到 {len(df)} 位会员，请选择", range(len(df)), key=key,
+                       format_func=lambda i: f"{df.iloc[i]['name']} ({df.iloc[i]['phone']})")
+    return df.iloc[pos]
+
+
+def forget_member(key):
+    st.session_state.pop(f"{key}_found", None)
+
+
+def show_diagnostics():
+    """结束本次重跑的埋点, 在侧边栏显示耗时明细 (只在打开性能诊断时有内容)"""
+    rerun = st.session_state.pop("_diag_rerun", None)
+    if rerun is None:
+        return
+    instrument.finish_rerun(rerun)
+    with st.sidebar.expander("🩺 本次重跑耗时", expanded=True):
+        st.caption(f"页面: {rerun.page or '-'} · 总耗时 {rerun.wall_ms:.0f} ms")
+        st.dataframe(pd.DataFrame(instrument.summarize(rerun.calls)), hide_index=True, use_container_width=True)
+        st.caption("各页面平均")
+        st.dataframe(pd.DataFrame(instrument.page_summary()), hide_index=True, use_container_width=True)
@@ -0,0 +1,86 @@
+"""页面展示前的数据整理 (不依赖 streamlit, benchmark.py 也直接调用)"""
+from datetime import datetime
+
+import pandas as pd
+
+TYPE_CN = {'RECHARGE': '充值收入', 'SPEND': '消费扣款', 'ADJUST': '余额调整'}
+TYPE_ICON = {'RECHARGE': '💰', 'SPEND': '💅', 'ADJUST': '⚖️'}
+
+# 经营趋势的范围 -> (天数, 按什么粒度画柱子, 横轴标签格式)
+TREND_RANGES = {
+    "近7天": (7, "D", "%m-%d"),
+    "近30天": (30, "D", "%m-%d"),
+    "近一季": (91, "W", "%m-%d"),
+    "近一年": (365, "M", "%Y-%m"),
+}
+
+
+def trend_frame(chart_df, days, freq="D", label_fmt="%m-%d"):
+    """每日汇总 -> 画图用的表: 补全没有数据的日期, 长范围按周/按月合并"""
+    chart_df = chart_df.copy()
+    chart_df['type_cn'] = chart_df['type'].map(TYPE_CN)
+    chart_df['day'] = pd.to_datetime(chart_df['day'])
+
+    # 1. 补全日期
+    all_days = pd.date_range(end=datetime.now().date(), periods=days, freq='D')
+    all_types = ['充值收入', '消费扣款']
+    full_index = pd.MultiIndex.from_product([all_days, all_types], names=['day', 'type_cn'])
+    pivot = chart_df.set_index(['day', 'type_cn'])['total'].astype(float).reindex(full_index, fill_value=0).reset_index()
+
+    # 范围长的按周/按月合并 (每段取起始日)
+    if freq != "D":
+        pivot['day'] = pivot['day'].dt.to_period(freq).dt.start_time
+        pivot = pivot.groupby(['day', 'type_cn'], as_index=False)['total'].sum()
+
+    # 2. 【关键修改】新增一列纯字符串格式的日期 (例如 "11-20")
+    # 这样做是为了欺骗图表，让它把日期当成普通的"分类"，从而能正确地左右并排
+    pivot['day_str'] = pivot['day'].dt.strftime(label_fmt)
+    return pivot
+
+
+def member_table(df):
+    """会员管理的多人列表"""
+    display_df = df[['name', 'phone', 'balance', 'note', 'created_at']].copy()
+    display_df.columns = ['姓名', '手机号', '余额', '备注', '注册时间']
+    display_df['余额'] = '¥' + display_df['余额'].fillna(0).astype(str)
+    display_df['注册时间'] = pd.to_datetime(display_df['注册时间']).dt.strftime('%Y-%m-%d')
+    return display_df
+
+
+def directory_table(df):
+    """会员名录的一页 (member_stats.directory); 金额保持数字, 页面上按列设置格式"""
+    display_df = df[['name', 'phone', 'balance', 'visits', 'last_visit', 'total_spend',
+                     'total_recharge', 'created_at']].copy()
+    display_df.columns = ['姓名', '手机号', '余额', '到店次数', '最近到店', '累计消费', '累计充值', '注册时间']
+    for col in ['余额', '累计消费', '累计充值']:
+        display_df[col] = display_df[col].astype(float)
+    display_df['最近到店'] = pd.to_datetime(display_df['最近到店']).dt.strftime('%Y-%m-%d').fillna('从未消费')
+    display_df['注册时间'] = pd.to_datetime(display_df['注册时间']).dt.strftime('%Y-%m-%d')
+    return display_df
+
+
+def customer_cards(df):
+    """把 db.customer_lookup 的结果按会员卡拆开: [(卡片那一行, 最近交易 DataFrame)]"""
+    cards = []
+    for _, rows in df.groupby("id", sort=False):
+        trans_df = rows[rows["tx_id"].notna()]
+        cards.append((rows.iloc[0], trans_df))
+    return cards
+
+
+def recent_table(trans_df):
+    """顾客自助查询里的最近交易; 过了哈希链校验的打 ✅"""
+    trans_display = trans_df[['date', 'type', 'amount', 'detail']].copy()
+    trans_display.columns = ['时间', '类型', '金额', '详情']
+    trans_display['时间'] = pd.to_datetime(trans_display['时间']).dt.strftime('%Y-%m-%d')
+    trans_display['校验'] = trans_df['verified'].map({True: "✅"}).fillna("")
+    return trans_display
+
+
+def item_table(df):
+    """账目查询里的服务项目排行"""
+    out = df.rename(columns={'category': '大类', 'item': '项目', 'cnt': '次数', 'revenue': '营收'})
+    out['营收'] = out['营收'].astype(float).round(2)
+    total = out['营收'].sum()
+    out['占比'] = (out['营收'] / total if total else 0.0)
+    return out